@@ -0,0 +1,204 @@
+'''
+Attendance rates across webinars, per person and per webinar, joined on the integer person and
+registrant ids.
+
+    python -m agni.analytics webinars
+    python -m agni.analytics persons --min-webinars 2 --order rate --limit 50 [--output persons.csv]
+    python -m agni.analytics person someone@example.com
+
+A registrant's classes are the classes of the webinar held since registering. Registrants known only
+from the Zoom registrant list have no attendance and are left out.
+'''
+import csv
+from argparse import ArgumentParser
+
+from agni.db import getConnection, closeConnection, iterFetchMany
+from agni.persons import getPersonId
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+# Classes held since registering and classes attended, per registrant. A registrant may show up in a
+# class held before the registration time Zoom reports, hence the MAX(). Being an aggregate, this is
+# not flattened into the queries below, which would evaluate the class count subquery over and over.
+REGISTRANT_ATTENDANCE = '''
+    SELECT
+        wr.id AS registrant_id,
+        wr.person_id AS person_id,
+        wr.webinar_id AS webinar_id,
+        MAX((
+            SELECT COUNT(*) FROM webinar_class wc
+            WHERE wc.webinar_id = wr.webinar_id
+            AND wc.internal_datetime >= COALESCE(wr.internal_registration_datetime, '')
+        ), COUNT(a.webinar_class_id)) AS classes,
+        COUNT(a.webinar_class_id) AS attended
+    FROM
+        webinar_registrant wr
+        LEFT OUTER JOIN
+        attendance a ON (a.registrant_id = wr.id AND a.attended = 'Yes')
+    WHERE %s
+    GROUP BY wr.id
+'''
+
+PERSON_ORDERS = {
+    'rate': 'rate ASC, p.email ASC',
+    'webinars': 'webinars DESC, p.email ASC',
+    'email': 'p.email ASC',
+}
+
+
+class AttendanceRate(object):
+    def __init__(self, classes, attended):
+        self.classes = classes
+        self.attended = attended
+
+    @property
+    def rate(self):
+        # None when no class was held since registering
+        if not self.classes:
+            return None
+        return float(self.attended) / self.classes
+
+
+class PersonAttendance(AttendanceRate):
+    def __init__(self, personId, email, webinars, classes, attended):
+        AttendanceRate.__init__(self, classes, attended)
+        self.personId = personId
+        self.email = email
+        self.webinars = webinars
+
+
+class WebinarAttendance(AttendanceRate):
+    def __init__(self, zoomWebinarId, topic, registrants, classes, attended):
+        AttendanceRate.__init__(self, classes, attended)
+        self.zoomWebinarId = zoomWebinarId
+        self.topic = topic
+        self.registrants = registrants
+
+
+def iterPersonAttendance(cnx, minWebinars=1, order='rate', limit=None, chunkSize=1000):
+    # PersonAttendance of every person registered for at least minWebinars webinars
+    pq = '''
+        SELECT
+            p.id,
+            p.email,
+            COUNT(*) AS webinars,
+            SUM(r.classes),
+            SUM(r.attended),
+            CAST(SUM(r.attended) AS REAL) / MAX(SUM(r.classes), 1) AS rate
+        FROM
+            (%s) r
+            INNER JOIN
+            person p ON (p.id = r.person_id)
+        GROUP BY p.id
+        HAVING COUNT(*) >= ?
+        ORDER BY %s
+        LIMIT ?
+    ''' % (REGISTRANT_ATTENDANCE % 'wr.person_id IS NOT NULL', PERSON_ORDERS[order])
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(pq, (minWebinars, -1 if limit is None else limit))
+        for row in iterFetchMany(cur, chunkSize):
+            yield PersonAttendance(*row[:5])
+    finally:
+        if cur:
+            cur.close()
+
+
+def getPersonWebinarAttendance(cnx, email):
+    # [WebinarAttendance] of one person, one per webinar registered for, or None for an unknown email
+    personId = getPersonId(cnx, email)
+    if personId is None:
+        return None
+    wq = '''
+        SELECT w.zoom_webinar_id, w.topic, 1, r.classes, r.attended
+        FROM
+            (%s) r
+            INNER JOIN
+            webinar w ON (w.id = r.webinar_id)
+        ORDER BY w.zoom_webinar_id ASC
+    ''' % (REGISTRANT_ATTENDANCE % 'wr.person_id = ?')
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(wq, (personId,))
+        return [WebinarAttendance(*row) for row in cur]
+    finally:
+        if cur:
+            cur.close()
+
+
+def getWebinarAttendance(cnx):
+    # [WebinarAttendance] of every webinar; classes and attended are summed over its registrants
+    wq = '''
+        SELECT w.zoom_webinar_id, w.topic, COUNT(*), SUM(r.classes), SUM(r.attended)
+        FROM
+            (%s) r
+            INNER JOIN
+            webinar w ON (w.id = r.webinar_id)
+        GROUP BY w.id
+        ORDER BY w.zoom_webinar_id ASC
+    ''' % (REGISTRANT_ATTENDANCE % '1 = 1')
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(wq)
+        return [WebinarAttendance(*row) for row in cur]
+    finally:
+        if cur:
+            cur.close()
+
+
+def formatRate(rate):
+    return '-' if rate is None else '%.1f%%' % (rate * 100)
+
+
+def printWebinarAttendance(rows):
+    print '%-14s %-40s %11s %8s %8s %7s' % ('webinar', 'topic', 'registrants', 'classes', 'attended', 'rate')
+    for r in rows:
+        print '%-14s %-40.40s %11s %8s %8s %7s' % (r.zoomWebinarId, r.topic, r.registrants, r.classes, r.attended,
+                                                   formatRate(r.rate))
+
+
+def main():
+    parser = ArgumentParser(description='Attendance rates across webinars')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('webinars', help='attendance rate of every webinar')
+    persons = commands.add_parser('persons', help='attendance rate of every person across webinars')
+    persons.add_argument('--min-webinars', type=int, default=1, help='only persons registered for this many')
+    persons.add_argument('--order', choices=sorted(PERSON_ORDERS), default='rate')
+    persons.add_argument('--limit', type=int, default=None)
+    persons.add_argument('--output', default=None, help='write the persons to this csv file instead')
+    person = commands.add_parser('person', help='attendance of one person in each webinar')
+    person.add_argument('email')
+    args = parser.parse_args()
+
+    cnx = getConnection()
+    try:
+        if args.command == 'webinars':
+            printWebinarAttendance(getWebinarAttendance(cnx))
+        elif args.command == 'person':
+            rows = getPersonWebinarAttendance(cnx, args.email)
+            if rows is None:
+                print 'No registrations found for %s' % args.email
+            else:
+                printWebinarAttendance(rows)
+        elif args.output:
+            count = 0
+            with open(args.output, 'wb') as fd:
+                w = csv.writer(fd)
+                w.writerow(['Email', 'Webinars', 'Classes', 'Attended', 'Rate'])
+                for r in iterPersonAttendance(cnx, args.min_webinars, args.order, args.limit):
+                    w.writerow([r.email, r.webinars, r.classes, r.attended, '' if r.rate is None else r.rate])
+                    count += 1
+            print '%s persons written to %s' % (count, args.output)
+        else:
+            print '%-40s %8s %8s %8s %7s' % ('email', 'webinars', 'classes', 'attended', 'rate')
+            for r in iterPersonAttendance(cnx, args.min_webinars, args.order, args.limit):
+                print '%-40s %8s %8s %8s %7s' % (r.email, r.webinars, r.classes, r.attended, formatRate(r.rate))
+    finally:
+        closeConnection()
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,3 @@
-import csv
 from datetime import datetime
 from genericpath import exists
 from os import makedirs
@@ -6,15 +5,27 @@ from os.path import join
 
 import requests
 
-from agni.db import getConnection
+from agni.attendance_summary import rebuildAttendanceSummary, getDefaulterEmails
+from agni.db import getConnection, transaction, iterFetchMany
+from agni.export_cache import getWebinarDataVersion, isExportCached, recordExport
+from agni.export_formats import ExportFileSet, parseExportFormats
+from agni.registrant_mirror import EXPORT_ATTENDED_EXPRESSION, getMirrorOnlyDefaulterEmails
 from utils.configuration import agni_configuration, getOutputDir
 from utils.logger import flushLogs, getAgniLogger
-from zoom.api import ZoomApi, ACTION_DENY, ACTION_CANCEL
-from zoom.attendance_importer import ZOOM_WEBINAR_DATETIME_FORMAT
+from utils.timing import span, timedWriter
+from zoom.api import ZoomApi, ACTION_DENY, ACTION_CANCEL, getFailedRegistrants
+from zoom.report_parser import ZOOM_WEBINAR_DATETIME_FORMAT
 
 _logger = getAgniLogger(__name__)
 
-def generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defaultersWriter, defaultDays=4):
+def generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defaultersWriter, defaultDays=4,
+                                      defaulterEmails=None, chunkSize=1000):
+    # defaulterEmails, when given, replaces the isDefaulter() check
+    if defaulterEmails is not None:
+        isDefaulterEmail = lambda email, attendedArray: email in defaulterEmails
+    else:
+        isDefaulterEmail = lambda email, attendedArray: isDefaulter(attendedArray, days=defaultDays)
+
     classDatesQuery = '''
         SELECT wc.original_datetime
         FROM
@@ -28,13 +39,13 @@ def generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defa
         SELECT
             wr.email,
             wc.original_datetime,
-            COALESCE(a.attended, 'NA') AS attended_after_registering
+            %s AS attended_after_registering
         FROM
             webinar w
             INNER JOIN
             webinar_class wc ON (w.id = wc.webinar_id)
 	        INNER JOIN
-	        webinar_registrant wr ON (wr.webinar_id = wc.webinar_id)
+	        export_registrant wr ON (wr.webinar_id = wc.webinar_id)
 	        LEFT OUTER JOIN
 	        attendance a ON (wr.id = a.registrant_id AND wc.id = a.webinar_class_id)
 	    WHERE
@@ -42,14 +53,15 @@ def generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defa
         ORDER BY
            wr.email ASC,
            wc.internal_datetime ASC
-    '''
+    ''' % EXPORT_ATTENDED_EXPRESSION
     count = 0
     defaultersCount = 0
     cur = None
     try:
         cur = cnx.cursor()
-        cur.execute(classDatesQuery, (zoomWebinarId,))
-        rows = cur.fetchall()
+        with span('export.query_class_dates'):
+            cur.execute(classDatesQuery, (zoomWebinarId,))
+            rows = cur.fetchall()
         if not rows:
             _logger.error('Unknown zoom webinar id: %s', zoomWebinarId)
             return
@@ -59,25 +71,28 @@ def generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defa
         defaultersWriter.writerow(['Email'])
         currEmail = None
         currAttendedArray = []
-        cur.execute(attendanceQuery, (zoomWebinarId,))
-        for row in cur:
-            email = row[0]
-            if email != currEmail:
-                if currEmail is not None:
-                    if isDefaulter(currAttendedArray, days=defaultDays):
-                        defaultersCount += 1
-                        defaultersWriter.writerow([currEmail])
-                    attendanceWriter.writerow([currEmail]+currAttendedArray)
-                    count += 1
-                currEmail = email
-                currAttendedArray = []
-            currAttendedArray.append(row[2])
-        if currEmail and currAttendedArray:
-            if isDefaulter(currAttendedArray, days=defaultDays):
-                defaultersCount += 1
-                defaultersWriter.writerow([currEmail])
-            attendanceWriter.writerow([currEmail]+currAttendedArray)
-            count += 1
+        with span('export.query_attendance'):
+            cur.execute(attendanceQuery, (zoomWebinarId,))
+        with span('export.pivot') as sp:
+            for row in iterFetchMany(cur, chunkSize):
+                email = row[0]
+                if email != currEmail:
+                    if currEmail is not None:
+                        if isDefaulterEmail(currEmail, currAttendedArray):
+                            defaultersCount += 1
+                            defaultersWriter.writerow([currEmail])
+                        attendanceWriter.writerow([currEmail]+currAttendedArray)
+                        count += 1
+                    currEmail = email
+                    currAttendedArray = []
+                currAttendedArray.append(row[2])
+            if currEmail and currAttendedArray:
+                if isDefaulterEmail(currEmail, currAttendedArray):
+                    defaultersCount += 1
+                    defaultersWriter.writerow([currEmail])
+                attendanceWriter.writerow([currEmail]+currAttendedArray)
+                count += 1
+            sp.addRows(count)
     finally:
         if cur:
             cur.close()
@@ -85,42 +100,216 @@ def generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defa
     _logger.info('Registrants: %s | Defaulters: %s', count, defaultersCount)
 
 
-def exportAttendanceFromDB(zoomWebinarId):
-    # dd = getDefaultDays(defaultDays=agni_configuration.getAgniAttendanceDefaultDays())
-    dd = agni_configuration.getAgniAttendanceDefaultDays()
-    _logger.info('Considering %s consecutive days absentee as defaulter. To change this edit the ini file', dd)
+def generateEmailWiseAttendanceFromSQL(cnx, zoomWebinarId, attendanceWriter, defaultersWriter, defaultDays=4,
+                                       chunkSize=1000):
+    # Same output as generateEmailWiseAttendanceFromDB, but SQLite builds one row per registrant.
+    # Sticks to group_concat() and scalar subqueries; window functions need SQLite 3.25.
+    classDatesQuery = '''
+        SELECT wc.original_datetime, w.id, wc.id
+        FROM
+            webinar w
+            INNER JOIN
+            webinar_class wc ON (wc.webinar_id = w.id)
+        WHERE w.zoom_webinar_id = ?
+        ORDER BY wc.internal_datetime ASC
+    '''
+    # The order of group_concat() is up to SQLite, so every cell is 'class id:attended' and is put in
+    # its column afterwards. The streak counts classes after the last one the registrant did not miss.
+    pivotQuery = '''
+        SELECT
+            c.email,
+            c.attended_csv,
+            (
+                SELECT COUNT(*) FROM webinar_class wc
+                WHERE wc.webinar_id = ? AND wc.internal_datetime > COALESCE(c.last_not_absent, '')
+            ) AS absence_streak
+        FROM (
+            SELECT
+                email,
+                group_concat(class_id || ':' || attended, ',') AS attended_csv,
+                MAX(CASE WHEN attended <> 'No' THEN internal_datetime END) AS last_not_absent
+            FROM (
+                SELECT
+                    wr.email AS email,
+                    wc.id AS class_id,
+                    wc.internal_datetime AS internal_datetime,
+                    %s AS attended
+                FROM
+                    export_registrant wr
+                    INNER JOIN
+                    webinar_class wc ON (wc.webinar_id = wr.webinar_id)
+                    LEFT OUTER JOIN
+                    attendance a ON (a.registrant_id = wr.id AND a.webinar_class_id = wc.id)
+                WHERE wr.webinar_id = ?
+            )
+            GROUP BY email
+        ) c
+        ORDER BY c.email ASC
+    ''' % EXPORT_ATTENDED_EXPRESSION
+    count = 0
+    defaultersCount = 0
+    cur = None
+    try:
+        cur = cnx.cursor()
+        with span('export.query_class_dates'):
+            cur.execute(classDatesQuery, (zoomWebinarId,))
+            rows = cur.fetchall()
+        if not rows:
+            _logger.error('Unknown zoom webinar id: %s', zoomWebinarId)
+            return
+        webinarId = rows[0][1]
+        classColumns = dict((str(r[2]), i) for i, r in enumerate(rows))
+        classDates = [datetime.strptime(r[0], ZOOM_WEBINAR_DATETIME_FORMAT).strftime(EXPORT_DATE_FORMAT) for r in rows]
+        # Like isDefaulter(), a window of 0 days covers every class
+        defaulterStreak = defaultDays if defaultDays > 0 else len(classDates)
+        attendanceWriter.writerow(['Email']+classDates)
+        defaultersWriter.writerow(['Email'])
+
+        with span('export.query_pivot'):
+            cur.execute(pivotQuery, (webinarId, webinarId))
+        # SQLite does most of the pivot while rows are being fetched
+        with span('export.pivot') as sp:
+            for email, attendedCsv, absenceStreak in iterFetchMany(cur, chunkSize):
+                if absenceStreak >= defaulterStreak:
+                    defaultersCount += 1
+                    defaultersWriter.writerow([email])
+                row = [email]+[None]*len(classColumns)
+                for cell in attendedCsv.split(','):
+                    classId, attended = cell.split(':')
+                    row[classColumns[classId]+1] = attended
+                attendanceWriter.writerow(row)
+                count += 1
+            sp.addRows(count)
+    finally:
+        if cur:
+            cur.close()
+
+    _logger.info('Registrants: %s | Defaulters: %s', count, defaultersCount)
 
-    attendanceReportFilePath = getOutputFilePath(zoomWebinarId)
-    defaultersReportFilePath = getDefaultersFilePath(zoomWebinarId)
 
-    conn = None
+def generateEmailWiseAttendanceFromSummary(cnx, zoomWebinarId, attendanceWriter, defaultersWriter, defaultDays=4,
+                                           chunkSize=1000):
+    # Defaulters come from one indexed scan of registrant_attendance_summary
+    webinarQuery = '''
+        SELECT
+            w.id,
+            w.summarized_through,
+            MAX(wc.internal_datetime),
+            COUNT(wc.id)
+        FROM
+            webinar w
+            INNER JOIN
+            webinar_class wc ON (wc.webinar_id = w.id)
+        WHERE w.zoom_webinar_id = ?
+        GROUP BY w.id
+    '''
+    cur = None
     try:
-        conn = getConnection()
+        cur = cnx.cursor()
+        cur.execute(webinarQuery, (zoomWebinarId,))
+        row = cur.fetchone()
+    finally:
+        if cur:
+            cur.close()
 
-        with open(attendanceReportFilePath, 'wb') as ofd, open(defaultersReportFilePath, 'wb') as dfd:
-            _logger.info('Writing attendance to %s', attendanceReportFilePath)
-            wrt = csv.writer(ofd)
+    if not row:
+        _logger.error('Unknown zoom webinar id: %s', zoomWebinarId)
+        return
+    webinarId, summarizedThrough, latestClassDatetime, numClasses = row
 
-            _logger.info('Writing defaulters to %s', defaultersReportFilePath)
-            dwrt = csv.writer(dfd)
+    if summarizedThrough != latestClassDatetime:
+        with span('export.summary_rebuild'), transaction(cnx):
+            rebuildAttendanceSummary(cnx, webinarId)
 
-            generateEmailWiseAttendanceFromDB(conn, zoomWebinarId, wrt, dwrt, defaultDays=dd)
-    finally:
-        if conn:
-            conn.close()
+    # Like isDefaulter(), a window of 0 days covers every class
+    defaulterStreak = defaultDays if defaultDays > 0 else numClasses
+    with span('export.query_defaulters') as sp:
+        defaulterEmails = frozenset(getDefaulterEmails(cnx, webinarId, defaulterStreak) +
+                                    getMirrorOnlyDefaulterEmails(cnx, webinarId, defaulterStreak))
+        sp.addRows(len(defaulterEmails))
+    generateEmailWiseAttendanceFromDB(cnx, zoomWebinarId, attendanceWriter, defaultersWriter,
+                                      defaultDays=defaultDays, defaulterEmails=defaulterEmails, chunkSize=chunkSize)
+
+
+def rebuildAllAttendanceSummaries():
+    conn = getConnection()
+    with transaction(conn):
+        rebuildAttendanceSummary(conn)
 
 
-def getOutputFilePath(zoomWebinarId):
+def exportAttendanceFromDB(zoomWebinarId, formats=None, useCache=True):
+    # dd = getDefaultDays(defaultDays=agni_configuration.getAgniAttendanceDefaultDays())
+    dd = agni_configuration.getAgniAttendanceDefaultDays()
+    _logger.info('Considering %s consecutive days absentee as defaulter. To change this edit the ini file', dd)
+
+    if formats is None:
+        formats = agni_configuration.getAgniExportFormats()
+    formats = parseExportFormats(formats)
+    chunkSize = agni_configuration.getAgniExportChunkSize()
+
+    conn = getConnection()
+
+    attendanceFiles = ExportFileSet(lambda ext: getOutputFilePath(zoomWebinarId, ext), formats, chunkSize)
+    defaultersFiles = ExportFileSet(lambda ext: getDefaultersFilePath(zoomWebinarId, ext), formats, chunkSize)
+    filePaths = attendanceFiles.getFilePaths() + defaultersFiles.getFilePaths()
+    exportFormats = ','.join(formats)
+
+    webinarVersion = getWebinarDataVersion(conn, zoomWebinarId)
+    if useCache and webinarVersion and isExportCached(conn, webinarVersion[0], webinarVersion[1], dd, exportFormats,
+                                                      chunkSize, filePaths):
+        _logger.info('Nothing changed since the last export. Reports are up to date in %s', getOutputDir())
+        return
+
+    with attendanceFiles as wrt, defaultersFiles as dwrt:
+        generateEmailWiseAttendance = getEmailWiseAttendanceGenerator()
+        generateEmailWiseAttendance(conn, zoomWebinarId, timedWriter('export.write_attendance', wrt),
+                                    timedWriter('export.write_defaulters', dwrt), defaultDays=dd, chunkSize=chunkSize)
+
+    if webinarVersion:
+        with transaction(conn):
+            recordExport(conn, webinarVersion[0], webinarVersion[1], dd, exportFormats, chunkSize, filePaths)
+
+
+EXPORT_ENGINE_PYTHON = 'python'
+EXPORT_ENGINE_NUMPY = 'numpy'
+EXPORT_ENGINE_SQL = 'sql'
+EXPORT_ENGINE_SUMMARY = 'summary'
+
+def getEmailWiseAttendanceGenerator(engine=None):
+    if engine is None:
+        engine = agni_configuration.getAgniExportEngine()
+
+    if engine == EXPORT_ENGINE_NUMPY:
+        from agni.attendance_matrix import isMatrixEngineAvailable, generateEmailWiseAttendanceFromMatrix
+        if isMatrixEngineAvailable():
+            _logger.info('Using numpy export engine')
+            return generateEmailWiseAttendanceFromMatrix
+        _logger.warn('numpy is not installed. Falling back to python export engine.')
+    elif engine == EXPORT_ENGINE_SQL:
+        _logger.info('Using sql export engine')
+        return generateEmailWiseAttendanceFromSQL
+    elif engine == EXPORT_ENGINE_SUMMARY:
+        _logger.info('Using summary export engine')
+        return generateEmailWiseAttendanceFromSummary
+    elif engine != EXPORT_ENGINE_PYTHON:
+        _logger.warn("Unknown export engine '%s'. Using python export engine.", engine)
+
+    return generateEmailWiseAttendanceFromDB
+
+
+def getOutputFilePath(zoomWebinarId, extension='csv'):
     outputDir = getOutputDir()
-    return join(outputDir, '%s-AttendanceByEmail.csv'%zoomWebinarId)
+    return join(outputDir, '%s-AttendanceByEmail.%s'%(zoomWebinarId, extension))
 
 
-def getDefaultersFilePath(zoomWebinarId):
+def getDefaultersFilePath(zoomWebinarId, extension='csv'):
     outputDir = getOutputDir()
-    return join(outputDir, '%s-Defaulters.csv'%zoomWebinarId)
+    return join(outputDir, '%s-Defaulters.%s'%(zoomWebinarId, extension))
 
 
-def getDefaultDays(defaultDays = agni_configuration.getAgniAttendanceDefaultDays()):
+def getDefaultDays(defaultDays=None):
+    if defaultDays is None:
+        defaultDays = agni_configuration.getAgniAttendanceDefaultDays()
     while True:
         flushLogs()
         dd = raw_input('Enter number of consecutive days to check defaulters [default: %s]> '%defaultDays)
@@ -136,7 +325,9 @@ def getDefaultDays(defaultDays = agni_configuration.getAgniAttendanceDefaultDays
                 _logger.error('Not a valid number: %s', dd)
 
 
-def isDefaulter(attendanceArray, days=agni_configuration.getAgniAttendanceDefaultDays()):
+def isDefaulter(attendanceArray, days=None):
+    if days is None:
+        days = agni_configuration.getAgniAttendanceDefaultDays()
     if len(attendanceArray) >= days:
         attSet = set(attendanceArray[-days:])
         if ('Yes' not in attSet) and ('NA' not in attSet):
@@ -159,35 +350,58 @@ def getRegistrantsToUpdateStatus(zoomWebinarId, registrantEmails):
 
 def denyRegistrants(zoomWebinarId, registrants):
     za = ZoomApi()
-    return za.updateWebinarRegistrantsStatus(zoomWebinarId, ACTION_DENY, registrants=registrants)
+    try:
+        return za.updateWebinarRegistrantsStatusInBatches(zoomWebinarId, ACTION_DENY, registrants)
+    finally:
+        za.close()
 
 def cancelRegistrants(zoomWebinarId, registrants):
     za = ZoomApi()
-    return za.updateWebinarRegistrantsStatus(zoomWebinarId, ACTION_CANCEL, registrants=registrants)
+    try:
+        return za.updateWebinarRegistrantsStatusInBatches(zoomWebinarId, ACTION_CANCEL, registrants)
+    finally:
+        za.close()
 
 
-def cancelDefaulters(zoomWebinarId):
-    yn = 'N'
-    emails = []
+def readDefaulterEmails(zoomWebinarId):
+    # None when the defaulters report has not been exported yet
     defaultersFilePath = getDefaultersFilePath(zoomWebinarId)
     if not exists(defaultersFilePath):
         _logger.error('File not found: %s', defaultersFilePath)
-        return 0
+        return None
 
     with open(defaultersFilePath) as dfd:
         # Strip contents; Split lines; Skip header; Strip each row; Convert to lowercase
-        emails = [ e.strip().lower() for e in dfd.read().strip().split('\n')[1:]]
+        return [ e.strip().lower() for e in dfd.read().strip().split('\n')[1:]]
+
 
+def cancelDefaulters(zoomWebinarId, interactive=True):
+    # Unless interactive, cancels without asking and does not retry registrants that failed
+    yn = 'N'
+    emails = readDefaulterEmails(zoomWebinarId)
     if not emails:
         return 0
 
-    yn = raw_input('Cancel %s defaulters from attending webinar %s? (Y/N) > '%(len(emails), zoomWebinarId))
-    if yn.upper().strip() not in ('Y', 'YES'):
-        return 0
+    if interactive:
+        yn = raw_input('Cancel %s defaulters from attending webinar %s? (Y/N) > '%(len(emails), zoomWebinarId))
+        if yn.upper().strip() not in ('Y', 'YES'):
+            return 0
 
     r2c = getRegistrantsToUpdateStatus(zoomWebinarId, emails)
-    ret = cancelRegistrants(zoomWebinarId, r2c)
-    _logger.info('ret=%s', ret)
-
-    return len(r2c)
+    cancelledCount = 0
+    while r2c:
+        results = cancelRegistrants(zoomWebinarId, r2c)
+        failed = getFailedRegistrants(results)
+        cancelledCount += len(r2c) - len(failed)
+        r2c = failed
+        if not r2c:
+            break
+        _logger.error('Could not cancel %s registrants: %s', len(r2c), ', '.join(r['email'] for r in r2c))
+        if not interactive:
+            break
+        yn = raw_input('Retry cancelling %s registrants? (Y/N) > '%len(r2c))
+        if yn.upper().strip() not in ('Y', 'YES'):
+            break
+
+    return cancelledCount
 
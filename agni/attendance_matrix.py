@@ -0,0 +1,147 @@
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from utils.logger import getAgniLogger
+from utils.timing import span
+from zoom.report_parser import ZOOM_WEBINAR_DATETIME_FORMAT
+
+_logger = getAgniLogger(__name__)
+
+# Small integer codes of the attendance matrix cells
+CODE_NA = 0
+CODE_NO = 1
+CODE_YES = 2
+ATTENDANCE_LABELS = ('NA', 'No', 'Yes')
+
+
+def isMatrixEngineAvailable():
+    return numpy is not None
+
+
+class AttendanceMatrix:
+    # registrants x classes, rows in email order and columns in class date order
+    def __init__(self, classDates, emails, codes):
+        self.classDates = classDates
+        self.emails = emails
+        self.codes = codes
+
+    def getDefaulterMask(self, days):
+        # A defaulter was absent, with attendance recorded as 'No', in each of the last `days` classes
+        numRegistrants, numClasses = self.codes.shape
+        if days <= 0:
+            # Like isDefaulter(), a window of 0 days covers every class
+            days = numClasses
+        if numClasses < days:
+            return numpy.zeros(numRegistrants, dtype=bool)
+        return (self.codes[:, numClasses - days:] == CODE_NO).all(axis=1)
+
+
+def _fetchIds(cur, query, params):
+    # group_concat() hands back a whole column in one string that numpy parses in C
+    cur.execute(query, params)
+    row = cur.fetchone()
+    if not row or not row[0]:
+        return numpy.zeros(0, dtype=numpy.int64)
+    return numpy.fromstring(row[0], dtype=numpy.int64, sep=',')
+
+
+def loadAttendanceMatrix(cnx, zoomWebinarId):
+    webinarQuery = '''
+        SELECT id FROM webinar WHERE zoom_webinar_id = ?
+    '''
+    classesQuery = '''
+        SELECT id, original_datetime, internal_datetime
+        FROM webinar_class
+        WHERE webinar_id = ?
+        ORDER BY internal_datetime ASC
+    '''
+    registrantsQuery = '''
+        SELECT id, email, mirror_only, COALESCE(internal_registration_datetime, '')
+        FROM export_registrant
+        WHERE webinar_id = ?
+        ORDER BY email ASC
+    '''
+    classAttendeesQuery = '''
+        SELECT group_concat(registrant_id)
+        FROM attendance
+        WHERE webinar_class_id = ? AND attended = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(webinarQuery, (zoomWebinarId,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        webinarId = row[0]
+
+        cur.execute(classesQuery, (webinarId,))
+        classRows = cur.fetchall()
+        if not classRows:
+            return None
+
+        cur.execute(registrantsQuery, (webinarId,))
+        registrantIds = []
+        emails = []
+        mirrorOnlyRows = []
+        for registrantId, email, mirrorOnly, registrationDatetime in cur:
+            if mirrorOnly:
+                mirrorOnlyRows.append((len(emails), registrationDatetime))
+            registrantIds.append(registrantId)
+            emails.append(email)
+
+        registrantIds = numpy.array(registrantIds, dtype=numpy.int64)
+        idOrder = numpy.argsort(registrantIds)
+        sortedIds = registrantIds[idOrder]
+
+        codes = numpy.zeros((len(emails), len(classRows)), dtype=numpy.uint8)
+        # Registrants who never appeared in a report missed every class held after registering
+        classDatetimes = numpy.array([r[2] for r in classRows], dtype=object)
+        for row, registrationDatetime in mirrorOnlyRows:
+            codes[row, classDatetimes >= registrationDatetime] = CODE_NO
+
+        for col, (classId, _, _) in enumerate(classRows):
+            for attended, code in (('No', CODE_NO), ('Yes', CODE_YES)):
+                ids = _fetchIds(cur, classAttendeesQuery, (classId, attended))
+                if not len(ids):
+                    continue
+                codes[idOrder[numpy.searchsorted(sortedIds, ids)], col] = code
+    finally:
+        if cur:
+            cur.close()
+
+    classDates = [r[1] for r in classRows]
+    return AttendanceMatrix(classDates, emails, codes)
+
+
+def generateEmailWiseAttendanceFromMatrix(cnx, zoomWebinarId, attendanceWriter, defaultersWriter, defaultDays=4,
+                                          chunkSize=1000):
+    # Same output as agni.attendance.generateEmailWiseAttendanceFromDB, computed on a numpy matrix.
+    # The matrix holds the whole webinar, so chunkSize has nothing to bound here.
+    from agni.attendance import EXPORT_DATE_FORMAT
+
+    with span('export.matrix_load'):
+        matrix = loadAttendanceMatrix(cnx, zoomWebinarId)
+    if matrix is None:
+        _logger.error('Unknown zoom webinar id: %s', zoomWebinarId)
+        return
+
+    classDates = [datetime.strptime(d, ZOOM_WEBINAR_DATETIME_FORMAT).strftime(EXPORT_DATE_FORMAT)
+                  for d in matrix.classDates]
+    attendanceWriter.writerow(['Email']+classDates)
+    defaultersWriter.writerow(['Email'])
+
+    with span('export.matrix_defaulters'):
+        defaulterMask = matrix.getDefaulterMask(defaultDays)
+    labels = numpy.array(ATTENDANCE_LABELS, dtype=object)
+    with span('export.pivot', rows=len(matrix.emails)):
+        for i, email in enumerate(matrix.emails):
+            if defaulterMask[i]:
+                defaultersWriter.writerow([email])
+            attendanceWriter.writerow([email]+labels[matrix.codes[i]].tolist())
+
+    _logger.info('Registrants: %s | Defaulters: %s', len(matrix.emails), int(defaulterMask.sum()))
@@ -0,0 +1,202 @@
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+# Per registrant: classes attended, last class attended and the number of classes missed in a row
+# (attendance 'No') up to the latest class. webinar.summarized_through is the latest class folded in.
+TABLE_REGISTRANT_ATTENDANCE_SUMMARY = '''
+    CREATE TABLE IF NOT EXISTS registrant_attendance_summary(
+        registrant_id INTEGER PRIMARY KEY REFERENCES webinar_registrant(id),
+        webinar_id INTEGER NOT NULL REFERENCES webinar(id),
+        email TEXT NOT NULL,
+        total_attended INTEGER NOT NULL DEFAULT 0,
+        last_attended_class_id INTEGER REFERENCES webinar_class(id),
+        absence_streak INTEGER NOT NULL DEFAULT 0
+    )
+'''
+INDEX_REGISTRANT_ATTENDANCE_SUMMARY_WEBINAR_EMAIL = '''
+    CREATE INDEX IF NOT EXISTS registrant_attendance_summary_webinar_email
+    ON registrant_attendance_summary(webinar_id, email, absence_streak, total_attended, last_attended_class_id)
+'''
+ALTER_WEBINAR_ADD_SUMMARIZED_THROUGH = '''
+    ALTER TABLE webinar ADD COLUMN summarized_through TEXT
+'''
+
+# :webinar_id NULL means every webinar
+DELETE_SUMMARY = '''
+    DELETE FROM registrant_attendance_summary
+    WHERE (:webinar_id IS NULL OR webinar_id = :webinar_id)
+'''
+REBUILD_SUMMARY = '''
+    INSERT INTO registrant_attendance_summary(
+        registrant_id,
+        webinar_id,
+        email,
+        total_attended,
+        last_attended_class_id,
+        absence_streak
+    )
+    SELECT
+        wr.id,
+        wr.webinar_id,
+        wr.email,
+        (
+            SELECT COUNT(*) FROM attendance a
+            WHERE a.registrant_id = wr.id AND a.attended = 'Yes'
+        ),
+        (
+            SELECT a.webinar_class_id
+            FROM
+                attendance a
+                INNER JOIN
+                webinar_class wc ON (wc.id = a.webinar_class_id)
+            WHERE a.registrant_id = wr.id AND a.attended = 'Yes'
+            ORDER BY wc.internal_datetime DESC
+            LIMIT 1
+        ),
+        (
+            SELECT COUNT(*) FROM webinar_class wc
+            WHERE wc.webinar_id = wr.webinar_id AND wc.internal_datetime > COALESCE((
+                SELECT MAX(wc2.internal_datetime)
+                FROM
+                    webinar_class wc2
+                    LEFT OUTER JOIN
+                    attendance a2 ON (a2.webinar_class_id = wc2.id AND a2.registrant_id = wr.id)
+                WHERE wc2.webinar_id = wr.webinar_id AND COALESCE(a2.attended, 'NA') <> 'No'
+            ), '')
+        )
+    FROM webinar_registrant wr
+    WHERE (:webinar_id IS NULL OR wr.webinar_id = :webinar_id)
+'''
+REBUILD_SUMMARIZED_THROUGH = '''
+    UPDATE webinar
+    SET summarized_through = (SELECT MAX(internal_datetime) FROM webinar_class WHERE webinar_id = webinar.id)
+    WHERE (:webinar_id IS NULL OR id = :webinar_id)
+'''
+REBUILD_SUMMARY_STATEMENTS = (DELETE_SUMMARY, REBUILD_SUMMARY, REBUILD_SUMMARIZED_THROUGH)
+
+# Folding in a class that is later than every class summarized so far
+ADD_NEW_REGISTRANTS_TO_SUMMARY = '''
+    INSERT OR IGNORE INTO registrant_attendance_summary(registrant_id, webinar_id, email)
+    SELECT id, webinar_id, email FROM webinar_registrant WHERE webinar_id = :webinar_id
+'''
+APPLY_CLASS_TO_SUMMARY = '''
+    UPDATE registrant_attendance_summary
+    SET
+        total_attended = total_attended + (
+            SELECT COUNT(*) FROM attendance a
+            WHERE a.webinar_class_id = :class_id
+            AND a.registrant_id = registrant_attendance_summary.registrant_id
+            AND a.attended = 'Yes'
+        ),
+        last_attended_class_id = COALESCE((
+            SELECT a.webinar_class_id FROM attendance a
+            WHERE a.webinar_class_id = :class_id
+            AND a.registrant_id = registrant_attendance_summary.registrant_id
+            AND a.attended = 'Yes'
+        ), last_attended_class_id),
+        absence_streak = CASE (
+            SELECT a.attended FROM attendance a
+            WHERE a.webinar_class_id = :class_id
+            AND a.registrant_id = registrant_attendance_summary.registrant_id
+        ) WHEN 'No' THEN absence_streak + 1 ELSE 0 END
+    WHERE webinar_id = :webinar_id
+'''
+
+
+def _executeAll(cnx, statements, params):
+    cur = None
+    try:
+        cur = cnx.cursor()
+        for st in statements:
+            cur.execute(st, params)
+    finally:
+        if cur:
+            cur.close()
+
+
+def rebuildAttendanceSummary(cnx, webinarId=None):
+    _executeAll(cnx, REBUILD_SUMMARY_STATEMENTS, {'webinar_id': webinarId})
+    _logger.info('Rebuilt attendance summary of %s', 'webinar %s' % webinarId if webinarId else 'all webinars')
+
+
+def invalidateAttendanceSummary(cnx, webinarClassIds):
+    # The next update of these webinars rebuilds their summary
+    supd = '''
+        UPDATE webinar SET summarized_through = NULL
+        WHERE id IN (SELECT webinar_id FROM webinar_class WHERE id = ?)
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.executemany(supd, ((classId,) for classId in webinarClassIds))
+    finally:
+        if cur:
+            cur.close()
+
+
+def updateAttendanceSummary(cnx, webinarId, webinarClassId, classDatetime):
+    # Called in the same transaction as the import of a class
+    sq = '''
+        SELECT summarized_through FROM webinar WHERE id = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(sq, (webinarId,))
+        row = cur.fetchone()
+        summarizedThrough = row[0] if row else None
+    finally:
+        if cur:
+            cur.close()
+
+    if summarizedThrough is None or classDatetime <= summarizedThrough:
+        # Out of order, re-imported or never summarized: start over for this webinar
+        rebuildAttendanceSummary(cnx, webinarId)
+        return
+
+    supd = '''
+        UPDATE webinar SET summarized_through = :class_datetime WHERE id = :webinar_id
+    '''
+    _executeAll(cnx, (ADD_NEW_REGISTRANTS_TO_SUMMARY, APPLY_CLASS_TO_SUMMARY, supd), {
+        'webinar_id': webinarId,
+        'class_id': webinarClassId,
+        'class_datetime': classDatetime,
+    })
+    _logger.info('Added class %s to attendance summary of webinar %s', webinarClassId, webinarId)
+
+
+def iterRegistrantAttendanceTotals(cnx, webinarId):
+    # (email, total_attended, last_attended_class_id, absence_streak) in email order
+    tq = '''
+        SELECT email, total_attended, last_attended_class_id, absence_streak
+        FROM registrant_attendance_summary
+        WHERE webinar_id = ?
+        ORDER BY email ASC
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(tq, (webinarId,))
+        for row in cur:
+            yield row
+    finally:
+        if cur:
+            cur.close()
+
+
+def getDefaulterEmails(cnx, webinarId, days):
+    dq = '''
+        SELECT email
+        FROM registrant_attendance_summary
+        WHERE webinar_id = ? AND absence_streak >= ?
+        ORDER BY email ASC
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(dq, (webinarId, days))
+        return [r[0] for r in cur]
+    finally:
+        if cur:
+            cur.close()
@@ -0,0 +1,138 @@
+'''
+Unattended processing of many webinars: import, export and optionally cancelling defaulters, with
+independent webinars handled in parallel worker processes.
+
+    python agni_gcr_attendance.py 123-456-7890 "987 654 3210=Agni 9876543210" --cancel-defaulters
+
+Only one worker writes to the database at a time, and the others wait for it: importing a report and
+syncing the registrants of a webinar are each one transaction, which can keep the database locked for
+longer than SQLite would wait. Imports and syncs so run one after another, while the exports, which
+mostly read, run in parallel.
+'''
+from multiprocessing import Pool, RLock, cpu_count
+from time import time
+
+from agni.attendance import exportAttendanceFromDB, cancelDefaulters, readDefaulterEmails
+from agni.db import getConnection, closeConnection, setWriteLock
+from utils.configuration import agni_configuration, SECTION_AGNI, PROP_AGNI_IMPORT_WORKERS
+from utils.logger import flushLogs, getAgniLogger
+from utils.timing import enableProfiling, logSpanReport
+from zoom.attendance_importer import loadAttendeeReportsToDB, findWebinarDirectory
+from zoom.common import sanitizeWebinarId
+from zoom.registrant_sync import syncWebinarRegistrantsIfEnabled
+
+_logger = getAgniLogger(__name__)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+
+
+class WebinarJob(object):
+    def __init__(self, zoomWebinarId, webinarDir=None, forceReimport=False, cancel=False):
+        self.zoomWebinarId = zoomWebinarId
+        # None to look for a directory having the webinar id in its name
+        self.webinarDir = webinarDir
+        self.forceReimport = forceReimport
+        self.cancel = cancel
+
+
+class WebinarResult(object):
+    def __init__(self, zoomWebinarId):
+        self.zoomWebinarId = zoomWebinarId
+        self.filesImported = 0
+        self.defaulters = None
+        self.cancelled = None
+        self.error = None
+        self.elapsedSeconds = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def parseWebinarArgument(arg):
+    # '123-456-7890' or '123-456-7890=Some Directory'
+    zoomWebinarId, sep, webinarDir = arg.partition('=')
+    return sanitizeWebinarId(zoomWebinarId), webinarDir.strip() if sep else None
+
+
+def processWebinar(job):
+    # Runs in a batch worker process, or in the main one when there is a single worker
+    result = WebinarResult(job.zoomWebinarId)
+    startTime = time()
+    try:
+        webinarDir = job.webinarDir or findWebinarDirectory(job.zoomWebinarId)
+        if webinarDir is None:
+            raise Exception('No directory found for webinar %s' % job.zoomWebinarId)
+        _logger.info('Processing zoom webinar id: %s from %s', job.zoomWebinarId, webinarDir)
+        result.filesImported = loadAttendeeReportsToDB(job.zoomWebinarId, forceReimport=job.forceReimport,
+                                                       webinarDir=webinarDir)
+        syncWebinarRegistrantsIfEnabled(job.zoomWebinarId)
+        exportAttendanceFromDB(job.zoomWebinarId)
+        if job.cancel:
+            emails = readDefaulterEmails(job.zoomWebinarId)
+            result.defaulters = len(emails) if emails else 0
+            result.cancelled = cancelDefaulters(job.zoomWebinarId, interactive=False)
+            if result.cancelled < result.defaulters:
+                raise Exception('Could not cancel %s of %s defaulters' % (result.defaulters - result.cancelled,
+                                                                          result.defaulters))
+    except Exception as e:
+        _logger.exception('Error processing webinar %s', job.zoomWebinarId)
+        result.error = str(e) or e.__class__.__name__
+    finally:
+        # The next job of this worker may be a long way off; do not hold the database open till then
+        closeConnection()
+        result.elapsedSeconds = time() - startTime
+        logSpanReport('Webinar %s' % job.zoomWebinarId)
+        flushLogs()
+    return result
+
+
+def _initBatchWorker(exportFormats, profile, writeLock):
+    setWriteLock(writeLock)
+    # Pool workers are daemonic and cannot start the parallel parse workers of their own
+    agni_configuration.set(SECTION_AGNI, PROP_AGNI_IMPORT_WORKERS, 1)
+    # A spawned worker, as on Windows, does not inherit settings made on the command line
+    if exportFormats:
+        agni_configuration.setAgniExportFormats(exportFormats)
+    if profile:
+        enableProfiling()
+
+
+def runBatch(jobs, workers=0, exportFormats=None, profile=False):
+    # Returns the WebinarResult of every job, in the order of the jobs
+    if workers <= 0:
+        workers = cpu_count()
+    workers = min(workers, len(jobs))
+
+    # Migrates the database once, before the workers open their own connections
+    getConnection()
+    closeConnection()
+
+    if workers <= 1:
+        return [processWebinar(job) for job in jobs]
+
+    _logger.info('Processing %s webinars with %s worker processes', len(jobs), workers)
+    pool = Pool(processes=workers, initializer=_initBatchWorker, initargs=(exportFormats, profile, RLock()))
+    try:
+        return pool.map(processWebinar, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def formatBatchSummary(results):
+    lines = ['%-14s %-6s %8s %10s %10s %9s  %s' % ('webinar', 'status', 'imported', 'defaulters', 'cancelled',
+                                                   'seconds', 'error')]
+    for r in results:
+        lines.append('%-14s %-6s %8s %10s %10s %9.2f  %s' % (
+            r.zoomWebinarId, 'ok' if r.ok else 'FAILED', r.filesImported,
+            '-' if r.defaulters is None else r.defaulters, '-' if r.cancelled is None else r.cancelled,
+            r.elapsedSeconds, r.error or ''))
+    failed = sum(1 for r in results if not r.ok)
+    lines.append('%s webinars processed, %s failed' % (len(results), failed))
+    return '\n'.join(lines)
+
+
+def getBatchExitCode(results):
+    return EXIT_OK if all(r.ok for r in results) else EXIT_FAILED
@@ -0,0 +1,253 @@
+'''
+End to end benchmark: generates attendee reports at several scales and times parsing, import, export
+and defaulter detection on each, with the engines set in agni-gcr.ini. Results are saved as JSON, along with
+the peak memory of the import.
+
+    python -m agni.benchmark --scales 1000x10,5000x20,20000x50
+
+Every scale runs in its own process, against a new database in a temporary base directory. The reports of
+each scale are then imported once more with every import engine, each in a process of its own, so that the
+peak memory of the engines can be compared.
+'''
+import json
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from os import environ, listdir, mkdir
+from os.path import join, exists
+from tempfile import mkdtemp
+from time import time
+
+from utils.configuration import agni_configuration, getConfigFile, getOutputDir, ENV_AGNI_BASE_DIR
+from utils.logger import getAgniLogger
+from zoom.report_generator import addGeneratorArguments, makeGeneratorOptions, generateAttendeeReports
+
+_logger = getAgniLogger(__name__)
+
+BENCHMARK_ZOOM_WEBINAR_ID = '1234567890'
+BENCHMARK_REPORTS_DIR = 'Agni %s' % BENCHMARK_ZOOM_WEBINAR_ID
+
+
+class NullWriter(object):
+    def __init__(self):
+        self.rows = 0
+
+    def writerow(self, row):
+        self.rows += 1
+
+
+def parseScales(scales):
+    # '1000x10,5000x20' -> [(1000, 10), (5000, 20)]
+    parsed = []
+    for scale in scales.split(','):
+        registrants, classes = scale.strip().lower().split('x')
+        parsed.append((int(registrants), int(classes)))
+    return parsed
+
+
+def getPeakRssMB():
+    # Peak resident memory of this process so far, None where the resource module is missing (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on OS X, KB elsewhere
+    return maxRss / (1024.0 * 1024.0) if sys.platform == 'darwin' else maxRss / 1024.0
+
+
+def timed(timings, name, func, *args, **kwargs):
+    startTime = time()
+    ret = func(*args, **kwargs)
+    timings[name] = time() - startTime
+    _logger.info('Benchmark %s: %.3f sec', name, timings[name])
+    return ret
+
+
+def runScale(reportsDir):
+    # Runs in the child process, whose base directory is the temporary one
+    from agni.attendance import exportAttendanceFromDB, getEmailWiseAttendanceGenerator, EXPORT_ENGINE_PYTHON, \
+        EXPORT_ENGINE_NUMPY, EXPORT_ENGINE_SQL, EXPORT_ENGINE_SUMMARY
+    from agni.attendance_matrix import isMatrixEngineAvailable
+    from agni.db import getConnection, closeConnection
+    from zoom.attendance_importer import loadAttendeeReportsToDB, parseAttendeeReport
+
+    reportFiles = [join(reportsDir, f) for f in sorted(listReports(reportsDir))]
+    timings = {}
+    result = {'timings': timings}
+
+    def parseAll():
+        return sum(len(parseAttendeeReport(fp).records) for fp in reportFiles)
+
+    timed(timings, 'import', loadAttendeeReportsToDB, BENCHMARK_ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    # Before anything else holds all the records at once
+    result['importPeakRssMB'] = getPeakRssMB()
+    result['records'] = timed(timings, 'parse', parseAll)
+    timed(timings, 'reimport_unchanged', loadAttendeeReportsToDB, BENCHMARK_ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    timed(timings, 'export', exportAttendanceFromDB, BENCHMARK_ZOOM_WEBINAR_ID, useCache=False)
+
+    conn = getConnection()
+    dd = agni_configuration.getAgniAttendanceDefaultDays()
+    engines = [EXPORT_ENGINE_PYTHON, EXPORT_ENGINE_SQL, EXPORT_ENGINE_SUMMARY]
+    if isMatrixEngineAvailable():
+        engines.append(EXPORT_ENGINE_NUMPY)
+    result['defaulters'] = {}
+    for engine in engines:
+        generate = getEmailWiseAttendanceGenerator(engine)
+        attendanceWriter = NullWriter()
+        defaultersWriter = NullWriter()
+        timed(timings, 'defaulters_%s' % engine, generate, conn, BENCHMARK_ZOOM_WEBINAR_ID, attendanceWriter,
+              defaultersWriter, defaultDays=dd, chunkSize=agni_configuration.getAgniExportChunkSize())
+        # Less the header rows
+        result['defaulters'][engine] = defaultersWriter.rows - 1
+        result['registrants'] = attendanceWriter.rows - 1
+
+    closeConnection()
+    if timings['import'] > 0:
+        result['importRecordsPerSec'] = result['records'] / timings['import']
+    return result
+
+
+def runImport(reportsDir, engine):
+    # Runs in a child process of its own, so that its peak memory is that of this engine's import
+    from agni.db import closeConnection
+    from utils.configuration import SECTION_AGNI, PROP_AGNI_IMPORT_ENGINE
+    from zoom.attendance_importer import loadAttendeeReportsToDB
+
+    agni_configuration.set(SECTION_AGNI, PROP_AGNI_IMPORT_ENGINE, engine)
+    timings = {}
+    timed(timings, 'import_%s' % engine, loadAttendeeReportsToDB, BENCHMARK_ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    result = {'importSec': timings['import_%s' % engine], 'importPeakRssMB': getPeakRssMB()}
+    closeConnection()
+    return result
+
+
+def listReports(reportsDir):
+    return [f for f in listdir(reportsDir) if f.startswith(BENCHMARK_ZOOM_WEBINAR_ID + ' - Attendee Report')]
+
+
+def runChildProcess(baseDir, childArgs):
+    # Runs this module in a child process with baseDir as its base directory; returns what the child saved
+    # Same engines and settings as this installation
+    if exists(getConfigFile()):
+        shutil.copy(getConfigFile(), join(baseDir, 'agni-gcr.ini'))
+    resultFile = join(baseDir, 'result.json')
+    env = dict(environ)
+    env[ENV_AGNI_BASE_DIR] = baseDir
+    subprocess.check_call([sys.executable, '-m', 'agni.benchmark'] + childArgs + [resultFile], env=env)
+    with open(resultFile) as fd:
+        return json.load(fd)
+
+
+def runScaleInChildProcess(registrants, classes, args):
+    from zoom.attendance_importer import IMPORT_ENGINE_ROW, IMPORT_ENGINE_BULK
+
+    baseDir = mkdtemp(prefix='agni-benchmark-')
+    try:
+        reportsDir = join(baseDir, BENCHMARK_REPORTS_DIR)
+        opts = makeGeneratorOptions(args, registrants=registrants, classes=classes)
+        opts.zoomWebinarId = BENCHMARK_ZOOM_WEBINAR_ID
+        startTime = time()
+        generateAttendeeReports(reportsDir, opts)
+        generateSec = time() - startTime
+
+        result = runChildProcess(baseDir, ['--child', reportsDir])
+        # Each on a new database of its own
+        result['imports'] = {}
+        for engine in (IMPORT_ENGINE_ROW, IMPORT_ENGINE_BULK):
+            engineDir = join(baseDir, 'import-%s' % engine)
+            mkdir(engineDir)
+            result['imports'][engine] = runChildProcess(engineDir, ['--import-child', engine, reportsDir])
+        result.update({
+            'registrantsGenerated': registrants,
+            'classes': classes,
+            'generateSec': generateSec,
+        })
+        return result
+    finally:
+        if not args.keep:
+            shutil.rmtree(baseDir, ignore_errors=True)
+
+
+def getEnvironmentInfo():
+    try:
+        import numpy
+        numpyVersion = numpy.__version__
+    except ImportError:
+        numpyVersion = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': numpyVersion,
+    }
+
+
+def main():
+    parser = ArgumentParser(description='End to end import/export benchmark')
+    parser.add_argument('--scales', default='1000x10,5000x20',
+                        help='comma separated <registrants>x<classes> to run')
+    parser.add_argument('--output', default=None, help='JSON results file; defaults to one in the output folder')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary base directories')
+    parser.add_argument('--child', nargs=2, metavar=('REPORTS_DIR', 'RESULT_FILE'), help='internal')
+    parser.add_argument('--import-child', nargs=3, metavar=('ENGINE', 'REPORTS_DIR', 'RESULT_FILE'),
+                        help='internal')
+    addGeneratorArguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        result = runScale(args.child[0])
+        with open(args.child[1], 'w') as fd:
+            json.dump(result, fd)
+        return
+    if args.import_child:
+        result = runImport(args.import_child[1], args.import_child[0])
+        with open(args.import_child[2], 'w') as fd:
+            json.dump(result, fd)
+        return
+
+    started = datetime.now()
+    results = {
+        'started': started.isoformat(),
+        'environment': getEnvironmentInfo(),
+        'config': {
+            'import_engine': agni_configuration.getAgniImportEngine(),
+            'import_workers': agni_configuration.getAgniImportWorkers(),
+            'import_chunk_size': agni_configuration.getAgniImportChunkSize(),
+            'export_engine': agni_configuration.getAgniExportEngine(),
+            'export_formats': agni_configuration.getAgniExportFormats(),
+        },
+        'generator': {
+            'attendanceRate': args.attendance_rate,
+            'presentRate': args.present_rate,
+            'duplicateRate': args.duplicate_rate,
+            'mergeRate': args.merge_rate,
+            'seed': args.seed,
+        },
+        'scales': [],
+    }
+    for registrants, classes in parseScales(args.scales):
+        _logger.info('Benchmarking %s registrants x %s classes', registrants, classes)
+        results['scales'].append(runScaleInChildProcess(registrants, classes, args))
+
+    output = args.output or join(getOutputDir(), 'benchmark-%s.json' % started.strftime('%Y%m%d-%H%M%S'))
+    with open(output, 'w') as fd:
+        json.dump(results, fd, indent=2, sort_keys=True)
+
+    for s in results['scales']:
+        print '%6s x %-4s %s' % (s['registrantsGenerated'], s['classes'], ' | '.join(
+            '%s %.3f' % (k, v) for k, v in sorted(s['timings'].items())))
+        if s['importPeakRssMB'] is not None:
+            print '%6s x %-4s import peak RSS %.1f MB' % (s['registrantsGenerated'], s['classes'], s['importPeakRssMB'])
+        for engine, imp in sorted(s['imports'].items()):
+            print '%6s x %-4s import %-4s %.3f sec%s' % (
+                s['registrantsGenerated'], s['classes'], engine, imp['importSec'],
+                '' if imp['importPeakRssMB'] is None else ', peak RSS %.1f MB' % imp['importPeakRssMB'])
+    print 'Results saved to %s' % output
+
+if __name__ == '__main__':
+    main()
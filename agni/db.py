@@ -1,6 +1,18 @@
+import re
 import sqlite3
+from contextlib import contextmanager
+from os import getpid
 
-from utils.configuration import getDbFile
+from agni.attendance_summary import TABLE_REGISTRANT_ATTENDANCE_SUMMARY, \
+    INDEX_REGISTRANT_ATTENDANCE_SUMMARY_WEBINAR_EMAIL, ALTER_WEBINAR_ADD_SUMMARIZED_THROUGH, \
+    REBUILD_SUMMARY_STATEMENTS
+from agni.export_cache import ALTER_WEBINAR_ADD_DATA_VERSION, TABLE_WEBINAR_EXPORT
+from agni.persons import PERSON_MIGRATION_STATEMENTS
+from agni.registrant_mirror import TABLE_ZOOM_REGISTRANT, TABLE_ZOOM_REGISTRANT_SYNC, VIEW_EXPORT_REGISTRANT
+from utils.configuration import getDbFile, agni_configuration
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
 
 TABLE_WEBINAR = '''
     CREATE TABLE IF NOT EXISTS webinar(
@@ -38,21 +50,238 @@ TABLE_ATTENDANCE = '''
     )
 '''
 
-def getConnection():
-    dbfile = getDbFile()
-    return sqlite3.connect(dbfile)
+TABLE_IMPORT_MANIFEST = '''
+    CREATE TABLE IF NOT EXISTS import_manifest(
+        id INTEGER PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        file_mtime REAL NOT NULL,
+        webinar_id INTEGER REFERENCES webinar(id),
+        webinar_class_id INTEGER REFERENCES webinar_class(id),
+        imported_datetime TEXT NOT NULL
+    )
+'''
+INDEX_IMPORT_MANIFEST_FILE_PATH = '''
+    CREATE INDEX IF NOT EXISTS import_manifest_file_path ON import_manifest(file_path)
+'''
+# Not unique: a copy of an imported report gets an entry of its own
+INDEX_IMPORT_MANIFEST_CONTENT_HASH = '''
+    CREATE INDEX IF NOT EXISTS import_manifest_content_hash ON import_manifest(content_hash)
+'''
+# Covering indexes for the lookups done by the importer and the exporter
+INDEX_WEBINAR_REGISTRANT_WEBINAR_EMAIL = '''
+    CREATE INDEX IF NOT EXISTS webinar_registrant_webinar_email
+    ON webinar_registrant(webinar_id, email, id, internal_registration_datetime)
+'''
+INDEX_WEBINAR_CLASS_WEBINAR_DATETIME = '''
+    CREATE INDEX IF NOT EXISTS webinar_class_webinar_datetime
+    ON webinar_class(webinar_id, internal_datetime, id, original_datetime)
+'''
+INDEX_ATTENDANCE_CLASS_REGISTRANT = '''
+    CREATE INDEX IF NOT EXISTS attendance_class_registrant
+    ON attendance(webinar_class_id, registrant_id, attended)
+'''
+INDEX_ATTENDANCE_REGISTRANT_CLASS = '''
+    CREATE INDEX IF NOT EXISTS attendance_registrant_class
+    ON attendance(registrant_id, webinar_class_id, attended)
+'''
 
-def prepareDB(cnx):
+# Ordered schema migrations. PRAGMA user_version holds the last one applied to a database.
+# Databases created before migrations existed are at version 0 and already have the version 1 tables,
+# hence the IF NOT EXISTS everywhere. A step is either an SQL statement or a (statement, parameters) pair.
+MIGRATIONS = (
+    (1, (TABLE_WEBINAR, TABLE_WEBINAR_REGISTRANT, TABLE_WEBINAR_CLASS, TABLE_ATTENDANCE)),
+    (2, (TABLE_IMPORT_MANIFEST, INDEX_IMPORT_MANIFEST_FILE_PATH, INDEX_IMPORT_MANIFEST_CONTENT_HASH)),
+    (3, (
+        INDEX_WEBINAR_REGISTRANT_WEBINAR_EMAIL,
+        INDEX_WEBINAR_CLASS_WEBINAR_DATETIME,
+        INDEX_ATTENDANCE_CLASS_REGISTRANT,
+        INDEX_ATTENDANCE_REGISTRANT_CLASS,
+        'ANALYZE',
+    )),
+    (4, (
+        TABLE_REGISTRANT_ATTENDANCE_SUMMARY,
+        INDEX_REGISTRANT_ATTENDANCE_SUMMARY_WEBINAR_EMAIL,
+        ALTER_WEBINAR_ADD_SUMMARIZED_THROUGH,
+    ) + tuple((st, {'webinar_id': None}) for st in REBUILD_SUMMARY_STATEMENTS)),
+    (5, (ALTER_WEBINAR_ADD_DATA_VERSION, TABLE_WEBINAR_EXPORT)),
+    (6, (TABLE_ZOOM_REGISTRANT, TABLE_ZOOM_REGISTRANT_SYNC, VIEW_EXPORT_REGISTRANT)),
+    (7, PERSON_MIGRATION_STATEMENTS),
+)
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def getSchemaVersion(cnx):
     cur = None
     try:
         cur = cnx.cursor()
-        cur.execute(TABLE_WEBINAR)
-        cur.execute(TABLE_WEBINAR_REGISTRANT)
-        cur.execute(TABLE_WEBINAR_CLASS)
-        cur.execute(TABLE_ATTENDANCE)
+        cur.execute('PRAGMA user_version')
+        return cur.fetchone()[0]
+    finally:
+        if cur:
+            cur.close()
+
+
+def migrateDB(cnx):
+    version = getSchemaVersion(cnx)
+    if version >= LATEST_SCHEMA_VERSION:
+        return version
+
+    # The sqlite3 module commits before DDL statements on its own; take over the transactions
+    # so that every migration is applied completely or not at all
+    isolationLevel = cnx.isolation_level
+    cnx.isolation_level = None
+    cur = None
+    try:
+        cur = cnx.cursor()
+        for migrationVersion, statements in MIGRATIONS:
+            if migrationVersion <= version:
+                continue
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                for st in statements:
+                    if isinstance(st, tuple):
+                        cur.execute(*st)
+                    else:
+                        cur.execute(st)
+                cur.execute('PRAGMA user_version = %d' % migrationVersion)
+                cur.execute('COMMIT')
+            except:
+                cur.execute('ROLLBACK')
+                _logger.exception('Database migration to version %s failed', migrationVersion)
+                raise
+            version = migrationVersion
+            _logger.info('Database migrated to version %s', version)
+    finally:
+        if cur:
+            cur.close()
+        cnx.isolation_level = isolationLevel
+
+    return version
+
+
+class AgniConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        sqlite3.Connection.__init__(self, *args, **kwargs)
+        self.transactionDepth = 0
 
-        # This commit is not necessary for the DDLs above, but is here just in case
-        cnx.commit()
+
+_PRAGMA_VALUE_PATTERN = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+def applyPragmas(cnx, pragmas):
+    cur = None
+    try:
+        cur = cnx.cursor()
+        for name, value in pragmas:
+            if not value:
+                continue
+            if not _PRAGMA_VALUE_PATTERN.match(value):
+                _logger.error('Ignoring invalid value for sqlite %s: %s', name, value)
+                continue
+            cur.execute('PRAGMA %s = %s' % (name, value))
+            cur.execute('PRAGMA %s' % name)
+            row = cur.fetchone()
+            _logger.debug('sqlite %s = %s', name, row[0] if row else None)
     finally:
         if cur:
             cur.close()
+
+
+def openConnection(dbfile=None):
+    if dbfile is None:
+        dbfile = getDbFile()
+    cnx = sqlite3.connect(
+        dbfile,
+        timeout=agni_configuration.getSqliteBusyTimeout(),
+        cached_statements=agni_configuration.getSqliteCachedStatements(),
+        factory=AgniConnection
+    )
+    applyPragmas(cnx, agni_configuration.getSqlitePragmas())
+    migrateDB(cnx)
+    return cnx
+
+
+# One connection per process, shared by the import and the export for the whole session
+_connection = None
+_connectionPid = None
+
+def getConnection():
+    global _connection, _connectionPid
+    if _connection is None or _connectionPid != getpid():
+        # A forked worker must not use the connection of its parent
+        _connection = openConnection()
+        _connectionPid = getpid()
+    return _connection
+
+
+def closeConnection():
+    global _connection, _connectionPid
+    if _connection is not None and _connectionPid == getpid():
+        # Refreshes the planner statistics of tables that have grown, so the covering indexes get used
+        with _holdingWriteLock():
+            _connection.execute('PRAGMA optimize')
+        _connection.close()
+    _connection = None
+    _connectionPid = None
+
+
+# Shared by processes that write to the same database, as the workers of a batch. They wait for it, for
+# however long, instead of for SQLite, whose busy_timeout a long import could outlast. None in a single process
+_writeLock = None
+
+def setWriteLock(lock):
+    global _writeLock
+    _writeLock = lock
+
+
+@contextmanager
+def _holdingWriteLock():
+    if _writeLock is None:
+        yield
+        return
+    with _writeLock:
+        yield
+
+
+@contextmanager
+def transaction(cnx=None):
+    # Commits when the outermost block exits normally, rolls back if it raises
+    if cnx is None:
+        cnx = getConnection()
+    depth = getattr(cnx, 'transactionDepth', 0)
+    if depth:
+        cnx.transactionDepth = depth + 1
+        try:
+            yield cnx
+        finally:
+            cnx.transactionDepth = depth
+        return
+
+    if hasattr(cnx, 'transactionDepth'):
+        cnx.transactionDepth = 1
+    try:
+        with _holdingWriteLock():
+            try:
+                yield cnx
+                cnx.commit()
+            except:
+                cnx.rollback()
+                raise
+    finally:
+        if hasattr(cnx, 'transactionDepth'):
+            cnx.transactionDepth = 0
+
+
+def iterFetchMany(cur, chunkSize):
+    # Pulls the result set in fetchmany() chunks instead of one row per step
+    while True:
+        rows = cur.fetchmany(chunkSize)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+
+def prepareDB(cnx):
+    migrateDB(cnx)
@@ -0,0 +1,108 @@
+import json
+from os import stat
+
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+# webinar.data_version is bumped in the same transaction as every change to a webinar's attendance.
+# webinar_export remembers what the last export of a webinar was made from, so an unchanged webinar
+# can reuse the files already in the output folder. The chunk size is part of it as it sets the row
+# groups of the columnar files.
+ALTER_WEBINAR_ADD_DATA_VERSION = '''
+    ALTER TABLE webinar ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0
+'''
+TABLE_WEBINAR_EXPORT = '''
+    CREATE TABLE IF NOT EXISTS webinar_export(
+        webinar_id INTEGER PRIMARY KEY REFERENCES webinar(id),
+        data_version INTEGER NOT NULL,
+        default_days INTEGER NOT NULL,
+        export_formats TEXT NOT NULL,
+        export_chunk_size INTEGER NOT NULL,
+        files_stamp TEXT NOT NULL,
+        exported_datetime TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def bumpWebinarDataVersion(cnx, webinarId):
+    vupd = '''
+        UPDATE webinar SET data_version = data_version + 1 WHERE id = ?
+    '''
+    cnx.execute(vupd, (webinarId,))
+
+
+def bumpClassesDataVersion(cnx, webinarClassIds):
+    vupd = '''
+        UPDATE webinar SET data_version = data_version + 1
+        WHERE id IN (SELECT webinar_id FROM webinar_class WHERE id = ?)
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.executemany(vupd, ((classId,) for classId in webinarClassIds))
+    finally:
+        if cur:
+            cur.close()
+
+
+def getWebinarDataVersion(cnx, zoomWebinarId):
+    # (webinar id, data version), or None for an unknown webinar
+    vq = '''
+        SELECT id, data_version FROM webinar WHERE zoom_webinar_id = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(vq, (zoomWebinarId,))
+        return cur.fetchone()
+    finally:
+        if cur:
+            cur.close()
+
+
+def getFilesStamp(filePaths):
+    # Size and mtime of every output file; None if any of them is missing
+    stamp = []
+    for fp in sorted(filePaths):
+        try:
+            st = stat(fp)
+        except OSError:
+            return None
+        stamp.append([fp, st.st_size, st.st_mtime])
+    return json.dumps(stamp)
+
+
+def isExportCached(cnx, webinarId, dataVersion, defaultDays, exportFormats, chunkSize, filePaths):
+    eq = '''
+        SELECT data_version, default_days, export_formats, export_chunk_size, files_stamp
+        FROM webinar_export
+        WHERE webinar_id = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(eq, (webinarId,))
+        row = cur.fetchone()
+    finally:
+        if cur:
+            cur.close()
+
+    if not row:
+        return False
+    filesStamp = getFilesStamp(filePaths)
+    return filesStamp is not None and tuple(row) == (dataVersion, defaultDays, exportFormats, chunkSize,
+                                                          filesStamp)
+
+
+def recordExport(cnx, webinarId, dataVersion, defaultDays, exportFormats, chunkSize, filePaths):
+    eins = '''
+        INSERT OR REPLACE INTO webinar_export(
+            webinar_id, data_version, default_days, export_formats, export_chunk_size, files_stamp
+        )
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    filesStamp = getFilesStamp(filePaths)
+    if filesStamp is None:
+        return
+    cnx.execute(eins, (webinarId, dataVersion, defaultDays, exportFormats, chunkSize, filesStamp))
@@ -0,0 +1,184 @@
+import csv
+import json
+from collections import OrderedDict
+
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+EXPORT_FORMAT_CSV = 'csv'
+EXPORT_FORMAT_JSONL = 'jsonl'
+EXPORT_FORMAT_COLUMNAR = 'columnar'
+
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+COLUMNAR_FORMAT_NAME = 'agni-columnar'
+COLUMNAR_FORMAT_VERSION = 1
+
+
+class CsvExportWriter(object):
+    fileExtension = 'csv'
+
+    def __init__(self, fd, chunkSize):
+        self._writer = csv.writer(fd)
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        pass
+
+
+class JsonLinesExportWriter(object):
+    # The first row is the header; every later row becomes one JSON object keyed by it
+    fileExtension = 'jsonl'
+
+    def __init__(self, fd, chunkSize):
+        self._fd = fd
+        self._header = None
+
+    def writerow(self, row):
+        if self._header is None:
+            self._header = list(row)
+            return
+        self._fd.write(json.dumps(OrderedDict(zip(self._header, row))))
+        self._fd.write('\n')
+
+    def close(self):
+        pass
+
+
+class ColumnarExportWriter(object):
+    '''
+    Line delimited JSON: a header line naming the columns, then one line per row group of at most
+    chunkSize rows. A row group stores each column as a list of indexes into the group's dictionary
+    of distinct cell values, so the repeated Yes/No/NA cells cost a few bytes each.
+    '''
+    fileExtension = 'columnar.jsonl'
+
+    def __init__(self, fd, chunkSize):
+        self._fd = fd
+        self._chunkSize = max(chunkSize, 1)
+        self._columnNames = None
+        self._rows = []
+
+    def writerow(self, row):
+        if self._columnNames is None:
+            self._columnNames = list(row)
+            self._writeLine({
+                'format': COLUMNAR_FORMAT_NAME,
+                'version': COLUMNAR_FORMAT_VERSION,
+                'columns': self._columnNames,
+            })
+            return
+        self._rows.append(row)
+        if len(self._rows) >= self._chunkSize:
+            self._flushRowGroup()
+
+    def close(self):
+        self._flushRowGroup()
+
+    def _flushRowGroup(self):
+        if not self._rows:
+            return
+        dictionary = []
+        codes = {}
+        columns = [[] for _ in self._columnNames]
+        for row in self._rows:
+            for column, value in zip(columns, row):
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(dictionary)
+                    dictionary.append(value)
+                column.append(code)
+        self._writeLine({
+            'rows': len(self._rows),
+            'dictionary': dictionary,
+            'columns': columns,
+        })
+        self._rows = []
+
+    def _writeLine(self, obj):
+        self._fd.write(json.dumps(obj, separators=(',', ':')))
+        self._fd.write('\n')
+
+
+class TeeExportWriter(object):
+    def __init__(self, writers):
+        self._writers = writers
+
+    def writerow(self, row):
+        for w in self._writers:
+            w.writerow(row)
+
+    def close(self):
+        for w in self._writers:
+            w.close()
+
+
+EXPORT_WRITERS = {
+    EXPORT_FORMAT_CSV: CsvExportWriter,
+    EXPORT_FORMAT_JSONL: JsonLinesExportWriter,
+    EXPORT_FORMAT_COLUMNAR: ColumnarExportWriter,
+}
+
+
+def parseExportFormats(formats):
+    selected = []
+    for fmt in formats.split(','):
+        fmt = fmt.strip().lower()
+        if not fmt or fmt in selected:
+            continue
+        if fmt not in EXPORT_WRITERS:
+            _logger.warn("Unknown export format '%s'. Ignoring it.", fmt)
+            continue
+        selected.append(fmt)
+
+    if not selected:
+        _logger.warn('No valid export format selected. Using %s.', EXPORT_FORMAT_CSV)
+        selected.append(EXPORT_FORMAT_CSV)
+    return selected
+
+
+class ExportFileSet(object):
+    '''
+    Opens one buffered file per export format for a report, and writes every row to all of them.
+    filePathFunc(extension) gives the path of the report in each format.
+    '''
+    def __init__(self, filePathFunc, formats, chunkSize):
+        self._filePathFunc = filePathFunc
+        self._formats = formats
+        self._chunkSize = chunkSize
+        self._files = []
+        self.writer = None
+
+    def getFilePaths(self):
+        return [self._filePathFunc(EXPORT_WRITERS[fmt].fileExtension) for fmt in self._formats]
+
+    def __enter__(self):
+        writers = []
+        try:
+            for fmt in self._formats:
+                writerClass = EXPORT_WRITERS[fmt]
+                filePath = self._filePathFunc(writerClass.fileExtension)
+                _logger.info('Writing %s', filePath)
+                fd = open(filePath, 'wb', EXPORT_BUFFER_SIZE)
+                self._files.append(fd)
+                writers.append(writerClass(fd, self._chunkSize))
+        except:
+            self._closeFiles()
+            raise
+        self.writer = TeeExportWriter(writers)
+        return self.writer
+
+    def __exit__(self, excType, excValue, tb):
+        try:
+            if excType is None:
+                self.writer.close()
+        finally:
+            self._closeFiles()
+
+    def _closeFiles(self):
+        for fd in self._files:
+            fd.close()
+        self._files = []
@@ -0,0 +1,75 @@
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+# One row per email across all webinars, so that a person's registrations join on integer ids.
+# webinar_registrant keeps its email as well: the import matches report rows to registrants by
+# (webinar_id, email) on a covering index, and the exports and the summary go by email, so moving those
+# to person_id would add a join to person on every row for no gain. The email and person_id of a
+# registrant are set once, when it is inserted, so they cannot disagree.
+TABLE_PERSON = '''
+    CREATE TABLE IF NOT EXISTS person(
+        id INTEGER PRIMARY KEY,
+        email TEXT NOT NULL UNIQUE
+    )
+'''
+ALTER_WEBINAR_REGISTRANT_ADD_PERSON_ID = '''
+    ALTER TABLE webinar_registrant ADD COLUMN person_id INTEGER REFERENCES person(id)
+'''
+# Person ids in the order of each email's first registration
+BACKFILL_PERSON = '''
+    INSERT OR IGNORE INTO person(email)
+    SELECT email FROM webinar_registrant GROUP BY email ORDER BY MIN(id)
+'''
+BACKFILL_WEBINAR_REGISTRANT_PERSON_ID = '''
+    UPDATE webinar_registrant
+    SET person_id = (SELECT id FROM person WHERE person.email = webinar_registrant.email)
+    WHERE person_id IS NULL
+'''
+INDEX_WEBINAR_REGISTRANT_PERSON = '''
+    CREATE INDEX IF NOT EXISTS webinar_registrant_person
+    ON webinar_registrant(person_id, webinar_id, id, internal_registration_datetime)
+'''
+# Both import engines insert registrants without a person; this links every new one
+TRIGGER_WEBINAR_REGISTRANT_PERSON = '''
+    CREATE TRIGGER IF NOT EXISTS webinar_registrant_person
+    AFTER INSERT ON webinar_registrant
+    FOR EACH ROW WHEN NEW.person_id IS NULL
+    BEGIN
+        INSERT OR IGNORE INTO person(email) VALUES (NEW.email);
+        UPDATE webinar_registrant SET person_id = (SELECT id FROM person WHERE email = NEW.email)
+        WHERE id = NEW.id;
+    END
+'''
+# The person_id of a registrant is set once, from its email, which never changes after that
+TRIGGER_WEBINAR_REGISTRANT_IDENTITY_FIXED = '''
+    CREATE TRIGGER IF NOT EXISTS webinar_registrant_identity_fixed
+    BEFORE UPDATE OF email, person_id ON webinar_registrant
+    FOR EACH ROW WHEN NEW.email IS NOT OLD.email
+        OR (OLD.person_id IS NOT NULL AND NEW.person_id IS NOT OLD.person_id)
+    BEGIN
+        SELECT RAISE(ABORT, 'The email and person of a webinar registrant cannot change');
+    END
+'''
+PERSON_MIGRATION_STATEMENTS = (
+    TABLE_PERSON,
+    ALTER_WEBINAR_REGISTRANT_ADD_PERSON_ID,
+    BACKFILL_PERSON,
+    BACKFILL_WEBINAR_REGISTRANT_PERSON_ID,
+    INDEX_WEBINAR_REGISTRANT_PERSON,
+    TRIGGER_WEBINAR_REGISTRANT_PERSON,
+    TRIGGER_WEBINAR_REGISTRANT_IDENTITY_FIXED,
+)
+
+
+def getPersonId(cnx, email):
+    # None for an email never seen in an attendee report
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute('SELECT id FROM person WHERE email = ?', (email.strip().lower(),))
+        row = cur.fetchone()
+        return row[0] if row else None
+    finally:
+        if cur:
+            cur.close()
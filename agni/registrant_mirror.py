@@ -0,0 +1,193 @@
+import calendar
+from datetime import datetime
+
+from agni.export_cache import bumpWebinarDataVersion
+from utils.logger import getAgniLogger
+from zoom.report_parser import INTERNAL_DATETIME_FORMAT
+
+_logger = getAgniLogger(__name__)
+
+ZOOM_API_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+REGISTRANT_STATUS_APPROVED = 'approved'
+
+# Registrants of a webinar as listed by the Zoom API, whether or not they ever joined a class.
+# Every status is synced on its own, so an email may be listed under more than one status.
+# zoom_registrant_sync keeps, per webinar and status, how many registrants the last sync found.
+TABLE_ZOOM_REGISTRANT = '''
+    CREATE TABLE IF NOT EXISTS zoom_registrant(
+        id INTEGER PRIMARY KEY,
+        webinar_id INTEGER NOT NULL REFERENCES webinar(id),
+        email TEXT NOT NULL,
+        zoom_registrant_id TEXT,
+        status TEXT NOT NULL,
+        internal_registration_datetime TEXT,
+        UNIQUE(webinar_id, status, email)
+    )
+'''
+TABLE_ZOOM_REGISTRANT_SYNC = '''
+    CREATE TABLE IF NOT EXISTS zoom_registrant_sync(
+        webinar_id INTEGER NOT NULL REFERENCES webinar(id),
+        status TEXT NOT NULL,
+        total_records INTEGER NOT NULL,
+        synced_datetime TEXT NOT NULL,
+        PRIMARY KEY(webinar_id, status)
+    )
+'''
+# Registrants seen in attendee reports, plus approved Zoom registrants that never appeared in one.
+# The latter get negative ids so that they never match an attendance row. Only the approved status
+# counts, so an email also listed under another status still shows up once.
+VIEW_EXPORT_REGISTRANT = '''
+    CREATE VIEW IF NOT EXISTS export_registrant AS
+    SELECT
+        wr.id AS id,
+        wr.webinar_id AS webinar_id,
+        wr.email AS email,
+        wr.internal_registration_datetime AS internal_registration_datetime,
+        0 AS mirror_only
+    FROM webinar_registrant wr
+    UNION ALL
+    SELECT
+        -zr.id,
+        zr.webinar_id,
+        zr.email,
+        zr.internal_registration_datetime,
+        1
+    FROM zoom_registrant zr
+    WHERE zr.status = 'approved'
+    AND NOT EXISTS (
+        SELECT 1 FROM webinar_registrant wr
+        WHERE wr.webinar_id = zr.webinar_id AND wr.email = zr.email
+    )
+'''
+
+# Attendance of an export_registrant wr in class wc, joined to attendance a. A registrant who never
+# appeared in a report missed every class held after registering.
+EXPORT_ATTENDED_EXPRESSION = '''
+    COALESCE(a.attended, CASE
+        WHEN wr.mirror_only = 1 AND wc.internal_datetime >= COALESCE(wr.internal_registration_datetime, '')
+        THEN 'No' ELSE 'NA'
+    END)
+'''
+
+def convertZoomApiDatetime(zoomDatetimeStr):
+    # Zoom API times are in UTC; report times, and so internal ones, are local
+    if not zoomDatetimeStr:
+        return None
+    try:
+        utc = datetime.strptime(zoomDatetimeStr, ZOOM_API_DATETIME_FORMAT)
+    except ValueError:
+        _logger.warn('Unexpected Zoom registration time: %s', zoomDatetimeStr)
+        return None
+    return datetime.fromtimestamp(calendar.timegm(utc.timetuple())).strftime(INTERNAL_DATETIME_FORMAT)
+
+
+def getRegistrantSyncState(cnx, webinarId, status):
+    # (total_records, synced_datetime) of the last sync, or None
+    sq = '''
+        SELECT total_records, synced_datetime
+        FROM zoom_registrant_sync
+        WHERE webinar_id = ? AND status = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(sq, (webinarId, status))
+        return cur.fetchone()
+    finally:
+        if cur:
+            cur.close()
+
+
+def loadMirroredRegistrants(cnx, webinarId, status):
+    # email -> (zoom_registrant_id, internal_registration_datetime)
+    rq = '''
+        SELECT email, zoom_registrant_id, internal_registration_datetime
+        FROM zoom_registrant
+        WHERE webinar_id = ? AND status = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(rq, (webinarId, status))
+        return dict((email, (zoomId, regDt)) for email, zoomId, regDt in cur)
+    finally:
+        if cur:
+            cur.close()
+
+
+def applyRegistrantPages(cnx, webinarId, status, registrantPages, totalRecords):
+    '''
+    Makes the mirror of one webinar and status match the registrant pages from the Zoom API, writing
+    only rows that changed. Returns the number of registrants added, changed or removed.
+    '''
+    rins = '''
+        INSERT OR REPLACE INTO zoom_registrant(
+            webinar_id,
+            email,
+            zoom_registrant_id,
+            status,
+            internal_registration_datetime
+        ) VALUES (?, ?, ?, ?, ?)
+    '''
+    rdel = '''
+        DELETE FROM zoom_registrant WHERE webinar_id = ? AND status = ? AND email = ?
+    '''
+    sups = '''
+        INSERT OR REPLACE INTO zoom_registrant_sync(webinar_id, status, total_records, synced_datetime)
+        VALUES (?, ?, ?, ?)
+    '''
+    mirrored = loadMirroredRegistrants(cnx, webinarId, status)
+    seen = set()
+    changes = 0
+    cur = None
+    try:
+        cur = cnx.cursor()
+        for registrants in registrantPages:
+            upserts = []
+            for r in registrants:
+                email = (r.get('email') or '').strip().lower()
+                if not email:
+                    continue
+                seen.add(email)
+                row = (r.get('id'), convertZoomApiDatetime(r.get('create_time')))
+                if mirrored.get(email) != row:
+                    upserts.append((webinarId, email, row[0], status, row[1]))
+            cur.executemany(rins, upserts)
+            changes += len(upserts)
+
+        removed = [(webinarId, status, email) for email in mirrored if email not in seen]
+        cur.executemany(rdel, removed)
+        changes += len(removed)
+
+        cur.execute(sups, (webinarId, status, totalRecords, datetime.now().strftime(INTERNAL_DATETIME_FORMAT)))
+    finally:
+        if cur:
+            cur.close()
+
+    if changes:
+        bumpWebinarDataVersion(cnx, webinarId)
+    _logger.info('Synced %s %s registrants of webinar %s: %s changed', len(seen), status, webinarId, changes)
+    return changes
+
+
+def getMirrorOnlyDefaulterEmails(cnx, webinarId, days):
+    # Approved registrants who never appeared in a report and registered before the last `days` classes
+    dq = '''
+        SELECT wr.email
+        FROM export_registrant wr
+        WHERE wr.webinar_id = :webinar_id AND wr.mirror_only = 1
+        AND (
+            SELECT COUNT(*) FROM webinar_class wc
+            WHERE wc.webinar_id = :webinar_id
+            AND wc.internal_datetime >= COALESCE(wr.internal_registration_datetime, '')
+        ) >= :days
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(dq, {'webinar_id': webinarId, 'days': days})
+        return [r[0] for r in cur]
+    finally:
+        if cur:
+            cur.close()
@@ -0,0 +1,155 @@
+'''
+Measures how long the tool takes to start: importing it in a fresh interpreter, running it up to
+argument parsing (--help), and the PyInstaller executable when one has been built.
+
+    python -m agni.startup_benchmark --runs 10 --exe dist/agni_gcr_attendance/agni_gcr_attendance.exe
+
+The slowest imports are listed too, along with whether the import loaded the ini file or set up logging.
+'''
+import json
+import shutil
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os import environ, devnull
+from os.path import join, exists, dirname, abspath
+from tempfile import mkdtemp
+from time import time
+
+from utils.configuration import ENV_AGNI_BASE_DIR
+
+TOOL_MODULE = 'agni_gcr_attendance'
+SOURCE_DIR = dirname(dirname(abspath(__file__)))
+
+
+def timeCommand(cmd, runs, env):
+    # Wall seconds of every run, each in a new process
+    timings = []
+    with open(devnull, 'w') as out:
+        for _ in xrange(runs):
+            startTime = time()
+            subprocess.call(cmd, stdout=out, stderr=out, env=env, cwd=SOURCE_DIR)
+            timings.append(time() - startTime)
+    return timings
+
+
+def summarizeTimings(timings):
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'max': timings[-1],
+    }
+
+
+def profileImports():
+    # Runs in the child process: times every import made while importing the tool
+    import __builtin__
+    originalImport = __builtin__.__import__
+    stack = []
+    modules = {}
+
+    def timedImport(name, *args, **kwargs):
+        alreadyLoaded = name in sys.modules
+        stack.append(0.0)
+        startTime = time()
+        try:
+            return originalImport(name, *args, **kwargs)
+        finally:
+            elapsed = time() - startTime
+            childSeconds = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if not alreadyLoaded and name in sys.modules:
+                cumulative, own = modules.get(name, (0.0, 0.0))
+                modules[name] = (cumulative + elapsed, own + elapsed - childSeconds)
+
+    __builtin__.__import__ = timedImport
+    startTime = time()
+    try:
+        __import__(TOOL_MODULE)
+    finally:
+        __builtin__.__import__ = originalImport
+    totalSeconds = time() - startTime
+
+    from utils.configuration import agni_configuration
+    from utils.logger import isLoggingConfigured
+    return {
+        'totalSeconds': totalSeconds,
+        'modules': sorted(([m, c, o] for m, (c, o) in modules.items()), key=lambda r: -r[1]),
+        'configLoadedOnImport': agni_configuration.isLoaded(),
+        'loggingConfiguredOnImport': isLoggingConfigured(),
+    }
+
+
+def findExecutable():
+    for name in ('agni_gcr_attendance.exe', 'agni_gcr_attendance'):
+        for path in (join(SOURCE_DIR, 'dist', name), join(SOURCE_DIR, 'dist', 'agni_gcr_attendance', name)):
+            if exists(path):
+                return path
+    return None
+
+
+def main():
+    parser = ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='runs of every measurement')
+    parser.add_argument('--exe', default=None,
+                        help='PyInstaller executable to time; defaults to the one under dist/ if built')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--output', default=None, help='also save the results to this JSON file')
+    parser.add_argument('--child-imports', metavar='RESULT_FILE', help='internal')
+    args = parser.parse_args()
+
+    if args.child_imports:
+        with open(args.child_imports, 'w') as fd:
+            json.dump(profileImports(), fd)
+        return
+
+    baseDir = mkdtemp(prefix='agni-startup-')
+    try:
+        # Nothing the tool might write at startup ends up in the real base directory
+        env = dict(environ)
+        env[ENV_AGNI_BASE_DIR] = baseDir
+        importCmd = [sys.executable, '-c', 'import %s' % TOOL_MODULE]
+        helpCmd = [sys.executable, '%s.py' % TOOL_MODULE, '--help']
+        results = {
+            'python': sys.version.split()[0],
+            'import': summarizeTimings(timeCommand(importCmd, args.runs, env)),
+            'help': summarizeTimings(timeCommand(helpCmd, args.runs, env)),
+        }
+        exe = args.exe or findExecutable()
+        if exe:
+            results['exe'] = summarizeTimings(timeCommand([abspath(exe), '--help'], args.runs, env))
+
+        importsFile = join(baseDir, 'imports.json')
+        subprocess.check_call([sys.executable, '-m', 'agni.startup_benchmark', '--child-imports', importsFile],
+                              env=env, cwd=SOURCE_DIR)
+        with open(importsFile) as fd:
+            results['imports'] = json.load(fd)
+    finally:
+        shutil.rmtree(baseDir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+
+    print '%-32s %8s %8s %8s' % ('startup (sec)', 'min', 'median', 'max')
+    for name, label in (('import', 'import %s' % TOOL_MODULE), ('help', '%s.py --help' % TOOL_MODULE),
+                        ('exe', 'executable --help')):
+        if name in results:
+            r = results[name]
+            print '%-32s %8.3f %8.3f %8.3f' % (label, r['min'], r['median'], r['max'])
+    if 'exe' not in results:
+        print 'No executable found under dist/; build one with pyinstaller or pass --exe'
+
+    imports = results['imports']
+    print
+    print 'Import of %s took %.3f sec; ini file loaded: %s, logging set up: %s' % (
+        TOOL_MODULE, imports['totalSeconds'], imports['configLoadedOnImport'], imports['loggingConfiguredOnImport'])
+    print '%-40s %10s %10s' % ('slowest imports', 'total sec', 'self sec')
+    for module, cumulative, own in imports['modules'][:args.top]:
+        print '%-40s %10.4f %10.4f' % (module, cumulative, own)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+'''
+Watch mode: keeps polling the report directories and, once a new or changed attendee report has
+stopped changing, imports it and regenerates the reports of its webinar only.
+
+    python agni_gcr_attendance.py --watch [--watch-dir "Agni 1234567890" ...]
+
+Python 2 has neither os.scandir nor inotify, so every poll lists the directories and stats the report
+files in them. The state kept covers only the files currently present, so memory stays flat however
+long it runs.
+'''
+import re
+from os import listdir, stat
+from os.path import join, isdir
+from threading import Event
+from time import time
+
+from agni.batch import WebinarJob, processWebinar
+from utils.configuration import agni_configuration
+from utils.logger import flushLogs, getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+ATTENDEE_REPORT_PATTERN = re.compile(r'^(\d+) - Attendee Report.*\.csv$', re.IGNORECASE)
+
+# A webinar that failed is tried again after this many polls even if its files did not change
+FAILED_RETRY_POLLS = 30
+
+
+class WatchedFile(object):
+    __slots__ = ('zoomWebinarId', 'webinarDir', 'fileStat', 'changedAt')
+
+    def __init__(self, zoomWebinarId, webinarDir, fileStat, changedAt):
+        self.zoomWebinarId = zoomWebinarId
+        self.webinarDir = webinarDir
+        self.fileStat = fileStat
+        self.changedAt = changedAt
+
+
+def listWatchDirs(watchDirs):
+    # The directories of the ini file, or every directory under the current one, e.g. new webinars
+    if watchDirs:
+        return watchDirs
+    return sorted(f for f in listdir('.') if isdir(f))
+
+
+class ReportFolderWatcher(object):
+    def __init__(self, watchDirs=None, pollSeconds=None, settleSeconds=None):
+        self.watchDirs = watchDirs if watchDirs is not None else agni_configuration.getAgniWatchDirs()
+        self.pollSeconds = pollSeconds if pollSeconds is not None else agni_configuration.getAgniWatchPollSeconds()
+        self.settleSeconds = (settleSeconds if settleSeconds is not None
+                              else agni_configuration.getAgniWatchSettleSeconds())
+        self._files = {}        # path -> WatchedFile
+        self._processed = {}    # path -> (size, mtime) when last handed to the importer
+        self._retryAt = {}      # (zoomWebinarId, webinarDir) -> poll number to retry a failed webinar at
+        self.polls = 0
+
+    def scan(self, now):
+        # Stats the report files; a file's changedAt moves on whenever its size or mtime changes
+        files = {}
+        for webinarDir in listWatchDirs(self.watchDirs):
+            try:
+                names = listdir(webinarDir)
+            except OSError:
+                _logger.warn('Cannot list directory %s', webinarDir)
+                continue
+            for name in names:
+                m = ATTENDEE_REPORT_PATTERN.match(name)
+                if not m:
+                    continue
+                path = join(webinarDir, name)
+                try:
+                    st = stat(path)
+                except OSError:
+                    # Deleted or renamed since listed
+                    continue
+                fileStat = (st.st_size, st.st_mtime)
+                prev = self._files.get(path)
+                if prev is not None and prev.fileStat == fileStat:
+                    files[path] = prev
+                else:
+                    # A file last written long ago, as on startup, is complete already
+                    files[path] = WatchedFile(m.group(1), webinarDir, fileStat, min(now, st.st_mtime))
+        # Forgets the files that went away
+        self._files = files
+        self._processed = dict((p, s) for p, s in self._processed.iteritems() if p in files)
+
+    def getSettledWebinars(self, now):
+        # {(zoomWebinarId, webinarDir): [paths]} of new or changed files that stopped changing
+        settled = {}
+        for path, wf in self._files.iteritems():
+            if self._processed.get(path) == wf.fileStat or now - wf.changedAt < self.settleSeconds:
+                continue
+            settled.setdefault((wf.zoomWebinarId, wf.webinarDir), []).append(path)
+        for key, retryAt in self._retryAt.items():
+            if retryAt <= self.polls:
+                del self._retryAt[key]
+                settled.setdefault(key, [])
+            elif key in settled:
+                # Not before its retry is due
+                del settled[key]
+        return settled
+
+    def poll(self):
+        # One round: scan, then import and export every webinar with settled files. Returns the results.
+        now = time()
+        self.polls += 1
+        self.scan(now)
+        results = []
+        for (zoomWebinarId, webinarDir), paths in sorted(self.getSettledWebinars(now).iteritems()):
+            _logger.info('Attendee reports of webinar %s changed in %s: %s', zoomWebinarId, webinarDir,
+                         ', '.join(sorted(paths)) or 'retrying')
+            result = processWebinar(WebinarJob(zoomWebinarId, webinarDir))
+            if result.ok:
+                for path in paths:
+                    self._processed[path] = self._files[path].fileStat
+            else:
+                self._retryAt[(zoomWebinarId, webinarDir)] = self.polls + FAILED_RETRY_POLLS
+            results.append(result)
+        if results:
+            flushLogs()
+        return results
+
+    def run(self, stopEvent=None, maxPolls=None):
+        # Polls until stopEvent is set, maxPolls is reached or Ctrl+C
+        stopEvent = stopEvent or Event()
+        _logger.info('Watching %s for attendee reports every %s sec',
+                     ', '.join(self.watchDirs) if self.watchDirs else 'the directories under the current one',
+                     self.pollSeconds)
+        try:
+            while not stopEvent.is_set():
+                try:
+                    self.poll()
+                except Exception:
+                    # Keeps watching; the next poll tries again
+                    _logger.exception('Error watching for attendee reports')
+                if maxPolls is not None and self.polls >= maxPolls:
+                    break
+                stopEvent.wait(self.pollSeconds)
+        except KeyboardInterrupt:
+            _logger.info('Stopped watching')
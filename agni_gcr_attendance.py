@@ -1,28 +1,39 @@
 
-from agni.attendance import exportAttendanceFromDB, cancelDefaulters
+import sys
+from argparse import ArgumentParser
+from multiprocessing import freeze_support
+
+from agni.attendance import exportAttendanceFromDB, cancelDefaulters, rebuildAllAttendanceSummaries
+from agni.batch import WebinarJob, parseWebinarArgument, runBatch, formatBatchSummary, getBatchExitCode
+from agni.db import closeConnection
+from agni.watch import ReportFolderWatcher
 from utils.logger import flushLogs, getAgniLogger
-from utils.configuration import getLogFilePath
+from utils.configuration import agni_configuration, getLogFilePath
+from utils.timing import enableProfiling, logSpanReport, stopProfiling
 from zoom.api import askAndMakeZoomApiToken
 from zoom.attendance_importer import loadAttendeeReportsToDB
 from zoom.common import sanitizeWebinarId
+from zoom.registrant_sync import syncWebinarRegistrantsIfEnabled
 
 
 _logger = getAgniLogger(__name__)
 
-_logger.info('Log file location: %s', getLogFilePath())
-
 def getZoomWebinarIdUserInput():
     flushLogs()
     zoomWebinarId = raw_input("Enter zoom webinar id> ")
     zoomWebinarId = sanitizeWebinarId(zoomWebinarId)
     return zoomWebinarId
 
-def processSingleWebinarId():
+def processSingleWebinarId(forceReimport=False):
     zoomWebinarId = getZoomWebinarIdUserInput()
     _logger.info('Processing zoom webinar id: %s', zoomWebinarId)
-    loadAttendeeReportsToDB(zoomWebinarId)
+    loadAttendeeReportsToDB(zoomWebinarId, forceReimport=forceReimport)
+    syncWebinarRegistrantsIfEnabled(zoomWebinarId)
     exportAttendanceFromDB(zoomWebinarId)
 
+def reprocessSingleWebinarId():
+    processSingleWebinarId(forceReimport=True)
+
 def processDefaulters():
     zoomWebinarId = getZoomWebinarIdUserInput()
     _logger.info('Processing defaulters for zoom webinar id: %s', zoomWebinarId)
@@ -36,9 +47,19 @@ MENU = (
 1. Import attendee reports & generate consolidated attendance report
 2. Cancel webinar registrants who are defaulters
 3. Generate a Zoom API token for use outside this program
+4. Re-import all attendee reports (including already imported ones) & generate consolidated attendance report
+5. Rebuild the attendance summary of all webinars
 Enter choice> '''
 )
 
+MENU_ACTIONS = (
+    'Import & export',
+    'Cancel defaulters',
+    'Zoom API token',
+    'Re-import & export',
+    'Rebuild attendance summary',
+)
+
 def doMenu():
     try:
         choice = int(raw_input(MENU))
@@ -46,13 +67,15 @@ def doMenu():
         print 'Leaving menu'
         return
 
-    if choice not in (1, 2, 3):
+    if choice not in (1, 2, 3, 4, 5):
         print 'Leaving menu'
         return
 
     choice -= 1
-    funcs = [processSingleWebinarId, processDefaulters, askAndMakeZoomApiToken]
+    funcs = [processSingleWebinarId, processDefaulters, askAndMakeZoomApiToken, reprocessSingleWebinarId,
+             rebuildAllAttendanceSummaries]
     funcs[choice]()
+    logSpanReport(MENU_ACTIONS[choice])
 
 
 def doAgainLoop(func, prompt='Do again?'):
@@ -62,18 +85,91 @@ def doAgainLoop(func, prompt='Do again?'):
         yn = raw_input(prompt+' (Y/N) >')
 
 
+def parseArgs(args=None):
+    parser = ArgumentParser(description='Agni Global Classroom - Attendance. '
+                                        'Shows the menu unless webinars are given on the command line.')
+    parser.add_argument('webinars', nargs='*', metavar='WEBINAR',
+                        help="Zoom webinar id to import & export without asking anything, optionally followed by "
+                             "'=DIRECTORY' of its attendee reports. Without a directory, the first one under the "
+                             "current directory having the webinar id in its name is used.")
+    parser.add_argument('--reimport', action='store_true',
+                        help='Re-import all attendee reports of the webinars, including already imported ones')
+    parser.add_argument('--cancel-defaulters', action='store_true',
+                        help='After exporting, cancel the defaulters of the webinars in Zoom without asking')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Webinars processed in parallel; 0 (the default) for the number of CPUs. Only one '
+                             'of them imports reports or syncs registrants at a time; exports run in parallel')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, importing attendee reports as they arrive in the watched directories '
+                             'and regenerating the reports of their webinars')
+    parser.add_argument('--watch-dir', action='append', metavar='DIRECTORY', dest='watch_dirs',
+                        help='With --watch, a directory to watch instead of those of the ini file. Repeatable.')
+    parser.add_argument('--export-formats', metavar='FORMATS',
+                        help='Comma separated report formats: csv, jsonl, columnar. Overrides the ini file.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Log a per-phase timing breakdown after each menu action or webinar')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='With --profile, also run cProfile and write its stats to FILE on exit')
+    parsed = parser.parse_args(args)
+    if parsed.watch and parsed.webinars:
+        parser.error('give either webinars or --watch, not both')
+    try:
+        parsed.webinars = [parseWebinarArgument(w) for w in parsed.webinars]
+    except Exception as e:
+        parser.error(e.args[0])
+    return parsed
+
+
+def runBatchMode(args):
+    jobs = [WebinarJob(zoomWebinarId, webinarDir, forceReimport=args.reimport, cancel=args.cancel_defaulters)
+            for zoomWebinarId, webinarDir in args.webinars]
+    try:
+        results = runBatch(jobs, workers=args.workers, exportFormats=args.export_formats, profile=args.profile)
+    finally:
+        closeConnection()
+        stopProfiling()
+    _logger.info('Batch summary:\n%s', formatBatchSummary(results))
+    flushLogs()
+    return getBatchExitCode(results)
+
+
+def runWatchMode(args):
+    watcher = ReportFolderWatcher(watchDirs=args.watch_dirs)
+    try:
+        watcher.run()
+    finally:
+        closeConnection()
+        stopProfiling()
+        flushLogs()
+
+
 def main():
     # processNoDB()
+    args = parseArgs()
+    _logger.info('Log file location: %s', getLogFilePath())
+    if args.export_formats:
+        agni_configuration.setAgniExportFormats(args.export_formats)
+    if args.profile:
+        enableProfiling(args.profile_output)
+    if args.webinars:
+        sys.exit(runBatchMode(args))
+    if args.watch:
+        runWatchMode(args)
+        return
     try:
         doAgainLoop(doMenu, prompt='Go back to menu?')
     except:
         _logger.exception('Error occurred')
         raise
     finally:
+        closeConnection()
+        stopProfiling()
         flushLogs()
         raw_input('Press <ENTER> key to quit..')
 
 
 if __name__ == '__main__':
+    # Needed by the frozen executable for the import worker processes
+    freeze_support()
     main()
 
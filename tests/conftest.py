@@ -0,0 +1,103 @@
+'''
+The tests run against a temporary base directory, set before the configuration is first read, so the
+ini file, database and reports of the installation are left alone.
+'''
+import shutil
+import sys
+from os import environ, listdir, remove
+from os.path import abspath, dirname, exists, join
+from tempfile import mkdtemp
+
+import pytest
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from utils.configuration import ENV_AGNI_BASE_DIR, SECTION_AGNI, SECTION_SQLITE, SECTION_ZOOM, agni_configuration, \
+    getDbFile, getOutputDir
+
+_baseDir = mkdtemp(prefix='agni-tests-')
+environ[ENV_AGNI_BASE_DIR] = _baseDir
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_baseDir, ignore_errors=True)
+
+
+class RowsWriter(object):
+    # Collects what an export writes
+    def __init__(self):
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(list(row))
+
+
+def _openEmptyDatabase():
+    # The shared connection of agni.db on an empty database, with no reports exported yet
+    from agni.db import getConnection, closeConnection
+    closeConnection()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if exists(getDbFile() + suffix):
+            remove(getDbFile() + suffix)
+    for f in listdir(getOutputDir()):
+        remove(join(getOutputDir(), f))
+    return getConnection()
+
+
+@pytest.fixture
+def freshDatabase():
+    from agni.db import closeConnection
+    yield _openEmptyDatabase()
+    closeConnection()
+
+
+@pytest.fixture(scope='module')
+def moduleDatabase():
+    # One database for all the tests of a module
+    from agni.db import closeConnection
+    yield _openEmptyDatabase()
+    closeConnection()
+
+
+class AgniOptionOverrides(object):
+    # Overrides options of a section, [agni] by default, until restored
+    def __init__(self, section=SECTION_AGNI):
+        self.section = section
+        self.saved = []
+
+    def __call__(self, option, value):
+        self.saved.append((option, agni_configuration.get(self.section, option)))
+        agni_configuration.set(self.section, option, value)
+
+    def restore(self):
+        for option, value in reversed(self.saved):
+            agni_configuration.set(self.section, option, value)
+        self.saved = []
+
+
+@pytest.fixture
+def setAgniOption():
+    overrides = AgniOptionOverrides()
+    yield overrides
+    overrides.restore()
+
+
+@pytest.fixture
+def setSqliteOption():
+    overrides = AgniOptionOverrides(SECTION_SQLITE)
+    yield overrides
+    overrides.restore()
+
+
+@pytest.fixture
+def setZoomOption():
+    overrides = AgniOptionOverrides(SECTION_ZOOM)
+    yield overrides
+    overrides.restore()
+
+
+@pytest.fixture(scope='module')
+def setAgniOptionForModule():
+    overrides = AgniOptionOverrides()
+    yield overrides
+    overrides.restore()
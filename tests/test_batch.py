@@ -0,0 +1,28 @@
+
+from agni.batch import WebinarJob, runBatch
+from agni.db import getConnection
+from zoom.report_generator import ReportGeneratorOptions, generateAttendeeReports
+
+ZOOM_WEBINAR_IDS = ['1111111111', '2222222222', '3333333333', '4444444444']
+CLASSES = 3
+
+
+def testParallelWorkersImportEveryWebinar(freshDatabase, setAgniOption, setSqliteOption, tmpdir):
+    # An import takes longer than a worker waits for the database, so two at once would fail as locked
+    setSqliteOption('busy_timeout_seconds', 0.05)
+    setAgniOption('import_chunk_size', 5)
+    jobs = []
+    for zoomWebinarId in ZOOM_WEBINAR_IDS:
+        webinarDir = str(tmpdir.mkdir(zoomWebinarId))
+        generateAttendeeReports(webinarDir, ReportGeneratorOptions(registrants=2000, classes=CLASSES,
+                                                                   zoomWebinarId=zoomWebinarId,
+                                                                   topic='Webinar %s' % zoomWebinarId))
+        jobs.append(WebinarJob(zoomWebinarId, webinarDir))
+
+    results = runBatch(jobs, workers=len(jobs))
+
+    assert [(r.zoomWebinarId, r.error, r.filesImported) for r in results] == \
+        [(zoomWebinarId, None, CLASSES) for zoomWebinarId in ZOOM_WEBINAR_IDS]
+    classCounts = getConnection().execute('SELECT w.zoom_webinar_id, count(*) FROM webinar_class c '
+                                          'JOIN webinar w ON w.id = c.webinar_id GROUP BY w.zoom_webinar_id')
+    assert dict(classCounts) == dict((zoomWebinarId, CLASSES) for zoomWebinarId in ZOOM_WEBINAR_IDS)
@@ -0,0 +1,65 @@
+import pytest
+
+from agni.attendance import EXPORT_ENGINE_PYTHON, EXPORT_ENGINE_NUMPY, EXPORT_ENGINE_SQL, EXPORT_ENGINE_SUMMARY, \
+    getEmailWiseAttendanceGenerator, exportAttendanceFromDB
+from agni.attendance_matrix import isMatrixEngineAvailable
+from agni.db import transaction
+from agni.registrant_mirror import applyRegistrantPages
+from conftest import RowsWriter
+from zoom.attendance_importer import loadAttendeeReportsToDB
+from zoom.registrant_sync import getWebinarId
+from zoom.report_generator import ReportGeneratorOptions, generateAttendeeReports
+
+ZOOM_WEBINAR_ID = '1234567890'
+
+
+@pytest.fixture(scope='module')
+def webinarCnx(moduleDatabase, tmpdir_factory):
+    cnx = moduleDatabase
+    reportsDir = str(tmpdir_factory.mktemp('reports'))
+    generateAttendeeReports(reportsDir, ReportGeneratorOptions(registrants=300, classes=8, seed=3))
+    loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    # Approved Zoom registrants who never joined a class, registered at various points of the course
+    registrants = [{'email': 'never%02d@example.com' % i, 'id': 'z%02d' % i,
+                    'create_time': '2020-05-%02dT00:00:00Z' % (i + 1)} for i in xrange(6)]
+    with transaction(cnx):
+        applyRegistrantPages(cnx, getWebinarId(cnx, ZOOM_WEBINAR_ID), 'approved', [registrants], len(registrants))
+    # Exports must not depend on what the planner does with fresh statistics
+    cnx.execute('ANALYZE')
+    return cnx
+
+
+def exportRows(cnx, engine, defaultDays):
+    attendanceWriter = RowsWriter()
+    defaultersWriter = RowsWriter()
+    generate = getEmailWiseAttendanceGenerator(engine)
+    generate(cnx, ZOOM_WEBINAR_ID, attendanceWriter, defaultersWriter, defaultDays=defaultDays, chunkSize=50)
+    return attendanceWriter.rows, defaultersWriter.rows
+
+
+def testPythonEngineExportsEveryRegistrant(webinarCnx):
+    attendance, defaulters = exportRows(webinarCnx, EXPORT_ENGINE_PYTHON, 4)
+    assert len(attendance[0]) == 1 + 8
+    emails = [row[0] for row in attendance[1:]]
+    assert emails == sorted(emails)
+    assert 'never00@example.com' in emails
+    assert 1 < len(defaulters) < len(attendance)
+
+
+@pytest.mark.parametrize('defaultDays', [0, 1, 4])
+@pytest.mark.parametrize('engine', [EXPORT_ENGINE_SQL, EXPORT_ENGINE_NUMPY, EXPORT_ENGINE_SUMMARY])
+def testEngineMatchesPythonEngine(webinarCnx, engine, defaultDays):
+    if engine == EXPORT_ENGINE_NUMPY and not isMatrixEngineAvailable():
+        pytest.skip('numpy is not installed')
+    assert exportRows(webinarCnx, engine, defaultDays) == exportRows(webinarCnx, EXPORT_ENGINE_PYTHON, defaultDays)
+
+
+def testExportWithAnotherChunkSizeIsNotCached(webinarCnx, setAgniOption):
+    def exportChunkSize(chunkSize):
+        setAgniOption('export_chunk_size', chunkSize)
+        exportAttendanceFromDB(ZOOM_WEBINAR_ID, formats='csv')
+        return webinarCnx.execute('SELECT export_chunk_size FROM webinar_export').fetchone()[0]
+
+    assert exportChunkSize(50) == 50
+    # Only written again when the cached files cannot be reused
+    assert exportChunkSize(70) == 70
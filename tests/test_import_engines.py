@@ -0,0 +1,149 @@
+import csv
+import logging
+from datetime import datetime
+from os import listdir, rename
+from os.path import join
+
+import pytest
+
+from agni.attendance import exportAttendanceFromDB, getOutputFilePath, getDefaultersFilePath, isDefaulter
+from zoom.attendance_importer import loadAttendeeReportsToDB
+from zoom.report_generator import ReportGeneratorOptions, generateAttendeeReports, getReportFileName
+from zoom.report_parser import ZOOM_REGISTRATION_DATETIME_FORMAT, INTERNAL_DATETIME_FORMAT, \
+    SECTION_ATTENDEE_DETAILS, SECTION_OTHER_ATTENDED
+
+ZOOM_WEBINAR_ID = '1234567890'
+DEFAULT_DAYS = 3
+
+# [agni] options of each way to import; the exports must come out the same for all of them
+IMPORT_SETTINGS = {
+    'row': {},
+    'bulk': {'import_engine': 'bulk'},
+    'row-chunk-1': {'import_chunk_size': 1},
+    'row-chunk-7': {'import_chunk_size': 7},
+    'bulk-chunk-1': {'import_engine': 'bulk', 'import_chunk_size': 1},
+    'row-parallel': {'import_workers': 3},
+    'bulk-parallel': {'import_engine': 'bulk', 'import_workers': 3, 'import_chunk_size': 5},
+}
+
+
+# With one class, nothing in a later report fixes what the rows of the first got wrong
+@pytest.fixture(scope='module', params=[1, 6], ids=['1-class', '6-classes'])
+def reportsDir(request, tmpdir_factory):
+    reportsDir = str(tmpdir_factory.mktemp('reports'))
+    generateAttendeeReports(reportsDir, ReportGeneratorOptions(registrants=200, classes=request.param,
+                                                               duplicateRate=0.3, seed=7))
+    return reportsDir
+
+
+class ExpectedImport(object):
+    # What importing the reports must give, worked out from the csv files directly
+    def __init__(self, reportsDir):
+        self.reportFiles = sorted(join(reportsDir, f) for f in listdir(reportsDir))
+        self.attended = {}          # email -> {class index: 'Yes' or 'No'}
+        self.registered = {}        # email -> earliest internal registration datetime
+        self.mergedYes = 0          # 'No' rows followed by a 'Yes' row of the same class
+        self.mergedRegistered = 0   # rows followed by an earlier registration time
+        for classIndex, reportFile in enumerate(self.reportFiles):
+            for email, attended, registered in self._iterAttendeeRows(reportFile):
+                classAttended = self.attended.setdefault(email, {})
+                if classAttended.get(classIndex) == 'No' and attended == 'Yes':
+                    self.mergedYes += 1
+                if classAttended.get(classIndex) != 'Yes':
+                    classAttended[classIndex] = attended
+                if email in self.registered and self.registered[email] > registered:
+                    self.mergedRegistered += 1
+                self.registered[email] = min(registered, self.registered.get(email, registered))
+
+    def _iterAttendeeRows(self, reportFile):
+        with open(reportFile, 'rb') as fd:
+            rows = list(csv.reader(fd))
+        start = rows.index([SECTION_ATTENDEE_DETAILS]) + 2
+        end = rows.index([SECTION_OTHER_ATTENDED])
+        for row in rows[start:end]:
+            registered = datetime.strptime(row[8], ZOOM_REGISTRATION_DATETIME_FORMAT)
+            yield row[4].strip().lower(), row[0], registered.strftime(INTERNAL_DATETIME_FORMAT)
+
+    def getAttendanceRows(self):
+        return [[email] + [self.attended[email].get(i, 'NA') for i in xrange(len(self.reportFiles))]
+                for email in sorted(self.attended)]
+
+    def getDefaulterRows(self):
+        return [[row[0]] for row in self.getAttendanceRows() if isDefaulter(row[1:], days=DEFAULT_DAYS)]
+
+
+@pytest.fixture(scope='module')
+def expectedImport(reportsDir):
+    return ExpectedImport(reportsDir)
+
+
+def readCsv(path):
+    with open(path, 'rb') as fd:
+        return fd.read()
+
+
+def importAndExport(reportsDir):
+    loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    exportAttendanceFromDB(ZOOM_WEBINAR_ID, formats='csv', useCache=False)
+    return readCsv(getOutputFilePath(ZOOM_WEBINAR_ID)), readCsv(getDefaultersFilePath(ZOOM_WEBINAR_ID))
+
+
+@pytest.fixture(scope='module')
+def referenceExport(moduleDatabase, reportsDir, setAgniOptionForModule):
+    setAgniOptionForModule('attendance_default_days', DEFAULT_DAYS)
+    return importAndExport(reportsDir)
+
+
+def testGeneratedReportsNeedMerging(expectedImport):
+    assert expectedImport.mergedYes > 0
+    assert expectedImport.mergedRegistered > 0
+
+
+def testReferenceExportMatchesReports(referenceExport, expectedImport):
+    attendanceCsv, defaultersCsv = referenceExport
+    attendanceRows = list(csv.reader(attendanceCsv.splitlines()))
+    assert len(attendanceRows[0]) == 1 + len(expectedImport.reportFiles)
+    assert attendanceRows[1:] == expectedImport.getAttendanceRows()
+    assert list(csv.reader(defaultersCsv.splitlines())) == [['Email']] + expectedImport.getDefaulterRows()
+
+
+@pytest.mark.parametrize('settings', sorted(IMPORT_SETTINGS))
+def testImportSettingsExportTheSame(freshDatabase, setAgniOption, reportsDir, expectedImport, referenceExport,
+                                    settings):
+    setAgniOption('attendance_default_days', DEFAULT_DAYS)
+    for option, value in IMPORT_SETTINGS[settings].iteritems():
+        setAgniOption(option, value)
+
+    assert importAndExport(reportsDir) == referenceExport
+
+    registered = dict(freshDatabase.execute('SELECT email, internal_registration_datetime FROM webinar_registrant'))
+    assert registered == expectedImport.registered
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def testReportsAreImportedInClassDateOrder(freshDatabase, setAgniOption, tmpdir, workers):
+    setAgniOption('import_workers', workers)
+    opts = ReportGeneratorOptions(registrants=20, classes=4)
+    reportsDir = str(tmpdir.mkdir('reports'))
+    paths = generateAttendeeReports(reportsDir, opts)
+    # File names in the reverse order of the class dates
+    for classIndex, path in enumerate(paths):
+        rename(path, join(reportsDir, 'x' + getReportFileName(opts.zoomWebinarId, len(paths) - 1 - classIndex)))
+    for f in listdir(reportsDir):
+        rename(join(reportsDir, f), join(reportsDir, f[1:]))
+
+    loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+
+    # Classes get their ids as their reports are imported
+    classDates = [r[0] for r in freshDatabase.execute('SELECT internal_datetime FROM webinar_class ORDER BY id')]
+    assert len(classDates) == 4
+    assert classDates == sorted(classDates)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def testCleanImportLogsNoErrors(freshDatabase, setAgniOption, reportsDir, caplog, workers):
+    setAgniOption('import_workers', workers)
+
+    loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+
+    assert [r.getMessage() for r in caplog.records if r.levelno >= logging.ERROR] == []
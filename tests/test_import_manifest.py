@@ -0,0 +1,57 @@
+import shutil
+from os.path import join
+
+import pytest
+
+from zoom.attendance_importer import loadAttendeeReportsToDB
+from zoom.report_generator import ReportGeneratorOptions, generateAttendeeReports
+from zoom.report_parser import SECTION_OTHER_ATTENDED
+
+ZOOM_WEBINAR_ID = '1234567890'
+
+
+@pytest.fixture
+def reportsDir(tmpdir):
+    reportsDir = str(tmpdir.mkdir('reports'))
+    generateAttendeeReports(reportsDir, ReportGeneratorOptions(registrants=50, classes=3))
+    return reportsDir
+
+
+def getAttendanceCounts(cnx):
+    return cnx.execute('SELECT webinar_class_id, COUNT(*) FROM attendance GROUP BY webinar_class_id').fetchall()
+
+
+def testUnchangedReportsAreNotImportedAgain(freshDatabase, reportsDir):
+    assert loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir) == 3
+    assert loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir) == 0
+
+
+def testCopyOfImportedReportIsRecorded(freshDatabase, reportsDir):
+    loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    report = join(reportsDir, '1234567890 - Attendee Report 0001.csv')
+    copy = join(reportsDir, '1234567890 - Attendee Report 0001 copy.csv')
+    shutil.copy2(report, copy)
+
+    assert loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir) == 0
+    rows = freshDatabase.execute('SELECT file_path, webinar_class_id FROM import_manifest').fetchall()
+    classIds = dict(rows)
+    assert len(rows) == 4
+    assert classIds[copy] == classIds[report]
+
+
+def testFailedImportOfChangedReportKeepsItsClass(freshDatabase, reportsDir):
+    loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    before = getAttendanceCounts(freshDatabase)
+
+    # An attendee row with a registration time that cannot be parsed
+    report = join(reportsDir, '1234567890 - Attendee Report 0002.csv')
+    with open(report, 'rb') as fd:
+        lines = fd.read().splitlines()
+    lines.insert(lines.index(SECTION_OTHER_ATTENDED),
+                 'Yes,X Y,X,Y,bad@example.com,Chennai,India,,not a time,approved,--,--,,India')
+    with open(report, 'wb') as fd:
+        fd.write('\r\n'.join(lines) + '\r\n')
+
+    with pytest.raises(ValueError):
+        loadAttendeeReportsToDB(ZOOM_WEBINAR_ID, webinarDir=reportsDir)
+    assert getAttendanceCounts(freshDatabase) == before
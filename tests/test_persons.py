@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from agni.analytics import getPersonWebinarAttendance
+from zoom.attendance_importer import loadAttendeeReportsToDB
+from zoom.report_generator import ReportGeneratorOptions, generateAttendeeReports
+
+
+@pytest.fixture
+def twoWebinarsCnx(freshDatabase, tmpdir):
+    # The generator names registrants the same way for every webinar, so most register for both
+    for zoomWebinarId, topic, registrants in (('111-111-1111', 'Course A', 30), ('222-222-2222', 'Course B', 40)):
+        reportsDir = str(tmpdir.mkdir(topic))
+        generateAttendeeReports(reportsDir, ReportGeneratorOptions(registrants=registrants, classes=3,
+                                                                   zoomWebinarId=zoomWebinarId, topic=topic))
+        loadAttendeeReportsToDB(zoomWebinarId.replace('-', ''), webinarDir=reportsDir)
+    return freshDatabase
+
+
+def testRegistrantsOfAnEmailShareOnePerson(twoWebinarsCnx):
+    rows = twoWebinarsCnx.execute('''
+        SELECT wr.email, p.email, COUNT(*)
+        FROM webinar_registrant wr INNER JOIN person p ON (p.id = wr.person_id)
+        GROUP BY wr.person_id
+    ''').fetchall()
+    assert rows
+    assert all(registrantEmail == personEmail for registrantEmail, personEmail, _ in rows)
+    assert twoWebinarsCnx.execute('SELECT COUNT(*) FROM webinar_registrant WHERE person_id IS NULL').fetchone() == (0,)
+    assert max(count for _, _, count in rows) == 2
+    assert len(getPersonWebinarAttendance(twoWebinarsCnx, rows[0][0])) == rows[0][2]
+
+
+@pytest.mark.parametrize('update', [
+    "UPDATE webinar_registrant SET email = 'someone.else@example.com'",
+    'UPDATE webinar_registrant SET person_id = person_id + 1',
+])
+def testRegistrantIdentityCannotChange(twoWebinarsCnx, update):
+    with pytest.raises(sqlite3.IntegrityError):
+        twoWebinarsCnx.execute(update + ' WHERE id = (SELECT MIN(id) FROM webinar_registrant)')
+    twoWebinarsCnx.rollback()
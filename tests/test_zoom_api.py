@@ -0,0 +1,120 @@
+from argparse import ArgumentParser
+from time import time
+
+import pytest
+
+from zoom.api import ZoomApi, ZoomApiError, ACTION_CANCEL, MAX_REGISTRANTS_PER_CALL, getFailedRegistrants
+from zoom.rate_limiter import TokenBucket
+from zoom.standin_server import addStandInArguments, makeStandInServer
+
+ZOOM_WEBINAR_ID = '1234567890'
+
+
+@pytest.fixture
+def zoomApiFor(setZoomOption):
+    # Starts a stand-in made from standin_server command line arguments and returns a ZoomApi using it
+    servers = []
+    apis = []
+
+    def makeZoomApi(*standInArgs, **zoomOptions):
+        parser = ArgumentParser()
+        addStandInArguments(parser)
+        server = makeStandInServer(parser.parse_args(list(standInArgs))).start()
+        servers.append(server)
+        setZoomOption('api_base_url', server.baseUrl)
+        setZoomOption('api_token', '')
+        setZoomOption('rate_limit_per_second', 0)
+        setZoomOption('retry_backoff_seconds', 0.001)
+        for option, value in zoomOptions.iteritems():
+            setZoomOption(option, value)
+        za = ZoomApi()
+        apis.append(za)
+        return za, server
+
+    yield makeZoomApi
+    for za in apis:
+        za.close()
+    for server in servers:
+        server.stop()
+
+
+def testTransientErrorsAreRetried(zoomApiFor):
+    za, server = zoomApiFor('--registrants', '500', '--rate-429', '0.3', '--rate-5xx', '0.3', '--retry-after', '0',
+                            '--seed', '5', max_retries=20)
+
+    registrants = list(za.iterWebinarRegistrants(ZOOM_WEBINAR_ID, page_size=30, prefetch=False))
+
+    assert len(registrants) == 500
+    stats = server.stats.asDict()
+    assert stats['injected429'] > 0 and stats['injected5xx'] > 0
+    assert za.retryCount == stats['injected429'] + stats['injected5xx']
+    assert za.requestCount == stats['requests']
+
+
+@pytest.mark.parametrize('fault, statusCode', [('--rate-429', 429), ('--rate-5xx', 503)])
+def testGivesUpWhenRetriesRunOut(zoomApiFor, fault, statusCode):
+    za, server = zoomApiFor(fault, '1', '--retry-after', '0', max_retries=3)
+
+    with pytest.raises(ZoomApiError) as e:
+        za.getWebinarRegistrants(ZOOM_WEBINAR_ID)
+
+    assert e.value.args[1] == statusCode
+    assert za.requestCount == 4
+    assert za.retryCount == 3
+
+
+def testRetryAfterLongerThanMaxWaitIsNotWaitedFor(zoomApiFor):
+    za, server = zoomApiFor('--rate-429', '1', '--retry-after', '120', retry_max_wait_seconds=60)
+
+    with pytest.raises(ZoomApiError):
+        za.getWebinarRegistrants(ZOOM_WEBINAR_ID)
+
+    assert za.requestCount == 1
+
+
+def testFailedBatchesAreListedForRetrying(zoomApiFor):
+    za, server = zoomApiFor('--registrants', '300', '--rate-5xx', '0.5', '--seed', '3', max_retries=0)
+    registrants = [{'email': r['email']} for r in server.webinars.listRegistrants(ZOOM_WEBINAR_ID, 'approved')]
+
+    results = za.updateWebinarRegistrantsStatusInBatches(ZOOM_WEBINAR_ID, ACTION_CANCEL, registrants, workers=4)
+
+    assert [r.batchIndex for r in results] == range(len(registrants) // MAX_REGISTRANTS_PER_CALL)
+    assert 0 < sum(1 for r in results if not r.ok) < len(results)
+    assert all(r.statusCode == 503 for r in results if not r.ok)
+    # Exactly the registrants of the failed batches are still approved
+    failed = getFailedRegistrants(results)
+    stillApproved = server.webinars.listRegistrants(ZOOM_WEBINAR_ID, 'approved')
+    assert sorted(r['email'] for r in failed) == sorted(r['email'] for r in stillApproved)
+
+
+def testTokenBucketLimitsTheRateAfterABurst():
+    bucket = TokenBucket(rate=100, capacity=5)
+    startTime = time()
+    for _ in xrange(5):
+        bucket.acquire()
+    assert time() - startTime < 0.05
+    for _ in xrange(10):
+        bucket.acquire()
+    assert time() - startTime >= 0.09
+
+
+@pytest.mark.parametrize('pageSize', [25, 300])
+def testPrefetchListsTheSameRegistrants(zoomApiFor, pageSize):
+    za, server = zoomApiFor('--registrants', '250')
+
+    prefetched = list(za.iterWebinarRegistrants(ZOOM_WEBINAR_ID, page_size=pageSize, prefetch=True))
+
+    assert prefetched == list(za.iterWebinarRegistrants(ZOOM_WEBINAR_ID, page_size=pageSize, prefetch=False))
+    assert prefetched == server.webinars.listRegistrants(ZOOM_WEBINAR_ID, 'approved')
+
+
+def testPrefetchStopsWithTheCaller(zoomApiFor):
+    za, server = zoomApiFor('--registrants', '250')
+
+    pages = za.iterWebinarRegistrantPages(ZOOM_WEBINAR_ID, page_size=10, prefetch=True)
+    firstPage = next(pages)
+    pages.close()
+
+    assert len(firstPage) == 10
+    # The first page and at most the one fetched ahead of it
+    assert za.requestCount <= 2
@@ -1,8 +1,9 @@
 from ConfigParser import ConfigParser
 from os.path import dirname, abspath, join, exists
 
-from os import getcwd, makedirs
+from os import getcwd, makedirs, environ
 from sys import argv
+from threading import Lock
 
 PROP_ZOOM_API_BASE_URL = 'api_base_url'
 
@@ -10,27 +11,88 @@ PROP_ZOOM_API_TOKEN = 'api_token'
 PROP_ZOOM_API_KEY = 'api_key'
 PROP_ZOOM_API_SECRET = 'api_secret'
 
+PROP_ZOOM_CONNECT_TIMEOUT = 'connect_timeout_seconds'
+PROP_ZOOM_READ_TIMEOUT = 'read_timeout_seconds'
+PROP_ZOOM_MAX_RETRIES = 'max_retries'
+PROP_ZOOM_RETRY_BACKOFF = 'retry_backoff_seconds'
+PROP_ZOOM_RETRY_MAX_WAIT = 'retry_max_wait_seconds'
+PROP_ZOOM_POOL_SIZE = 'pool_size'
+PROP_ZOOM_STATUS_UPDATE_WORKERS = 'status_update_workers'
+PROP_ZOOM_RATE_LIMIT = 'rate_limit_per_second'
+PROP_ZOOM_RATE_LIMIT_BURST = 'rate_limit_burst'
+PROP_ZOOM_SYNC_REGISTRANTS = 'sync_registrants'
+PROP_ZOOM_REGISTRANT_SYNC_MAX_AGE = 'registrant_sync_max_age_hours'
+
 SECTION_ZOOM = 'zoom'
 
 PROP_AGNI_ATT_DEFAULT_DAYS = 'attendance_default_days'
+PROP_AGNI_IMPORT_ENGINE = 'import_engine'
+PROP_AGNI_IMPORT_WORKERS = 'import_workers'
+PROP_AGNI_IMPORT_CHUNK_SIZE = 'import_chunk_size'
+PROP_AGNI_EXPORT_ENGINE = 'export_engine'
+PROP_AGNI_EXPORT_FORMATS = 'export_formats'
+PROP_AGNI_EXPORT_CHUNK_SIZE = 'export_chunk_size'
+PROP_AGNI_LOG_VERBOSE_PAYLOADS = 'log_verbose_payloads'
+PROP_AGNI_LOG_PAYLOAD_ITEMS = 'log_payload_items'
+PROP_AGNI_WATCH_DIRS = 'watch_dirs'
+PROP_AGNI_WATCH_POLL_SECONDS = 'watch_poll_seconds'
+PROP_AGNI_WATCH_SETTLE_SECONDS = 'watch_settle_seconds'
 
 SECTION_AGNI = 'agni'
 
+PROP_SQLITE_JOURNAL_MODE = 'journal_mode'
+PROP_SQLITE_SYNCHRONOUS = 'synchronous'
+PROP_SQLITE_CACHE_SIZE = 'cache_size'
+PROP_SQLITE_MMAP_SIZE = 'mmap_size'
+PROP_SQLITE_TEMP_STORE = 'temp_store'
+PROP_SQLITE_CACHED_STATEMENTS = 'cached_statements'
+PROP_SQLITE_BUSY_TIMEOUT = 'busy_timeout_seconds'
+
+SQLITE_PRAGMAS = (
+    PROP_SQLITE_JOURNAL_MODE,
+    PROP_SQLITE_SYNCHRONOUS,
+    PROP_SQLITE_CACHE_SIZE,
+    PROP_SQLITE_MMAP_SIZE,
+    PROP_SQLITE_TEMP_STORE,
+)
 
-def getBaseDir():
+SECTION_SQLITE = 'sqlite'
+
+# Overrides the directory holding the ini file, database, logs and output, e.g. for benchmarks
+ENV_AGNI_BASE_DIR = 'AGNI_BASE_DIR'
+
+
+# Paths worked out once per process by the accessors below
+_baseDir = None
+_madeDirs = set()
+
+
+def _findBaseDir():
+    if environ.get(ENV_AGNI_BASE_DIR):
+        return abspath(environ[ENV_AGNI_BASE_DIR])
     runningFile = argv[0]
     if runningFile.lower().endswith('agni_gcr_attendance.exe'):
-        bd = abspath(dirname(runningFile))
-        print 'Got basedir:', bd
-        return bd
+        return abspath(dirname(runningFile))
     try:
-        bd = abspath(dirname(dirname(__file__)))
-        print 'Got basedir:', bd
-        return bd
+        return abspath(dirname(dirname(__file__)))
     except:
-        bd = abspath(getcwd())
-        print 'Got basedir:', bd
-        return bd
+        return abspath(getcwd())
+
+
+def getBaseDir():
+    global _baseDir
+    if _baseDir is None:
+        _baseDir = _findBaseDir()
+        print 'Got basedir:', _baseDir
+    return _baseDir
+
+
+def _makeDirOnce(path):
+    if path not in _madeDirs:
+        if not exists(path):
+            makedirs(path)
+        _madeDirs.add(path)
+    return path
 
 
 def getLogsDir():
@@ -38,18 +100,12 @@ def getLogsDir():
 
 
 def getLogFilePath():
-    logsDir = getLogsDir()
-    if not exists(logsDir):
-        makedirs(logsDir)
     filename = 'agni_gcr_attendance.log'
-    return join(logsDir, filename)
+    return join(_makeDirOnce(getLogsDir()), filename)
 
 
 def getOutputDir():
-    outputDir = join(getBaseDir(), 'output')
-    if not exists(outputDir):
-        makedirs(outputDir)
-    return outputDir
+    return _makeDirOnce(join(getBaseDir(), 'output'))
 
 def getConfigFile():
     return join(getBaseDir(), 'agni-gcr.ini')
@@ -62,6 +118,28 @@ DEFAULT_CONFIG = (
     (
         SECTION_AGNI, (
             (PROP_AGNI_ATT_DEFAULT_DAYS, 4),
+            (PROP_AGNI_IMPORT_ENGINE, 'row'),
+            (PROP_AGNI_IMPORT_WORKERS, 1),
+            (PROP_AGNI_IMPORT_CHUNK_SIZE, 10000),
+            (PROP_AGNI_EXPORT_ENGINE, 'python'),
+            (PROP_AGNI_EXPORT_FORMATS, 'csv'),
+            (PROP_AGNI_EXPORT_CHUNK_SIZE, 1000),
+            (PROP_AGNI_LOG_VERBOSE_PAYLOADS, 'no'),
+            (PROP_AGNI_LOG_PAYLOAD_ITEMS, 3),
+            (PROP_AGNI_WATCH_DIRS, ''),
+            (PROP_AGNI_WATCH_POLL_SECONDS, 10),
+            (PROP_AGNI_WATCH_SETTLE_SECONDS, 30),
+        ),
+    ),
+    (
+        SECTION_SQLITE, (
+            (PROP_SQLITE_JOURNAL_MODE, 'WAL'),
+            (PROP_SQLITE_SYNCHRONOUS, 'NORMAL'),
+            (PROP_SQLITE_CACHE_SIZE, -65536), # Negative is in KiB, i.e. 64 MiB
+            (PROP_SQLITE_MMAP_SIZE, 268435456),
+            (PROP_SQLITE_TEMP_STORE, 'MEMORY'),
+            (PROP_SQLITE_CACHED_STATEMENTS, 256),
+            (PROP_SQLITE_BUSY_TIMEOUT, 30),
         ),
     ),
     (
@@ -70,10 +148,30 @@ DEFAULT_CONFIG = (
             (PROP_ZOOM_API_KEY, 'ffffffffffffffff'),
             (PROP_ZOOM_API_SECRET, 'ffffffffffffffff'),
             (PROP_ZOOM_API_BASE_URL, 'https://api.zoom.us/v2/'),
+            (PROP_ZOOM_CONNECT_TIMEOUT, 10),
+            (PROP_ZOOM_READ_TIMEOUT, 30),
+            (PROP_ZOOM_MAX_RETRIES, 5),
+            (PROP_ZOOM_RETRY_BACKOFF, 1),
+            (PROP_ZOOM_RETRY_MAX_WAIT, 60),
+            (PROP_ZOOM_POOL_SIZE, 10),
+            (PROP_ZOOM_STATUS_UPDATE_WORKERS, 4),
+            (PROP_ZOOM_RATE_LIMIT, 10),
+            (PROP_ZOOM_RATE_LIMIT_BURST, 10),
+            (PROP_ZOOM_SYNC_REGISTRANTS, 'no'),
+            (PROP_ZOOM_REGISTRANT_SYNC_MAX_AGE, 24),
         ),
     ),
 )
 
+def getDefaultConfigValue(section, option):
+    for s, props in DEFAULT_CONFIG:
+        if s != section:
+            continue
+        for o, value in props:
+            if o == option:
+                return str(value)
+    return None
+
 def generateDefaultConfig():
     cfg = ConfigParser()
     for section, props in DEFAULT_CONFIG:
@@ -104,20 +202,93 @@ def loadOrCreateConfigFile():
 
 class AgniConfiguration:
     def __init__(self):
-        self._cfg = loadOrCreateConfigFile()
+        # The ini file is read, or written with the defaults, on first use rather than on import
+        self._loadedCfg = None
+        self._loadLock = Lock()
+
+    @property
+    def _cfg(self):
+        if self._loadedCfg is None:
+            with self._loadLock:
+                if self._loadedCfg is None:
+                    self._loadedCfg = loadOrCreateConfigFile()
+        return self._loadedCfg
+
+    def isLoaded(self):
+        return self._loadedCfg is not None
 
     def get(self, section, option):
-        return self._cfg.get(section, option)
+        # Options added in newer versions may be missing from an older ini file
+        cfg = self._cfg
+        if not cfg.has_option(section, option):
+            return getDefaultConfigValue(section, option)
+        return cfg.get(section, option)
+
+    def set(self, section, option, value):
+        # Overrides an option for this run only; the ini file is left as it is
+        cfg = self._cfg
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+        cfg.set(section, option, str(value))
 
     def getAgniOption(self, option):
-        return self._cfg.get(SECTION_AGNI, option)
+        return self.get(SECTION_AGNI, option)
 
     def getZoomOption(self, option):
-        return self._cfg.get(SECTION_ZOOM, option)
+        return self.get(SECTION_ZOOM, option)
+
+    def getSqliteOption(self, option):
+        return self.get(SECTION_SQLITE, option)
 
     def getAgniAttendanceDefaultDays(self):
         return int(self.getAgniOption(PROP_AGNI_ATT_DEFAULT_DAYS))
 
+    def getAgniImportEngine(self):
+        return self.getAgniOption(PROP_AGNI_IMPORT_ENGINE).strip().lower()
+
+    def getAgniImportWorkers(self):
+        return int(self.getAgniOption(PROP_AGNI_IMPORT_WORKERS))
+
+    def getAgniImportChunkSize(self):
+        return int(self.getAgniOption(PROP_AGNI_IMPORT_CHUNK_SIZE))
+
+    def getAgniExportEngine(self):
+        return self.getAgniOption(PROP_AGNI_EXPORT_ENGINE).strip().lower()
+
+    def getAgniExportFormats(self):
+        return self.getAgniOption(PROP_AGNI_EXPORT_FORMATS)
+
+    def setAgniExportFormats(self, formats):
+        self.set(SECTION_AGNI, PROP_AGNI_EXPORT_FORMATS, formats)
+
+    def getAgniExportChunkSize(self):
+        return int(self.getAgniOption(PROP_AGNI_EXPORT_CHUNK_SIZE))
+
+    def getAgniLogVerbosePayloads(self):
+        return self.getAgniOption(PROP_AGNI_LOG_VERBOSE_PAYLOADS).strip().lower() in ('1', 'yes', 'true', 'on')
+
+    def getAgniLogPayloadItems(self):
+        return int(self.getAgniOption(PROP_AGNI_LOG_PAYLOAD_ITEMS))
+
+    def getAgniWatchDirs(self):
+        # Empty means every directory under the current one
+        return [d.strip() for d in self.getAgniOption(PROP_AGNI_WATCH_DIRS).split(',') if d.strip()]
+
+    def getAgniWatchPollSeconds(self):
+        return float(self.getAgniOption(PROP_AGNI_WATCH_POLL_SECONDS))
+
+    def getAgniWatchSettleSeconds(self):
+        return float(self.getAgniOption(PROP_AGNI_WATCH_SETTLE_SECONDS))
+
+    def getSqlitePragmas(self):
+        return [(p, self.getSqliteOption(p).strip()) for p in SQLITE_PRAGMAS]
+
+    def getSqliteCachedStatements(self):
+        return int(self.getSqliteOption(PROP_SQLITE_CACHED_STATEMENTS))
+
+    def getSqliteBusyTimeout(self):
+        return float(self.getSqliteOption(PROP_SQLITE_BUSY_TIMEOUT))
+
     def getZoomApiBaseUrl(self):
         return self.getZoomOption(PROP_ZOOM_API_BASE_URL)
 
@@ -130,6 +301,38 @@ class AgniConfiguration:
     def getZoomApiSecret(self):
         return self.getZoomOption(PROP_ZOOM_API_SECRET)
 
+    def getZoomApiTimeouts(self):
+        # (connect, read) as accepted by requests
+        return (float(self.getZoomOption(PROP_ZOOM_CONNECT_TIMEOUT)),
+                float(self.getZoomOption(PROP_ZOOM_READ_TIMEOUT)))
+
+    def getZoomApiMaxRetries(self):
+        return int(self.getZoomOption(PROP_ZOOM_MAX_RETRIES))
+
+    def getZoomApiRetryBackoff(self):
+        return float(self.getZoomOption(PROP_ZOOM_RETRY_BACKOFF))
+
+    def getZoomApiRetryMaxWait(self):
+        return float(self.getZoomOption(PROP_ZOOM_RETRY_MAX_WAIT))
+
+    def getZoomApiPoolSize(self):
+        return int(self.getZoomOption(PROP_ZOOM_POOL_SIZE))
+
+    def getZoomStatusUpdateWorkers(self):
+        return int(self.getZoomOption(PROP_ZOOM_STATUS_UPDATE_WORKERS))
+
+    def getZoomApiRateLimit(self):
+        return float(self.getZoomOption(PROP_ZOOM_RATE_LIMIT))
+
+    def getZoomApiRateLimitBurst(self):
+        return int(self.getZoomOption(PROP_ZOOM_RATE_LIMIT_BURST))
+
+    def getZoomSyncRegistrants(self):
+        return self.getZoomOption(PROP_ZOOM_SYNC_REGISTRANTS).strip().lower() in ('1', 'yes', 'true', 'on')
+
+    def getZoomRegistrantSyncMaxAgeHours(self):
+        return float(self.getZoomOption(PROP_ZOOM_REGISTRANT_SYNC_MAX_AGE))
+
 if __name__ == '__main__':
     print 'Nothing to run'
 else:
@@ -1,13 +1,20 @@
 import sys
-from logging import getLogger, DEBUG, Formatter, basicConfig, StreamHandler, INFO
+from itertools import islice
+from logging import getLogger, DEBUG, Formatter, basicConfig, StreamHandler, INFO, Handler
 from logging.handlers import TimedRotatingFileHandler
+from threading import Lock
+
+from utils.queue_logging import makeQueueHandler
 
 def addFileHandler(filepath):
+    # The file gets written by a background thread, through a queue
     rootLogger = getLogger()
     fh = TimedRotatingFileHandler(filepath, when='midnight')
     fh.setLevel(DEBUG)
     fh.setFormatter(Formatter(fmt='%(asctime)s %(levelname)-9.9s %(message)s', datefmt='%d-%b-%Y %H:%M:%S'))
-    rootLogger.addHandler(fh)
+    qh = makeQueueHandler(fh)
+    qh.setLevel(DEBUG)
+    rootLogger.addHandler(qh)
     return fh
 
 
@@ -19,15 +26,68 @@ def _configureLogger():
         datefmt='%d-%b-%Y %H:%M:%S',
         level=DEBUG
     )
-    fh = addFileHandler(getLogFilePath())
     for h in getLogger().handlers:
         if isinstance(h, StreamHandler):
             if h.stream == sys.stderr or h.stream == sys.stdout:
                 h.setLevel(INFO)
+    fh = addFileHandler(getLogFilePath())
 
     return fh
 
-_configureLogger()
+
+class PayloadSummary(object):
+    # Logs as the item count and the first few items, or every item with log_verbose_payloads on
+    __slots__ = ('items', 'limit')
+
+    def __init__(self, items, limit):
+        self.items = items
+        self.limit = limit
+
+    def __str__(self):
+        if self.limit is None or len(self.items) <= self.limit:
+            return '%s items: %s' % (len(self.items), self.items)
+        # (key, value) pairs of a dict
+        it = self.items.iteritems() if hasattr(self.items, 'iteritems') else iter(self.items)
+        return '%s items, first %s: %s ...' % (len(self.items), self.limit, list(islice(it, self.limit)))
+
+
+def summarizePayload(items):
+    from utils.configuration import agni_configuration
+    if agni_configuration.getAgniLogVerbosePayloads():
+        return PayloadSummary(items, None)
+    return PayloadSummary(items, agni_configuration.getAgniLogPayloadItems())
+
+
+_configured = False
+_configureLock = Lock()
+
+def configureLogging():
+    # Sets up the console and log file handlers once; later calls do nothing
+    global _configured
+    if _configured:
+        return
+    with _configureLock:
+        if _configured:
+            return
+        rootLogger = getLogger()
+        # A new list, as the logger that called _lazyHandler may still be iterating the old one
+        rootLogger.handlers = [h for h in rootLogger.handlers if h is not _lazyHandler]
+        _configureLogger()
+        _configured = True
+
+
+def isLoggingConfigured():
+    return _configured
+
+
+class _LazyConfigureHandler(Handler):
+    # Stands in for the real handlers until the first record, so importing a module costs no file I/O
+    def emit(self, record):
+        configureLogging()
+        for h in getLogger().handlers:
+            if record.levelno >= h.level:
+                h.handle(record)
+
 
 def flushLogs():
     for h in getLogger().handlers:
@@ -35,3 +95,7 @@ def flushLogs():
             h.flush()
 
 getAgniLogger = getLogger
+
+_lazyHandler = _LazyConfigureHandler(DEBUG)
+getLogger().setLevel(DEBUG)
+getLogger().addHandler(_lazyHandler)
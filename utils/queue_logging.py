@@ -0,0 +1,99 @@
+'''
+QueueHandler and QueueListener along the lines of those in Python 3's logging.handlers, which Python 2
+lacks. Records are put on a queue by the logging thread and written by the handlers of a listener
+thread, so a slow disk does not hold up the import.
+'''
+import atexit
+from copy import copy
+from logging import Handler
+from multiprocessing.util import Finalize
+from os import getpid
+from Queue import Queue
+from threading import Thread, Lock
+
+_STOP = None
+
+
+class QueueListener(object):
+    def __init__(self, queue, *handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self.pid = getpid()
+        self._thread = None
+        self._lock = Lock()
+        self._forkedPid = None
+
+    def start(self):
+        self._thread = Thread(target=self._monitor, name='QueueListener')
+        self._thread.daemon = True
+        self._thread.start()
+        # atexit does not run in multiprocessing workers, their finalizers do
+        atexit.register(self.stop)
+        Finalize(None, self.stop, exitpriority=0)
+
+    def stop(self):
+        # Writes out what is queued, then ends the thread; calling it again does nothing
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or self.pid != getpid():
+            return
+        self.queue.put_nowait(_STOP)
+        thread.join()
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def handleInForkedProcess(self, record):
+        # A forked process has no listener thread, so it writes directly. The handler locks came over from
+        # the parent, possibly held by its listener thread at the time of the fork, so they are made anew.
+        pid = getpid()
+        if self._forkedPid != pid:
+            for handler in self.handlers:
+                handler.createLock()
+            self._forkedPid = pid
+        self.handle(record)
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                break
+            self.handle(record)
+
+
+class QueueHandler(Handler):
+    def __init__(self, listener):
+        Handler.__init__(self)
+        self.listener = listener
+        self.queue = listener.queue
+
+    def prepare(self, record):
+        # The message is formatted now, as its arguments may have changed by the time the listener gets it
+        msg = self.format(record)
+        record = copy(record)
+        record.message = msg
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def emit(self, record):
+        try:
+            if self.listener.pid != getpid():
+                self.listener.handleInForkedProcess(record)
+            else:
+                self.queue.put_nowait(self.prepare(record))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+
+def makeQueueHandler(*handlers):
+    # Starts a listener writing to the handlers and returns the handler that feeds it
+    listener = QueueListener(Queue(), *handlers)
+    listener.start()
+    return QueueHandler(listener)
@@ -0,0 +1,160 @@
+'''
+Timing spans for the hot paths. Off by default; while off, span() hands back one shared no-op
+object, so an instrumented call site costs a function call and a flag test.
+
+    with span('import.attendance_insert') as s:
+        ...
+        s.addRows(n)
+'''
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+_enabled = False
+_profiler = None
+_profileFile = None
+_spanStats = OrderedDict()
+_spanStatsLock = Lock()
+
+
+class SpanStats(object):
+    __slots__ = ('calls', 'seconds', 'maxSeconds', 'rows')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.rows = 0
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+    def addRows(self, rows):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('name', 'rows', 'startTime')
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.startTime = None
+
+    def __enter__(self):
+        self.startTime = time()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        recordSpan(self.name, time() - self.startTime, self.rows)
+        return False
+
+    def addRows(self, rows):
+        self.rows += rows
+
+
+def span(name, rows=0):
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, rows)
+
+
+def recordSpan(name, seconds, rows=0):
+    with _spanStatsLock:
+        stats = _spanStats.get(name)
+        if stats is None:
+            stats = _spanStats[name] = SpanStats()
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.rows += rows
+        if seconds > stats.maxSeconds:
+            stats.maxSeconds = seconds
+
+
+class _TimedWriter(object):
+    # Times every writerow() of a csv-writer-like object
+    def __init__(self, name, writer):
+        self._name = name
+        self._writer = writer
+
+    def writerow(self, row):
+        startTime = time()
+        self._writer.writerow(row)
+        recordSpan(self._name, time() - startTime, 1)
+
+
+def timedWriter(name, writer):
+    # The writer itself while spans are off
+    if not _enabled:
+        return writer
+    return _TimedWriter(name, writer)
+
+
+def isProfilingEnabled():
+    return _enabled
+
+
+def enableProfiling(profileFile=None):
+    # Turns spans on; with profileFile, cProfile runs too and its stats go to that file
+    global _enabled, _profiler, _profileFile
+    _enabled = True
+    if profileFile and _profiler is None:
+        import cProfile
+        _profileFile = profileFile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def getSpanStats():
+    with _spanStatsLock:
+        return list(_spanStats.items())
+
+
+def resetSpans():
+    with _spanStatsLock:
+        _spanStats.clear()
+
+
+def formatSpanReport(spanStats):
+    lines = ['%-36s %7s %10s %9s %10s %12s' % ('span', 'calls', 'total sec', 'max sec', 'rows', 'rows/sec')]
+    for name, s in spanStats:
+        lines.append('%-36s %7d %10.3f %9.3f %10d %12s' % (
+            name, s.calls, s.seconds, s.maxSeconds, s.rows,
+            '%.1f' % (s.rows / s.seconds) if s.rows and s.seconds > 0 else '-'))
+    return '\n'.join(lines)
+
+
+def logSpanReport(title):
+    # Logs the spans recorded since the last report, then starts over
+    if not _enabled:
+        return
+    spanStats = getSpanStats()
+    resetSpans()
+    if spanStats:
+        _logger.info('%s timings (nested spans are included in their parents):\n%s', title,
+                     formatSpanReport(spanStats))
+
+
+def stopProfiling():
+    # Writes the cProfile stats, if cProfile was running
+    global _profiler
+    if _profiler is None:
+        return
+    _profiler.disable()
+    _profiler.dump_stats(_profileFile)
+    _logger.info('cProfile stats written to %s. View them with: python -m pstats %s', _profileFile, _profileFile)
+    _profiler = None
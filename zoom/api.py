@@ -2,14 +2,21 @@ import base64
 import hashlib
 import hmac
 import json
+import random
 
 from datetime import datetime, timedelta
-from time import time
+from email.utils import parsedate_tz, mktime_tz
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from time import time, sleep
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from utils.configuration import agni_configuration
 from utils.logger import getAgniLogger
+from utils.timing import span
+from zoom.rate_limiter import makeRateLimiter
 
 _logger = getAgniLogger(__name__)
 
@@ -34,10 +41,99 @@ ENDPOINT_WEBINAR_REGISRANTS = 'webinars/{zoomWebinarId}/registrants'
 ENDPOINT_UPDATE_WEBINAR_REGISTRANTS_STATUS = ENDPOINT_WEBINAR_REGISRANTS + '/status'
 
 
+# Transient failures worth another try; anything else is raised by checkResponse() right away
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+
+HEADER_RETRY_AFTER = 'Retry-After'
+HEADER_RATE_LIMIT_TYPE = 'X-RateLimit-Type'
+HEADER_RATE_LIMIT_REMAINING = 'X-RateLimit-Remaining'
+RATE_LIMIT_TYPE_DAILY = 'daily-limit'
+
+
 class ZoomApiError(Exception):
     pass
 
 
+def getRetryAfterSeconds(resp):
+    # Retry-After is either a number of seconds or an HTTP date
+    retryAfter = resp.headers.get(HEADER_RETRY_AFTER)
+    if not retryAfter:
+        return None
+    retryAfter = retryAfter.strip()
+    try:
+        return max(float(retryAfter), 0.0)
+    except ValueError:
+        pass
+    parsed = parsedate_tz(retryAfter)
+    if parsed is None:
+        return None
+    return max(mktime_tz(parsed) - time(), 0.0)
+
+
+def getBackoffSeconds(attempt, backoff, maxWait):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(maxWait, backoff * (2 ** attempt)))
+
+
+class RegistrantsBatchResult(object):
+    # Outcome of one status update call, so that failed batches can be sent again
+    def __init__(self, batchIndex, registrants):
+        self.batchIndex = batchIndex
+        self.registrants = registrants
+        self.statusCode = None
+        self.error = None
+        self.elapsedSeconds = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def iterRegistrantBatches(registrants):
+    for i in xrange(0, len(registrants), MAX_REGISTRANTS_PER_CALL):
+        yield registrants[i:i+MAX_REGISTRANTS_PER_CALL]
+
+
+def getFailedRegistrants(batchResults):
+    failed = []
+    for r in batchResults:
+        if not r.ok:
+            failed += r.registrants
+    return failed
+
+
+def summarizeBatchResults(batchResults, elapsedSeconds):
+    latencies = sorted(r.elapsedSeconds for r in batchResults)
+    summary = {
+        'batches': len(batchResults),
+        'failedBatches': sum(1 for r in batchResults if not r.ok),
+        'registrants': sum(len(r.registrants) for r in batchResults),
+        'failedRegistrants': sum(len(r.registrants) for r in batchResults if not r.ok),
+        'elapsedSeconds': elapsedSeconds,
+        'callsPerSecond': len(batchResults) / elapsedSeconds if elapsedSeconds > 0 else 0.0,
+        'registrantsPerSecond': (sum(len(r.registrants) for r in batchResults) / elapsedSeconds
+                                 if elapsedSeconds > 0 else 0.0),
+        'minLatency': latencies[0] if latencies else 0.0,
+        'avgLatency': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p95Latency': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        'maxLatency': latencies[-1] if latencies else 0.0,
+    }
+    _logger.info('%(batches)s batches (%(failedBatches)s failed) for %(registrants)s registrants '
+                 '(%(failedRegistrants)s failed) in %(elapsedSeconds).2f sec: '
+                 '%(callsPerSecond).1f calls/sec, %(registrantsPerSecond).1f registrants/sec', summary)
+    _logger.info('Batch latency: min %(minLatency).3f | avg %(avgLatency).3f | p95 %(p95Latency).3f | '
+                 'max %(maxLatency).3f sec', summary)
+    return summary
+
+
+def makeSession(poolSize):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
 def generateJwtToken(api_key, api_secret, current_timestamp, expiry):
     header = {
         'alg': 'HS256',
@@ -119,6 +215,22 @@ class ZoomApi:
         self._api_secret = agni_configuration.getZoomApiSecret()
         self._access_token = agni_configuration.getZoomApiToken()
         self._token_expiry = None
+        self._timeouts = agni_configuration.getZoomApiTimeouts()
+        self._maxRetries = agni_configuration.getZoomApiMaxRetries()
+        self._retryBackoff = agni_configuration.getZoomApiRetryBackoff()
+        self._retryMaxWait = agni_configuration.getZoomApiRetryMaxWait()
+        # Keeps connections alive between calls instead of a new TLS handshake per request
+        self._session = makeSession(agni_configuration.getZoomApiPoolSize())
+        # Shared by every thread using this instance; each attempt of a call takes a token
+        self._rateLimiter = makeRateLimiter(agni_configuration.getZoomApiRateLimit(),
+                                            agni_configuration.getZoomApiRateLimitBurst())
+        # HTTP requests sent and how many of them were retries
+        self.requestCount = 0
+        self.retryCount = 0
+        self._statsLock = Lock()
+
+    def close(self):
+        self._session.close()
 
     @property
     def accessToken(self):
@@ -147,6 +259,57 @@ class ZoomApi:
             pass
         raise ZoomApiError('Zoom api error: status_code=%s json=%s'%(resp.status_code, resp_json), resp.status_code, resp_json)
 
+    def _getRetryWait(self, resp, attempt):
+        # Seconds to wait before retrying resp, or None when it should not be retried
+        if resp.status_code not in RETRY_STATUS_CODES:
+            return None
+        retryAfter = getRetryAfterSeconds(resp)
+        if resp.status_code == 429:
+            rateLimitType = resp.headers.get(HEADER_RATE_LIMIT_TYPE, '').strip().lower()
+            if retryAfter is None and rateLimitType == RATE_LIMIT_TYPE_DAILY:
+                _logger.error('Zoom api daily rate limit reached')
+                return None
+        if retryAfter is not None:
+            if retryAfter > self._retryMaxWait:
+                _logger.error('Zoom api asked to retry after %.0f sec, longer than %s sec',
+                              retryAfter, self._retryMaxWait)
+                return None
+            return retryAfter
+        return getBackoffSeconds(attempt, self._retryBackoff, self._retryMaxWait)
+
+    def request(self, method, url, **kwargs):
+        # Sends the request on the pooled session; retries transient errors, then leaves the
+        # final response to checkResponse()
+        kwargs.setdefault('timeout', self._timeouts)
+        attempt = 0
+        while True:
+            if self._rateLimiter:
+                self._rateLimiter.acquire()
+            with self._statsLock:
+                self.requestCount += 1
+                if attempt:
+                    self.retryCount += 1
+            try:
+                with span('zoom.%s' % method, rows=1):
+                    resp = self._session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self._maxRetries:
+                    raise
+                wait = getBackoffSeconds(attempt, self._retryBackoff, self._retryMaxWait)
+                _logger.warn('Zoom api %s failed: %s. Retrying in %.2f sec', method, e, wait)
+            else:
+                remaining = resp.headers.get(HEADER_RATE_LIMIT_REMAINING)
+                if remaining is not None:
+                    _logger.debug('Zoom api rate limit remaining: %s', remaining)
+                wait = self._getRetryWait(resp, attempt) if attempt < self._maxRetries else None
+                if wait is None:
+                    self.checkResponse(resp)
+                    return resp
+                _logger.warn('Zoom api returned status code %s. Retrying in %.2f sec', resp.status_code, wait)
+                resp.close()
+            sleep(wait)
+            attempt += 1
+
     def getWebinarRegistrants(self, zoomWebinarId, status='approved', page_size=300, page_number=1,
                               occurrence_id=None, next_page_token=None):
         requestUrl = (self._baseUrl + ENDPOINT_WEBINAR_REGISRANTS).format(
@@ -165,33 +328,44 @@ class ZoomApi:
         if next_page_token:
             requestQuery[PARAM_NEXT_PAGE_TOKEN] = next_page_token
 
-        resp = requests.get(requestUrl, params=requestQuery, data=requestBody)
-        self.checkResponse(resp)
+        resp = self.request('GET', requestUrl, params=requestQuery, data=requestBody)
         resp_json = resp.json()
         # _logger.debug('Got zoom api response: %s', resp_json)
         return resp.json()
 
+    def iterWebinarRegistrantPages(self, zoomWebinarId, status='approved', occurrence_id=None, page_size=300,
+                                   prefetch=True):
+        # Yields the registrants of one page at a time, following next_page_token until Zoom returns
+        # none. With prefetch, the next page is fetched in the background while the caller works
+        # on the current one, so at most two pages are held at once.
+        def fetchPage(nextPageToken):
+            return self.getWebinarRegistrants(zoomWebinarId, status=status, page_size=page_size,
+                                              occurrence_id=occurrence_id, next_page_token=nextPageToken)
+
+        pool = ThreadPool(1) if prefetch else None
+        try:
+            data = fetchPage(None)
+            while True:
+                nextPageToken = data.get('next_page_token')
+                pending = pool.apply_async(fetchPage, (nextPageToken,)) if (pool and nextPageToken) else None
+                yield data.get('registrants') or []
+                if not nextPageToken:
+                    return
+                data = pending.get() if pending else fetchPage(nextPageToken)
+        finally:
+            if pool:
+                # Does not wait for a page the caller no longer wants
+                pool.terminate()
+
+    def iterWebinarRegistrants(self, zoomWebinarId, status='approved', occurrence_id=None, page_size=300,
+                               prefetch=True):
+        for registrants in self.iterWebinarRegistrantPages(zoomWebinarId, status=status, occurrence_id=occurrence_id,
+                                                           page_size=page_size, prefetch=prefetch):
+            for registrant in registrants:
+                yield registrant
+
     def getAllWebinarRegistrants(self, zoomWebinarId, status='approved', occurrence_id=None):
-        allRegistrants = []
-
-        data = self.getWebinarRegistrants(zoomWebinarId, status=status, occurrence_id=occurrence_id)
-        page_count = data['page_count']
-        total_records = data['total_records']
-        next_page_token = data['next_page_token']
-        registrants = data['registrants']
-        allRegistrants += registrants
-        page_number = 1
-
-        if len(registrants) < total_records:
-            while page_number < page_count:
-                data = self.getWebinarRegistrants(zoomWebinarId, status=status,
-                                                  occurrence_id=occurrence_id, next_page_token=next_page_token)
-                next_page_token = data['next_page_token']
-                registrants = data['registrants']
-                allRegistrants += registrants
-                page_number += 1
-
-        return allRegistrants
+        return list(self.iterWebinarRegistrants(zoomWebinarId, status=status, occurrence_id=occurrence_id))
 
     def updateWebinarRegistrantsStatus(self, zoomWebinarId, action, registrants=None, occurrence_id=None):
         if not registrants:
@@ -217,8 +391,7 @@ class ZoomApi:
             #json.dumps(requestBody)
             #_logger.debug('updateWebinarRegistrantsStatus: requestBody = %s', requestBody)
             #_logger.debug('updateWebinarRegistrantsStatus: json-requestBody = %s', requestBody)
-            resp = requests.put(requestUrl, params=requestQuery, json=requestBody)
-            self.checkResponse(resp)
+            resp = self.request('PUT', requestUrl, params=requestQuery, json=requestBody)
             # resp_json = resp.json()
             # _logger.debug('Got zoom api response: %s', resp_json)
             respList.append(resp)
@@ -228,14 +401,62 @@ class ZoomApi:
                 endIdx = (i+MAX_REGISTRANTS_PER_CALL) if (i+MAX_REGISTRANTS_PER_CALL) < len(registrants) else len(registrants)
                 requestBody[PARAM_REGISTRANTS] = registrants[startIdx:endIdx]
                 #_logger.debug('updateWebinarRegistrantsStatus: requestBody = %s', requestBody)
-                resp = requests.put(requestUrl, params=requestQuery, json=requestBody)
-                self.checkResponse(resp)
+                resp = self.request('PUT', requestUrl, params=requestQuery, json=requestBody)
                 # resp_json = resp.json()
                 # _logger.debug('Got zoom api response: %s', resp_json)
                 respList.append(resp)
 
         return respList
 
+    def _updateRegistrantsStatusBatch(self, zoomWebinarId, action, batchIndex, registrants, occurrence_id=None):
+        result = RegistrantsBatchResult(batchIndex, registrants)
+        startTime = time()
+        try:
+            resp = self.updateWebinarRegistrantsStatus(zoomWebinarId, action, registrants=registrants,
+                                                       occurrence_id=occurrence_id)[0]
+            result.statusCode = resp.status_code
+        except ZoomApiError as e:
+            result.statusCode = e.args[1] if len(e.args) > 1 else None
+            result.error = e
+        except requests.RequestException as e:
+            result.error = e
+        result.elapsedSeconds = time() - startTime
+        if result.error is not None:
+            _logger.error('Batch %s of %s registrants failed: %s', batchIndex, len(registrants), result.error)
+        return result
+
+    def updateWebinarRegistrantsStatusInBatches(self, zoomWebinarId, action, registrants, occurrence_id=None,
+                                                workers=None):
+        # Sends the batches from a pool of threads and returns one RegistrantsBatchResult per batch,
+        # in batch order. Failed batches do not stop the others.
+        if workers is None:
+            workers = agni_configuration.getZoomStatusUpdateWorkers()
+        batches = list(iterRegistrantBatches(registrants))
+        if not batches:
+            return []
+
+        def sendBatch(indexedBatch):
+            batchIndex, batch = indexedBatch
+            return self._updateRegistrantsStatusBatch(zoomWebinarId, action, batchIndex, batch,
+                                                      occurrence_id=occurrence_id)
+
+        workers = max(1, min(workers, len(batches)))
+        _logger.info('Updating status of %s registrants in %s batches with %s workers',
+                     len(registrants), len(batches), workers)
+        startTime = time()
+        if workers == 1:
+            results = [sendBatch(b) for b in enumerate(batches)]
+        else:
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(sendBatch, list(enumerate(batches)), chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        summarizeBatchResults(results, time() - startTime)
+        return results
+
 def main():
     import sys
     try:
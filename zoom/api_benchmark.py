@@ -0,0 +1,83 @@
+'''
+Drives ZoomApi against the local Zoom API stand-in and reports calls/sec, wall time and retries.
+
+    python -m zoom.api_benchmark --registrants 3000 --cancel 3000 --workers 1,4,8 --latency 0.05 --rate-429 0.02
+'''
+from argparse import ArgumentParser
+from time import time
+
+from utils.configuration import agni_configuration, SECTION_ZOOM, PROP_ZOOM_API_BASE_URL, PROP_ZOOM_API_TOKEN, \
+    PROP_ZOOM_RATE_LIMIT, PROP_ZOOM_RETRY_BACKOFF
+from zoom.api import ZoomApi, ACTION_CANCEL, getFailedRegistrants
+from zoom.standin_server import addStandInArguments, makeStandInServer
+
+RESULT_FORMAT = '%-28s %8s %9s %10s %8s %8s'
+
+
+def printResult(name, items, elapsed, za, failed=0):
+    print RESULT_FORMAT % (
+        name,
+        items,
+        '%.2f' % elapsed,
+        '%.1f' % (za.requestCount / elapsed if elapsed > 0 else 0.0),
+        za.retryCount,
+        failed,
+    )
+
+
+def benchmarkPagination(zoomWebinarId, prefetch):
+    za = ZoomApi()
+    try:
+        startTime = time()
+        count = sum(1 for _ in za.iterWebinarRegistrants(zoomWebinarId, prefetch=prefetch))
+        printResult('list prefetch=%s' % prefetch, count, time() - startTime, za)
+    finally:
+        za.close()
+
+
+def benchmarkCancellation(zoomWebinarId, numRegistrants, workers):
+    za = ZoomApi()
+    try:
+        registrants = [{'email': 'registrant%06d@example.com' % i} for i in xrange(numRegistrants)]
+        startTime = time()
+        results = za.updateWebinarRegistrantsStatusInBatches(zoomWebinarId, ACTION_CANCEL, registrants,
+                                                             workers=workers)
+        printResult('cancel workers=%s' % workers, numRegistrants, time() - startTime, za,
+                    failed=len(getFailedRegistrants(results)))
+    finally:
+        za.close()
+
+
+def main():
+    parser = ArgumentParser(description='ZoomApi benchmark against the local Zoom API stand-in')
+    addStandInArguments(parser)
+    parser.add_argument('--cancel', type=int, default=1000, help='registrants to cancel per run')
+    parser.add_argument('--workers', default='1,4', help='comma separated worker counts to compare')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='Zoom API calls/sec; defaults to rate_limit_per_second of the ini file')
+    parser.add_argument('--retry-backoff', type=float, default=None,
+                        help='seconds; defaults to retry_backoff_seconds of the ini file')
+    args = parser.parse_args()
+
+    server = makeStandInServer(args).start()
+    # For this run only; ZoomApi reads them when created
+    agni_configuration.set(SECTION_ZOOM, PROP_ZOOM_API_BASE_URL, server.baseUrl)
+    agni_configuration.set(SECTION_ZOOM, PROP_ZOOM_API_TOKEN, '')
+    if args.rate_limit is not None:
+        agni_configuration.set(SECTION_ZOOM, PROP_ZOOM_RATE_LIMIT, args.rate_limit)
+    if args.retry_backoff is not None:
+        agni_configuration.set(SECTION_ZOOM, PROP_ZOOM_RETRY_BACKOFF, args.retry_backoff)
+
+    try:
+        print RESULT_FORMAT % ('run', 'items', 'wall sec', 'calls/sec', 'retries', 'failed')
+        for prefetch in (False, True):
+            benchmarkPagination('1000', prefetch)
+        for i, workers in enumerate(int(w) for w in args.workers.split(',')):
+            # A fresh webinar per run, so that every run cancels approved registrants
+            benchmarkCancellation(str(2000 + i), args.cancel, workers)
+    finally:
+        server.stop()
+        print 'Stand-in stats:', server.stats.asDict()
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,89 @@
-import csv
-from datetime import datetime
+import sqlite3
 from genericpath import exists
+from multiprocessing import Pool, cpu_count
 from os import listdir
 from os.path import join, isdir
-
-from utils.logger import flushLogs, getAgniLogger
-from utils.common import sanitizeEmail
-from zoom.common import sanitizeWebinarId
-from agni.db import getConnection, prepareDB
+from time import time
+
+from utils.configuration import agni_configuration
+from utils.logger import flushLogs, getAgniLogger, summarizePayload
+from utils.timing import span
+from agni.attendance_summary import updateAttendanceSummary
+from agni.db import getConnection, prepareDB, transaction
+from agni.export_cache import bumpWebinarDataVersion
+from zoom.import_manifest import ImportManifest
+from zoom.report_parser import iterAttendeeReportRecords, TopicRecord, ClassDateRecord, AttendeeRecord, \
+    SECTION_NAMES, ZOOM_WEBINAR_DATETIME_FORMAT, ZOOM_REGISTRATION_DATETIME_FORMAT, INTERNAL_DATETIME_FORMAT
 
 _logger = getAgniLogger(__name__)
 
+def findInternalClassDate(records):
+    # The topic row comes before the attendee rows, so only the top of a report is read
+    for r in records:
+        if isinstance(r, ClassDateRecord):
+            return r.internalClassDateStr
+    return None
+
+
+def getReportImportOrder(report):
+    # Reports are applied in class date order, so that the summary of each class is updated incrementally
+    return report.internalClassDateStr or '', report.filename
+
+
+class ParsedAttendeeReport:
+    def __init__(self, filename, records):
+        self.filename = filename
+        self.records = records
+        self.internalClassDateStr = findInternalClassDate(records)
+
+
+def parseAttendeeReport(filename):
+    # Runs in the import worker processes, so it must not touch the database
+    with span('import.parse') as sp, open(filename, 'rt') as fd:
+        records = list(iterAttendeeReportRecords(fd))
+        sp.addRows(len(records))
+        return ParsedAttendeeReport(filename, records)
+
+
+def iterAttendeeReportFile(filename):
+    with open(filename, 'rt') as fd:
+        for record in iterAttendeeReportRecords(fd):
+            yield record
+
+
+class AttendeeReportFile:
+    # Parsed while it is imported, so that memory does not grow with the size of the report
+    def __init__(self, filename):
+        self.filename = filename
+        # Closed here rather than when collected, so the file is not left open
+        records = iterAttendeeReportFile(filename)
+        try:
+            self.internalClassDateStr = findInternalClassDate(records)
+        finally:
+            records.close()
+
+    @property
+    def records(self):
+        return iterAttendeeReportFile(self.filename)
+
+
 class AttendeeReportImporter:
 
-    def __init__(self, cnx):
-        self._sectionHandler = {
-            'Attendee Report':self.ignoreLine,
-            'Topic':self.processTopicLine,
-            'Panelist Details':self.ignoreLine,
-            'Attendee Details':self.processAttendeeDetailsLine,
-            'Other Attended':self.ignoreLine,
-            'Host Details':self.ignoreLine,
+    def __init__(self, cnx, chunkSize=None):
+        self._recordHandler = {
+            TopicRecord:self.processTopicRecord,
+            ClassDateRecord:self.processClassDateRecord,
+            AttendeeRecord:self.processAttendeeRecord,
         }
         self._cnx = cnx
+        # Pending changes are written every chunkSize attendee rows, within the transaction of the file
+        self.chunkSize = chunkSize if chunkSize is not None else agni_configuration.getAgniImportChunkSize()
+        # Identity index of the current webinar, loaded once and kept up to date across files
+        self._indexedWebinarId = None
+        self._registrantIds = {}        # email -> webinar_registrant.id
+        self._registrantRegDates = {}   # webinar_registrant.id -> internal registration datetime
+        # Attendance of the current class only
+        self._attendances = {}          # webinar_registrant.id -> attended
         self._resetCurrentContext()
         self._prepareDB()
 
@@ -30,29 +91,25 @@ class AttendeeReportImporter:
         self.currentClassId = None
         self.currentClassDate = None
         self.currentWebinarId = None
-        self.emailColIndex = None
-        self.regDateColIndex = None
-        self._insertedRegistrantEmails = []
-        self.registrantInsertParams = []
-        self.registrantUpdateParams = []
-        self._insertedAttendances = {}
-        self.attendanceInsertParams = []
-        self.attendanceUpdateParams = []
+        self.attendeeRowCount = 0
+        self._resetPendingChanges()
+
+    def _resetPendingChanges(self):
+        # Lists of parameter tuples in row order, and where each email's tuple is
+        self.registrantInsertParams = []          # (email, internal, original registration datetime)
+        self.registrantInsertPositions = {}       # email -> index in registrantInsertParams
+        self.registrantUpdateParams = {}          # registrant id -> (internal, original registration datetime)
+        self.attendanceInsertParams = []          # (email, attended)
+        self.attendanceInsertPositions = {}       # email -> index in attendanceInsertParams
+        self.attendanceUpdateParams = {}          # registrant id -> attended
+        self.pendingRowCount = 0
 
     def _prepareDB(self):
         prepareDB(self._cnx)
 
-    def processTopicLine(self, line):
-        isHeader = line[0].startswith('Topic')
-        if isHeader:
-            return
-
-        topic = line[0]
-        if not topic:
-            return
-
-        originalWebinarId = line[1]
-        zoomWebinarId = sanitizeWebinarId(originalWebinarId)
+    def processTopicRecord(self, record):
+        topic = record.topic
+        zoomWebinarId = record.zoomWebinarId
 
         # Save this to table webinar
         wq = '''
@@ -71,13 +128,19 @@ class AttendeeReportImporter:
         else:
             self.currentWebinarId = rows[0][0]
 
-        originalClassDateStr = line[2]
-        classDate = datetime.strptime(originalClassDateStr, ZOOM_WEBINAR_DATETIME_FORMAT)
-        internalClassDateStr = classDate.strftime(INTERNAL_DATETIME_FORMAT)
+        cur.close()
+
+        self._loadIdentityIndex(self.currentWebinarId)
+
+    def processClassDateRecord(self, record):
+        originalClassDateStr = record.originalClassDateStr
+        internalClassDateStr = record.internalClassDateStr
+
         # Save to table webinar class
         cq = '''
             SELECT id FROM webinar_class WHERE webinar_id = ? AND internal_datetime = ?
         '''
+        cur = self._cnx.cursor()
         cur.execute(cq, (self.currentWebinarId, internalClassDateStr))
         rows = cur.fetchall()
         if not rows:
@@ -92,13 +155,58 @@ class AttendeeReportImporter:
 
         self.currentClassDate = internalClassDateStr
 
-        self._cnx.commit()
         cur.close()
 
-        pass
+        self._loadClassAttendance(self.currentClassId, existingClass=bool(rows))
+
+    def _loadIdentityIndex(self, webinarId):
+        if webinarId == self._indexedWebinarId:
+            return
 
-    def _insertRegistrants(self, registrantParamsList):
-        if not registrantParamsList:
+        rq = '''
+            SELECT id, email, internal_registration_datetime FROM webinar_registrant WHERE webinar_id = ?
+        '''
+        self._registrantIds = {}
+        self._registrantRegDates = {}
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            cur.execute(rq, (webinarId,))
+            for registrantId, email, internalRegisteredDateStr in cur:
+                # Emails from the report are byte strings; keep the index in the same form
+                if isinstance(email, unicode):
+                    email = email.encode('utf-8')
+                self._registrantIds[intern(email)] = registrantId
+                if internalRegisteredDateStr is not None:
+                    self._registrantRegDates[registrantId] = str(internalRegisteredDateStr)
+        finally:
+            if cur:
+                cur.close()
+
+        self._indexedWebinarId = webinarId
+        _logger.info('Loaded %s registrants of webinar %s', len(self._registrantIds), webinarId)
+
+    def _loadClassAttendance(self, classId, existingClass=True):
+        self._attendances = {}
+        if not existingClass:
+            return
+
+        aq = '''
+            SELECT registrant_id, attended FROM attendance WHERE webinar_class_id = ?
+        '''
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            cur.execute(aq, (classId,))
+            for registrantId, attended in cur:
+                self._attendances[registrantId] = intern(str(attended))
+        finally:
+            if cur:
+                cur.close()
+        _logger.info('Loaded %s attendance records of class %s', len(self._attendances), classId)
+
+    def _insertRegistrants(self, registrantParams):
+        if not registrantParams:
             return 0
 
         rins = '''
@@ -107,28 +215,32 @@ class AttendeeReportImporter:
                     webinar_id,
                     internal_registration_datetime,
                     original_registration_datetime
-                ) VALUES (?, ?, ?, ?)                
+                ) VALUES (?, ?, ?, ?)
             '''
         cur = None
-        _logger.debug('Registrants to insert: %s', registrantParamsList)
+        _logger.debug('Registrants to insert: %s', summarizePayload(registrantParams))
         try:
             cur = self._cnx.cursor()
-            cur.executemany(rins, registrantParamsList)
-            self._cnx.commit()
-            return cur.rowcount
+            # One statement per registrant so that the new ids can go into the identity index
+            for email, internalRegisteredDateStr, registeredDateStr in registrantParams:
+                cur.execute(rins, (email, self.currentWebinarId, internalRegisteredDateStr, registeredDateStr))
+                self._registrantIds[email] = cur.lastrowid
+                if internalRegisteredDateStr is not None:
+                    self._registrantRegDates[cur.lastrowid] = internalRegisteredDateStr
+            return len(registrantParams)
         finally:
             if cur:
                 cur.close()
 
-    def _updateRegistrants(self, registrantParamsList):
-        if not registrantParamsList:
+    def _updateRegistrants(self, registrantParams):
+        if not registrantParams:
             return 0
 
         rupd = '''
                     UPDATE webinar_registrant
                     SET internal_registration_datetime = ?,
                         original_registration_datetime = ?
-                    WHERE email = ? AND webinar_id = ?
+                    WHERE id = ?
                     AND (
                         internal_registration_datetime IS NULL
                         OR
@@ -136,215 +248,386 @@ class AttendeeReportImporter:
                     )
                 '''
         cur = None
-        _logger.debug('Registrants to update: %s', registrantParamsList)
+        _logger.debug('Registrants to update: %s', summarizePayload(registrantParams))
         try:
             cur = self._cnx.cursor()
-            cur.executemany(rupd, registrantParamsList)
-            self._cnx.commit()
+            cur.executemany(rupd, (
+                (internalRegisteredDateStr, registeredDateStr, registrantId, internalRegisteredDateStr)
+                for registrantId, (internalRegisteredDateStr, registeredDateStr) in registrantParams.iteritems()
+            ))
             return cur.rowcount
         finally:
             if cur:
                 cur.close()
 
-    def _insertAttendance(self, attendanceParamsList):
-        if not attendanceParamsList:
+    def _insertAttendance(self, attendanceParams):
+        if not attendanceParams:
             return 0
 
         ains = '''
                 INSERT INTO attendance(webinar_class_id, registrant_id, attended)
-                SELECT ?, id, ? FROM webinar_registrant WHERE email = ? AND webinar_id = ?
+                VALUES (?, ?, ?)
             '''
         cur = None
-        _logger.debug('Attendance to insert: %s', attendanceParamsList)
+        _logger.debug('Attendance to insert: %s', summarizePayload(attendanceParams))
         try:
+            params = []
+            for email, hadAttended in attendanceParams:
+                registrantId = self._registrantIds[email]
+                self._attendances[registrantId] = hadAttended
+                params.append((self.currentClassId, registrantId, hadAttended))
+
             cur = self._cnx.cursor()
-            cur.executemany(ains, attendanceParamsList)
-            self._cnx.commit()
+            cur.executemany(ains, params)
             return cur.rowcount
         finally:
             if cur:
                 cur.close()
 
-    def _updateAttendance(self, attendanceParamsList):
-        if not attendanceParamsList:
+    def _updateAttendance(self, attendanceParams):
+        if not attendanceParams:
             return 0
 
         aupd = '''
-                UPDATE attendance SET attended=?
-                WHERE webinar_class_id= ? AND registrant_id = (SELECT id FROM webinar_registrant WHERE email = ?)
+                UPDATE attendance SET attended = ?
+                WHERE webinar_class_id = ? AND registrant_id = ?
             '''
         cur = None
-        _logger.debug('Attendance to update: %s', attendanceParamsList)
+        _logger.debug('Attendance to update: %s', summarizePayload(attendanceParams))
         try:
             cur = self._cnx.cursor()
-            cur.executemany(aupd, attendanceParamsList)
-            self._cnx.commit()
+            cur.executemany(aupd, (
+                (hadAttended, self.currentClassId, registrantId)
+                for registrantId, hadAttended in attendanceParams.iteritems()
+            ))
             return cur.rowcount
         finally:
             if cur:
                 cur.close()
 
-    def processAttendeeDetailsLine(self, line):
+    def processAttendeeRecord(self, record):
+        self.attendeeRowCount += 1
+        email = intern(record.email)
+        hadAttended = intern(record.attended)
+        internalRegisteredDateStr = record.internalRegistrationDateStr
+        registeredDateStr = record.originalRegistrationDateStr
+
+        registrantId = self._registrantIds.get(email)
+        if registrantId is None:
+            # New registrant: keep the earliest registration time seen in this file
+            position = self.registrantInsertPositions.get(email)
+            if position is None:
+                self.registrantInsertPositions[email] = len(self.registrantInsertParams)
+                self.registrantInsertParams.append((email, internalRegisteredDateStr, registeredDateStr))
+            elif internalRegisteredDateStr:
+                pendingRegisteredDateStr = self.registrantInsertParams[position][1]
+                if pendingRegisteredDateStr is None or pendingRegisteredDateStr > internalRegisteredDateStr:
+                    self.registrantInsertParams[position] = (email, internalRegisteredDateStr, registeredDateStr)
+        elif internalRegisteredDateStr:
+            savedRegisteredDateStr = self._registrantRegDates.get(registrantId)
+            if savedRegisteredDateStr is None or savedRegisteredDateStr > internalRegisteredDateStr:
+                self._registrantRegDates[registrantId] = internalRegisteredDateStr
+                self.registrantUpdateParams[registrantId] = (internalRegisteredDateStr, registeredDateStr)
+
+        position = self.attendanceInsertPositions.get(email)
+        if position is not None:
+            savedAttended = self.attendanceInsertParams[position][1]
+        elif registrantId is not None:
+            savedAttended = self._attendances.get(registrantId)
+        else:
+            savedAttended = None
+
+        # Save to table attendance
+        if savedAttended is None:
+            self.attendanceInsertPositions[email] = len(self.attendanceInsertParams)
+            self.attendanceInsertParams.append((email, hadAttended))
+        elif savedAttended == 'No' and hadAttended == 'Yes':
+            if position is not None:
+                self.attendanceInsertParams[position] = (email, hadAttended)
+            else:
+                self._attendances[registrantId] = hadAttended
+                self.attendanceUpdateParams[registrantId] = hadAttended
 
-        isHeader = line[0].startswith('Attendee Details') or line[0].startswith('Attended')
-        if isHeader:
-            if line[0].startswith('Attended'):
-                # Configure columns
-                self.emailColIndex = line.index('Email')
-                self.regDateColIndex = line.index('Registration Time')
+        self.pendingRowCount += 1
+        if self.pendingRowCount >= self.chunkSize:
+            self.flushPendingChanges()
 
-            return
+    def importAttendeeReport(self, filename):
+        with open(filename, 'rt') as fd:
+            self.importRecords(filename, iterAttendeeReportRecords(fd))
 
-        hadAttended = line[0]
-        if not hadAttended:
-            return
+    def importParsedReport(self, report):
+        self.importRecords(report.filename, report.records)
 
-        email = sanitizeEmail(line[self.emailColIndex])
+    def importRecords(self, filename, records):
+        self._resetCurrentContext()
+        startTime = time()
+        try:
+            # One transaction per report file
+            with transaction(self._cnx):
+                with span('import.records') as sp:
+                    recordHandler = self._recordHandler
+                    for record in records:
+                        recordHandler[record.__class__](record)
+                    sp.addRows(self.attendeeRowCount)
+
+                self.applyPendingChanges()
+                if self.currentWebinarId is not None:
+                    bumpWebinarDataVersion(self._cnx, self.currentWebinarId)
+                if self.currentClassId is not None:
+                    with span('import.summary_update'):
+                        updateAttendanceSummary(self._cnx, self.currentWebinarId, self.currentClassId,
+                                                self.currentClassDate)
+        except:
+            _logger.exception('**** Error importing file %s', filename)
+            # The identity index may no longer match the database
+            self._indexedWebinarId = None
+            raise
 
-        registeredDateStr = line[self.regDateColIndex]
-        if registeredDateStr:
-            registeredDate = datetime.strptime(registeredDateStr, ZOOM_REGISTRATION_DATETIME_FORMAT)
-            internalRegisteredDateStr = registeredDate.strftime(INTERNAL_DATETIME_FORMAT)
-        else:
-            registeredDate = None
-            internalRegisteredDateStr = None
+        elapsed = time() - startTime
+        _logger.info('%s attendee rows imported in %.3f sec (%.1f rows/sec)',
+                     self.attendeeRowCount, elapsed, self.attendeeRowCount / elapsed if elapsed > 0 else 0.0)
 
-        rq = '''
-            SELECT id FROM webinar_registrant WHERE email = ? AND webinar_id = ?
-        '''
+    def flushPendingChanges(self):
+        # Writes a chunk of rows mid-file. Rows after it see the chunk through the identity index.
+        self.applyPendingChanges()
+        self._resetPendingChanges()
 
-        aq = '''
-                SELECT attended FROM attendance
-                WHERE webinar_class_id = ? AND registrant_id = (SELECT id FROM webinar_registrant WHERE email = ? AND webinar_id = ?)
-            '''
+    def applyPendingChanges(self):
+        with span('import.registrant_insert') as sp:
+            ric = self._insertRegistrants(self.registrantInsertParams)
+            sp.addRows(ric)
+        _logger.info('%s registrant records inserted', ric)
 
-        cur = None
-        try:
-            cur = self._cnx.cursor()
-            cur.execute(rq, (email, self.currentWebinarId))
-            rows = cur.fetchall()
+        with span('import.registrant_update') as sp:
+            ruc = self._updateRegistrants(self.registrantUpdateParams)
+            sp.addRows(ruc)
+        _logger.info('%s registrant records updated', ruc)
+
+        with span('import.attendance_insert') as sp:
+            aic = self._insertAttendance(self.attendanceInsertParams)
+            sp.addRows(aic)
+        _logger.info('%s attendee records inserted', aic)
+
+        with span('import.attendance_update') as sp:
+            auc = self._updateAttendance(self.attendanceUpdateParams)
+            sp.addRows(auc)
+        _logger.info('%s attendee records updated', auc)
 
-            if not rows and (email not in self._insertedRegistrantEmails):
-                self._insertedRegistrantEmails.append(email)
-                self.registrantInsertParams.append((email, self.currentWebinarId, internalRegisteredDateStr, registeredDateStr))
-            else:
-                if registeredDateStr:
-                    self.registrantUpdateParams.append((internalRegisteredDateStr, registeredDateStr, email, self.currentWebinarId,
-                                              internalRegisteredDateStr))
-
-            shouldUpdateAttendance = False
-            shouldInsertAttendance = False
-
-            cur.execute(aq, (self.currentClassId, email, self.currentWebinarId))
-            rows = cur.fetchall()
-            if rows:
-                savedAttended = rows[0][0]
-                if savedAttended == 'No' and hadAttended == 'Yes':
-                    shouldUpdateAttendance = True
-            elif email in self._insertedAttendances:
-                savedAttended = self._insertedAttendances[email]
-                if savedAttended == 'No' and hadAttended == 'Yes':
-                    shouldUpdateAttendance = True
-            else:
-                shouldInsertAttendance = True
 
-            # Save to table attendance
-            if shouldInsertAttendance:
-                self._insertedAttendances[email] = hadAttended
-                self.attendanceInsertParams.append((self.currentClassId, hadAttended, email, self.currentWebinarId))
-            elif shouldUpdateAttendance:
-                self.attendanceUpdateParams.append((hadAttended, self.currentClassId, email, self.currentWebinarId))
+# Stages the attendee rows of a report in a temporary table and applies them with a few
+# set-based upserts, a chunk at a time. The upserts merge with what the tables already have,
+# so the result is the same as applying the whole report at once.
+class BulkAttendeeReportImporter(AttendeeReportImporter):
 
-            self._cnx.commit()
+    def _resetPendingChanges(self):
+        AttendeeReportImporter._resetPendingChanges(self)
+        self.stagedAttendeeParams = []
 
+    def _prepareDB(self):
+        AttendeeReportImporter._prepareDB(self)
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            cur.execute(TEMP_TABLE_ATTENDEE_REPORT_STAGING)
         finally:
             if cur:
                 cur.close()
 
-    def ignoreLine(self, line):
+    def _loadIdentityIndex(self, webinarId):
+        # Rows are matched to registrants by SQL joins, not by the identity index
         pass
 
-    def processLine(self, section, line):
-        if not section:
+    def _loadClassAttendance(self, classId, existingClass=True):
+        pass
+
+    def processAttendeeRecord(self, record):
+        self.attendeeRowCount += 1
+        self.stagedAttendeeParams.append((record.attended, record.email, record.internalRegistrationDateStr,
+                                          record.originalRegistrationDateStr))
+        if len(self.stagedAttendeeParams) >= self.chunkSize:
+            self.flushPendingChanges()
+
+    def applyPendingChanges(self):
+        if self.currentClassId is None or not self.stagedAttendeeParams:
             return
-        handleLine = self._sectionHandler.get(section, self.ignoreLine)
-        handleLine(line)
 
-    def importAttendeeReport(self, filename):
-        self._resetCurrentContext()
-        curSection = None
-        curLine = 0
-        line = None
+        sdel = '''
+            DELETE FROM attendee_report_staging
+        '''
+        sins = '''
+            INSERT INTO attendee_report_staging(
+                attended,
+                email,
+                internal_registration_datetime,
+                original_registration_datetime
+            ) VALUES (?, ?, ?, ?)
+        '''
+        # SQLite returns the bare column original_registration_datetime from the row having the MIN()
+        rups = '''
+            INSERT INTO webinar_registrant (
+                email,
+                webinar_id,
+                internal_registration_datetime,
+                original_registration_datetime
+            )
+            SELECT email, ?, MIN(internal_registration_datetime), original_registration_datetime
+            FROM attendee_report_staging
+            WHERE 1
+            GROUP BY email
+            ON CONFLICT(email, webinar_id) DO UPDATE
+            SET internal_registration_datetime = excluded.internal_registration_datetime,
+                original_registration_datetime = excluded.original_registration_datetime
+            WHERE excluded.internal_registration_datetime IS NOT NULL
+            AND (
+                webinar_registrant.internal_registration_datetime IS NULL
+                OR
+                webinar_registrant.internal_registration_datetime > excluded.internal_registration_datetime
+            )
+        '''
+        # 'Yes' sorts after 'No', so MAX() lets an attended row win over an absent row
+        aups = '''
+            INSERT INTO attendance(webinar_class_id, registrant_id, attended)
+            SELECT ?, wr.id, MAX(s.attended)
+            FROM
+                attendee_report_staging s
+                INNER JOIN
+                webinar_registrant wr ON (wr.email = s.email AND wr.webinar_id = ?)
+            WHERE 1
+            GROUP BY wr.id
+            ON CONFLICT(webinar_class_id, registrant_id) DO UPDATE
+            SET attended = excluded.attended
+            WHERE attendance.attended = 'No' AND excluded.attended = 'Yes'
+        '''
+        cur = None
         try:
-            with open(filename, 'rt') as fd:
-                rdr = csv.reader(fd, skipinitialspace=True)
-                for line in rdr:
-                    curLine = rdr.line_num
-                    # print 'Line:', curLine, line
-                    if not line:
-                        continue
-                    line = [l.strip() for l in line]
-                    for s in SECTION_NAMES:
-                        if line[0].strip().startswith(s):
-                            _logger.debug('At line %s: Got section %s', curLine, s)
-                            curSection = s
-                            break
-                    self.processLine(curSection, line)
+            cur = self._cnx.cursor()
+            with span('import.stage', rows=len(self.stagedAttendeeParams)):
+                cur.execute(sdel)
+                cur.executemany(sins, self.stagedAttendeeParams)
+            _logger.info('%s attendee rows staged', len(self.stagedAttendeeParams))
+
+            with span('import.registrant_upsert') as sp:
+                cur.execute(rups, (self.currentWebinarId,))
+                sp.addRows(cur.rowcount)
+            _logger.info('%s registrant records inserted or updated', cur.rowcount)
+
+            with span('import.attendance_upsert') as sp:
+                cur.execute(aups, (self.currentClassId, self.currentWebinarId))
+                sp.addRows(cur.rowcount)
+            _logger.info('%s attendee records inserted or updated', cur.rowcount)
+
+            cur.execute(sdel)
+        finally:
+            if cur:
+                cur.close()
 
-            ric = self._insertRegistrants(self.registrantInsertParams)
-            _logger.info('%s registrant records inserted', ric)
 
-            ruc = self._updateRegistrants(self.registrantUpdateParams)
-            _logger.info('%s registrant records updated', ruc)
+TEMP_TABLE_ATTENDEE_REPORT_STAGING = '''
+    CREATE TEMP TABLE IF NOT EXISTS attendee_report_staging(
+        attended TEXT NOT NULL,
+        email TEXT NOT NULL,
+        internal_registration_datetime TEXT,
+        original_registration_datetime TEXT
+    )
+'''
 
-            aic = self._insertAttendance(self.attendanceInsertParams)
-            _logger.info('%s attendee records inserted', aic)
+IMPORT_ENGINE_ROW = 'row'
+IMPORT_ENGINE_BULK = 'bulk'
 
-            auc = self._updateAttendance(self.attendanceUpdateParams)
-            _logger.info('%s attendee records updated', auc)
+# INSERT ... ON CONFLICT DO UPDATE
+MIN_SQLITE_VERSION_FOR_BULK_IMPORT = (3, 24, 0)
 
-        except:
-            _logger.exception('**** Error in file %s at line %s: %s', filename, curLine, line)
-            raise
 
+def makeAttendeeReportImporter(cnx, engine=None):
+    if engine is None:
+        engine = agni_configuration.getAgniImportEngine()
+
+    if engine == IMPORT_ENGINE_BULK:
+        if sqlite3.sqlite_version_info >= MIN_SQLITE_VERSION_FOR_BULK_IMPORT:
+            _logger.info('Using bulk import engine')
+            return BulkAttendeeReportImporter(cnx)
+        _logger.warn('SQLite %s is too old for the bulk import engine. Falling back to row import engine.',
+                     sqlite3.sqlite_version)
+    elif engine != IMPORT_ENGINE_ROW:
+        _logger.warn("Unknown import engine '%s'. Using row import engine.", engine)
 
-SECTION_NAMES = (
-    'Attendee Report',
-    'Topic',
-    'Host Details',
-    'Panelist Details',
-    'Attendee Details',
-    'Other Attended',
-)
-ZOOM_WEBINAR_DATETIME_FORMAT = '%b %d, %Y %I:%M %p'
-ZOOM_REGISTRATION_DATETIME_FORMAT = '%b %d, %Y %H:%M:%S'
-INTERNAL_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    return AttendeeReportImporter(cnx)
 
 
-def loadAttendeeReportsToDB(webinarId):
-    conn = None
+def parseAttendeeReportsInParallel(filenames, workers):
+    # Parsing and validation run in worker processes; the caller stays the only database writer.
+    # Every report comes back parsed whole, so memory grows with the reports, unlike the serial path.
+    pool = Pool(processes=workers)
     try:
-        conn = getConnection()
-        ai = AttendeeReportImporter(conn)
-        webinarDir = guessOrInputWebinarDirectoryName(webinarId)
-        for f in listdir(webinarDir):
-            fp = join(webinarDir, f)
-            if exists(fp) and f.startswith(webinarId+' - Attendee Report'):
-                _logger.info('Processing file: %s', fp)
-                ai.importAttendeeReport(fp)
-                _logger.info('Done')
+        # Spans recorded in the workers stay there; this one covers the whole parallel parse
+        with span('import.parse_parallel') as sp:
+            reports = pool.map(parseAttendeeReport, filenames, chunksize=1)
+            sp.addRows(sum(len(r.records) for r in reports))
     finally:
-        if conn:
-            conn.close()
+        pool.close()
+        pool.join()
 
+    reports.sort(key=getReportImportOrder)
+    return reports
 
-def guessOrInputWebinarDirectoryName(zoomWebinarId):
-    webinarDir = None
+
+def getImportWorkerCount():
+    workers = agni_configuration.getAgniImportWorkers()
+    if workers <= 0:
+        workers = cpu_count()
+    return workers
+
+
+def loadAttendeeReportsToDB(webinarId, forceReimport=False, webinarDir=None):
+    # Returns the number of attendee report files imported
+    conn = getConnection()
+    manifest = ImportManifest(conn)
+    if webinarDir is None:
+        webinarDir = guessOrInputWebinarDirectoryName(webinarId)
+    reportFiles = []
+    for f in listdir(webinarDir):
+        fp = join(webinarDir, f)
+        if exists(fp) and f.startswith(webinarId+' - Attendee Report'):
+            reportFiles.append(fp)
+
+    if forceReimport:
+        _logger.info('Re-importing all attendee report files')
+    with span('import.manifest', rows=len(reportFiles)):
+        reportFiles, replacedClasses = manifest.selectFilesToImport(reportFiles, forceReimport)
+        reportFiles = dict((rf.filepath, rf) for rf in reportFiles)
+    if not reportFiles:
+        return 0
+
+    ai = makeAttendeeReportImporter(conn)
+    workers = min(getImportWorkerCount(), len(reportFiles))
+    if workers > 1:
+        _logger.info('Parsing %s files with %s worker processes', len(reportFiles), workers)
+        reports = parseAttendeeReportsInParallel(sorted(reportFiles), workers)
+    else:
+        reports = sorted((AttendeeReportFile(fp) for fp in reportFiles), key=getReportImportOrder)
+
+    for report in reports:
+        _logger.info('Processing file: %s', report.filename)
+        with transaction(conn):
+            manifest.clearReplacedClasses(reportFiles[report.filename], replacedClasses)
+            ai.importParsedReport(report)
+            manifest.recordImport(reportFiles[report.filename], ai.currentWebinarId, ai.currentClassId)
+        _logger.info('Done')
+    return len(reportFiles)
+
+
+def findWebinarDirectory(zoomWebinarId):
+    # The first directory under the current one having the webinar id in its name, if any
     for f in listdir('.'):
         if isdir(f) and zoomWebinarId in f:
-            webinarDir = f
-            _logger.info("Found directory '%s'", webinarDir)
-            break
+            _logger.info("Found directory '%s'", f)
+            return f
+    return None
+
+
+def guessOrInputWebinarDirectoryName(zoomWebinarId):
+    webinarDir = findWebinarDirectory(zoomWebinarId)
 
     yn = 'N'
     if webinarDir:
@@ -0,0 +1,204 @@
+import hashlib
+from datetime import datetime
+from os import stat
+from os.path import abspath
+
+from agni.attendance_summary import invalidateAttendanceSummary
+from agni.db import transaction
+from agni.export_cache import bumpClassesDataVersion
+from utils.logger import getAgniLogger
+
+_logger = getAgniLogger(__name__)
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def getFileContentHash(filepath):
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as fd:
+        chunk = fd.read(HASH_CHUNK_SIZE)
+        while chunk:
+            h.update(chunk)
+            chunk = fd.read(HASH_CHUNK_SIZE)
+    return h.hexdigest()
+
+
+class ManifestEntry:
+    def __init__(self, row):
+        (self.id, self.contentHash, self.filePath, self.fileSize, self.fileMtime,
+         self.webinarId, self.webinarClassId) = row
+
+
+class ReportFile:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.manifestPath = abspath(filepath)
+        st = stat(filepath)
+        self.fileSize = st.st_size
+        self.fileMtime = st.st_mtime
+        self._contentHash = None
+
+    @property
+    def contentHash(self):
+        if self._contentHash is None:
+            self._contentHash = getFileContentHash(self.filepath)
+        return self._contentHash
+
+
+# Remembers which attendee report files were imported, so that unchanged files are not parsed again.
+# Files are matched by path with size and mtime first, and by content hash when those differ.
+class ImportManifest:
+
+    def __init__(self, cnx):
+        self._cnx = cnx
+
+    def _getEntry(self, query, params):
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            cur.execute(query, params)
+            row = cur.fetchone()
+            return ManifestEntry(row) if row else None
+        finally:
+            if cur:
+                cur.close()
+
+    def getEntryByPath(self, filePath):
+        mq = '''
+            SELECT id, content_hash, file_path, file_size, file_mtime, webinar_id, webinar_class_id
+            FROM import_manifest WHERE file_path = ?
+        '''
+        return self._getEntry(mq, (filePath,))
+
+    def getEntryByHash(self, contentHash):
+        mq = '''
+            SELECT id, content_hash, file_path, file_size, file_mtime, webinar_id, webinar_class_id
+            FROM import_manifest WHERE content_hash = ?
+        '''
+        return self._getEntry(mq, (contentHash,))
+
+    def _execute(self, query, params):
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            cur.execute(query, params)
+            return cur.rowcount
+        finally:
+            if cur:
+                cur.close()
+
+    def updateFileStat(self, entry, reportFile):
+        mupd = '''
+            UPDATE import_manifest SET file_size = ?, file_mtime = ? WHERE id = ?
+        '''
+        self._execute(mupd, (reportFile.fileSize, reportFile.fileMtime, entry.id))
+
+    def recordImport(self, reportFile, webinarId, webinarClassId):
+        mdel = '''
+            DELETE FROM import_manifest WHERE file_path = ?
+        '''
+        mins = '''
+            INSERT INTO import_manifest(
+                content_hash,
+                file_path,
+                file_size,
+                file_mtime,
+                webinar_id,
+                webinar_class_id,
+                imported_datetime
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            cur.execute(mdel, (reportFile.manifestPath,))
+            cur.execute(mins, (reportFile.contentHash, reportFile.manifestPath, reportFile.fileSize,
+                               reportFile.fileMtime, webinarId, webinarClassId,
+                               datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        finally:
+            if cur:
+                cur.close()
+
+    def clearClasses(self, webinarClassIds):
+        # A changed report replaces its class: drop the old attendance and every manifest entry of that class
+        adel = '''
+            DELETE FROM attendance WHERE webinar_class_id = ?
+        '''
+        mdel = '''
+            DELETE FROM import_manifest WHERE webinar_class_id = ?
+        '''
+        invalidateAttendanceSummary(self._cnx, webinarClassIds)
+        bumpClassesDataVersion(self._cnx, webinarClassIds)
+        cur = None
+        try:
+            cur = self._cnx.cursor()
+            for classId in webinarClassIds:
+                cur.execute(adel, (classId,))
+                _logger.info('Removed %s attendance records of webinar class %s', cur.rowcount, classId)
+                cur.execute(mdel, (classId,))
+        finally:
+            if cur:
+                cur.close()
+
+    def clearReplacedClasses(self, reportFile, replacedClasses):
+        # Called in the transaction importing reportFile. The first of the files re-imported for a class clears
+        # it, so a failed import leaves the class as it was.
+        classIds = [classId for classId, paths in replacedClasses.iteritems() if reportFile.filepath in paths]
+        if classIds:
+            self.clearClasses(classIds)
+            for classId in classIds:
+                del replacedClasses[classId]
+
+    def selectFilesToImport(self, filepaths, forceReimport=False):
+        # Returns the files to import, and {class id: paths} of the classes to clear when importing them
+        with transaction(self._cnx):
+            return self._selectFilesToImport(filepaths, forceReimport)
+
+    def _selectFilesToImport(self, filepaths, forceReimport):
+        reportFiles = [ReportFile(fp) for fp in filepaths]
+        entries = dict((rf.filepath, self.getEntryByPath(rf.manifestPath)) for rf in reportFiles)
+
+        toImport = []
+        unchanged = []
+        changedClassIds = set()
+        for rf in reportFiles:
+            entry = entries[rf.filepath]
+            if entry and not forceReimport and entry.fileSize == rf.fileSize and entry.fileMtime == rf.fileMtime:
+                unchanged.append(rf)
+                continue
+
+            if entry and entry.contentHash == rf.contentHash:
+                if forceReimport:
+                    toImport.append(rf)
+                else:
+                    # Touched but not changed
+                    self.updateFileStat(entry, rf)
+                    unchanged.append(rf)
+                continue
+
+            if entry is None and not forceReimport:
+                sameContent = self.getEntryByHash(rf.contentHash)
+                if sameContent:
+                    _logger.info('Skipping %s: same content as already imported %s', rf.filepath, sameContent.filePath)
+                    # Found by size and mtime from now on
+                    self.recordImport(rf, sameContent.webinarId, sameContent.webinarClassId)
+                    continue
+
+            if entry and entry.webinarClassId is not None:
+                _logger.info('File %s has changed since it was imported', rf.filepath)
+                changedClassIds.add(entry.webinarClassId)
+            toImport.append(rf)
+
+        replacedClasses = dict((classId, set()) for classId in changedClassIds)
+        if changedClassIds:
+            # Other reports of a replaced class have to be applied again as well
+            for rf in unchanged:
+                if entries[rf.filepath].webinarClassId in changedClassIds:
+                    toImport.append(rf)
+            for rf in toImport:
+                entry = entries[rf.filepath]
+                if entry and entry.webinarClassId in replacedClasses:
+                    replacedClasses[entry.webinarClassId].add(rf.filepath)
+
+        _logger.info('%s of %s attendee report files need to be imported', len(toImport), len(reportFiles))
+        return toImport, replacedClasses
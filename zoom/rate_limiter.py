@@ -0,0 +1,34 @@
+from threading import Lock
+from time import time, sleep
+
+
+class TokenBucket(object):
+    '''
+    Thread safe token bucket: allows bursts of up to `capacity` calls, refilled at `rate` calls per second.
+    '''
+    def __init__(self, rate, capacity):
+        self._rate = float(rate)
+        self._capacity = float(max(capacity, 1))
+        self._tokens = self._capacity
+        self._updated = time()
+        self._lock = Lock()
+
+    def acquire(self):
+        # Blocks until a token is available
+        while True:
+            with self._lock:
+                now = time()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            sleep(wait)
+
+
+def makeRateLimiter(ratePerSecond, burst):
+    # None, i.e. no limit, for a rate of 0
+    if ratePerSecond <= 0:
+        return None
+    return TokenBucket(ratePerSecond, burst)
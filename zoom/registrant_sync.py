@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import requests
+
+from agni.db import getConnection, transaction
+from agni.registrant_mirror import REGISTRANT_STATUS_APPROVED, getRegistrantSyncState, applyRegistrantPages
+from utils.configuration import agni_configuration
+from utils.logger import getAgniLogger
+from zoom.api import ZoomApi, ZoomApiError
+from zoom.report_parser import INTERNAL_DATETIME_FORMAT
+
+_logger = getAgniLogger(__name__)
+
+
+def getWebinarId(cnx, zoomWebinarId):
+    wq = '''
+        SELECT id FROM webinar WHERE zoom_webinar_id = ?
+    '''
+    cur = None
+    try:
+        cur = cnx.cursor()
+        cur.execute(wq, (zoomWebinarId,))
+        row = cur.fetchone()
+        return row[0] if row else None
+    finally:
+        if cur:
+            cur.close()
+
+
+def isSyncStateFresh(syncState, totalRecords, maxAgeHours):
+    if not syncState or syncState[0] != totalRecords:
+        return False
+    syncedAt = datetime.strptime(syncState[1], INTERNAL_DATETIME_FORMAT)
+    return datetime.now() - syncedAt < timedelta(hours=maxAgeHours)
+
+
+def syncWebinarRegistrants(zoomWebinarId, status=REGISTRANT_STATUS_APPROVED, zoomApi=None, force=False):
+    '''
+    Brings the zoom_registrant mirror of a webinar up to date. A one registrant probe tells how many
+    registrants Zoom has; while that matches the last sync, and the sync is younger than
+    registrant_sync_max_age_hours, nothing more is fetched. Returns the number of changed registrants.
+    '''
+    cnx = getConnection()
+    webinarId = getWebinarId(cnx, zoomWebinarId)
+    if webinarId is None:
+        _logger.error('Import attendee reports of webinar %s before syncing its registrants', zoomWebinarId)
+        return 0
+
+    za = zoomApi or ZoomApi()
+    try:
+        probe = za.getWebinarRegistrants(zoomWebinarId, status=status, page_size=1)
+        totalRecords = probe.get('total_records')
+        syncState = getRegistrantSyncState(cnx, webinarId, status)
+        if not force and isSyncStateFresh(syncState, totalRecords,
+                                          agni_configuration.getZoomRegistrantSyncMaxAgeHours()):
+            _logger.info('%s registrants of webinar %s are up to date (synced %s)', status, zoomWebinarId,
+                         syncState[1])
+            return 0
+
+        _logger.info('Syncing %s %s registrants of webinar %s', totalRecords, status, zoomWebinarId)
+        with transaction(cnx):
+            return applyRegistrantPages(cnx, webinarId, status,
+                                        za.iterWebinarRegistrantPages(zoomWebinarId, status=status), totalRecords)
+    finally:
+        if zoomApi is None:
+            za.close()
+
+
+def syncWebinarRegistrantsIfEnabled(zoomWebinarId):
+    # Export goes on with the registrants mirrored so far if Zoom cannot be reached
+    if not agni_configuration.getZoomSyncRegistrants():
+        return
+    try:
+        syncWebinarRegistrants(zoomWebinarId)
+    except (ZoomApiError, requests.RequestException):
+        _logger.exception('Could not sync registrants of webinar %s', zoomWebinarId)
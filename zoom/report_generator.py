@@ -0,0 +1,162 @@
+'''
+Writes synthetic Zoom attendee reports, one csv per class, laid out like the real ones.
+
+    python -m zoom.report_generator "Agni 1234567890" --registrants 5000 --classes 40
+'''
+import csv
+import random
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from os import makedirs
+from os.path import join, isdir
+
+from zoom.report_parser import ZOOM_WEBINAR_DATETIME_FORMAT, ZOOM_REGISTRATION_DATETIME_FORMAT, \
+    SECTION_ATTENDEE_REPORT, SECTION_HOST_DETAILS, SECTION_PANELIST_DETAILS, SECTION_ATTENDEE_DETAILS, \
+    SECTION_OTHER_ATTENDED
+
+DEFAULT_ZOOM_WEBINAR_ID = '123-456-7890'
+DEFAULT_TOPIC = 'Agni GCR Course'
+FIRST_CLASS_DATETIME = datetime(2020, 5, 1, 18, 55)
+
+TOPIC_HEADER = ['Topic', 'Webinar ID', 'Actual Start Time', 'Actual Duration (minutes)', '# Registered',
+                '# Cancelled registrants', 'Unique Viewers', 'Total Users', 'Max Concurrent Views']
+HOST_HEADER = ['Attended', 'User Name (Original Name)', 'Email', 'Join Time', 'Leave Time', 'Time in Session (minutes)',
+               'Country/Region Name']
+ATTENDEE_HEADER = ['Attended', 'User Name (Original Name)', 'First Name', 'Last Name', 'Email', 'City', 'Country/Region',
+                   'Phone', 'Registration Time', 'Approval Status', 'Join Time', 'Leave Time',
+                   'Time in Session (minutes)', 'Country/Region Name']
+
+
+class ReportGeneratorOptions(object):
+    def __init__(self, registrants=1000, classes=10, attendanceRate=0.6, presentRate=0.85, duplicateRate=0.1,
+                 mergeRate=0.5, lateRegistrationRate=0.1, zoomWebinarId=DEFAULT_ZOOM_WEBINAR_ID, topic=DEFAULT_TOPIC,
+                 seed=1):
+        self.registrants = registrants
+        self.classes = classes
+        # Chance that a registrant listed in a report attended ('Yes') rather than not ('No')
+        self.attendanceRate = attendanceRate
+        # Chance that a registrant is listed in a report at all
+        self.presentRate = presentRate
+        # Chance of an extra row for the same registrant, as when somebody joins more than once
+        self.duplicateRate = duplicateRate
+        # Chance that the extra row has to be merged: the first row says 'No' and shows a later registration
+        # time, so the import must keep 'Yes' and the earliest time
+        self.mergeRate = mergeRate
+        # Chance that a registrant registered after the first class
+        self.lateRegistrationRate = lateRegistrationRate
+        self.zoomWebinarId = zoomWebinarId
+        self.topic = topic
+        self.seed = seed
+
+
+def getReportFileName(zoomWebinarId, classIndex):
+    return '%s - Attendee Report %04d.csv' % (zoomWebinarId.replace('-', ''), classIndex + 1)
+
+
+def _makeRegistrants(opts, rnd):
+    registrants = []
+    for i in xrange(opts.registrants):
+        if rnd.random() < opts.lateRegistrationRate:
+            registered = FIRST_CLASS_DATETIME + timedelta(seconds=rnd.randint(0, 86400 * max(opts.classes, 1)))
+        else:
+            registered = FIRST_CLASS_DATETIME - timedelta(seconds=rnd.randint(3600, 86400 * 30))
+        registrants.append(('registrant%06d@example.com' % i, 'First%06d' % i, 'Last%06d' % i, registered))
+    return registrants
+
+
+def writeAttendeeReport(fd, opts, classIndex, registrants, rnd):
+    classDatetime = FIRST_CLASS_DATETIME + timedelta(days=classIndex)
+    classDateStr = classDatetime.strftime(ZOOM_WEBINAR_DATETIME_FORMAT)
+    joinStr = classDatetime.strftime(ZOOM_REGISTRATION_DATETIME_FORMAT)
+    leaveStr = (classDatetime + timedelta(minutes=70)).strftime(ZOOM_REGISTRATION_DATETIME_FORMAT)
+
+    w = csv.writer(fd)
+    w.writerow([SECTION_ATTENDEE_REPORT])
+    w.writerow(['Report Generated:', classDateStr])
+    w.writerow(TOPIC_HEADER)
+    w.writerow([opts.topic, opts.zoomWebinarId, classDateStr, 70, len(registrants), 0, 0, 0, 0])
+    w.writerow([SECTION_HOST_DETAILS])
+    w.writerow(HOST_HEADER)
+    w.writerow(['Yes', 'Host', 'host@example.com', joinStr, leaveStr, 70, 'India'])
+    w.writerow([SECTION_PANELIST_DETAILS])
+    w.writerow(HOST_HEADER)
+    w.writerow([SECTION_ATTENDEE_DETAILS])
+    w.writerow(ATTENDEE_HEADER)
+    rows = 0
+    for email, firstName, lastName, registered in registrants:
+        if registered > classDatetime or rnd.random() >= opts.presentRate:
+            continue
+        attended = 'Yes' if rnd.random() < opts.attendanceRate else 'No'
+        registeredStr = registered.strftime(ZOOM_REGISTRATION_DATETIME_FORMAT)
+        cells = [(attended, registeredStr)]
+        if rnd.random() < opts.duplicateRate:
+            if rnd.random() < opts.mergeRate and registered < classDatetime:
+                # Still before the class, like every registration time listed in its report
+                secondsBefore = int((classDatetime - registered).total_seconds())
+                later = registered + timedelta(seconds=rnd.randint(1, secondsBefore))
+                cells.insert(0, ('No', later.strftime(ZOOM_REGISTRATION_DATETIME_FORMAT)))
+            else:
+                cells.append(cells[0])
+        for rowAttended, rowRegisteredStr in cells:
+            inSession = rnd.randint(1, 70) if rowAttended == 'Yes' else ''
+            w.writerow([rowAttended, '%s %s' % (firstName, lastName), firstName, lastName, email, 'Chennai', 'India',
+                        '', rowRegisteredStr, 'approved', joinStr if inSession else '--',
+                        leaveStr if inSession else '--', inSession, 'India'])
+            rows += 1
+    w.writerow([SECTION_OTHER_ATTENDED])
+    w.writerow(['Attended', 'User Name (Original Name)', 'Join Time', 'Leave Time', 'Time in Session (minutes)'])
+    return rows
+
+
+def generateAttendeeReports(outputDir, opts):
+    # Returns the paths of the reports written
+    if not isdir(outputDir):
+        makedirs(outputDir)
+    rnd = random.Random(opts.seed)
+    registrants = _makeRegistrants(opts, rnd)
+    paths = []
+    for classIndex in xrange(opts.classes):
+        path = join(outputDir, getReportFileName(opts.zoomWebinarId, classIndex))
+        with open(path, 'wb') as fd:
+            writeAttendeeReport(fd, opts, classIndex, registrants, rnd)
+        paths.append(path)
+    return paths
+
+
+def addGeneratorArguments(parser):
+    parser.add_argument('--registrants', type=int, default=1000)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--attendance-rate', type=float, default=0.6, help='chance a listed registrant attended')
+    parser.add_argument('--present-rate', type=float, default=0.85, help='chance a registrant is listed in a report')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help='chance of a repeated row per registrant')
+    parser.add_argument('--merge-rate', type=float, default=0.5,
+                        help="chance a repeated row follows a 'No' row with a later registration time")
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def makeGeneratorOptions(args, registrants=None, classes=None):
+    return ReportGeneratorOptions(
+        registrants=registrants if registrants is not None else args.registrants,
+        classes=classes if classes is not None else args.classes,
+        attendanceRate=args.attendance_rate,
+        presentRate=args.present_rate,
+        duplicateRate=args.duplicate_rate,
+        mergeRate=args.merge_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = ArgumentParser(description='Writes synthetic Zoom attendee reports')
+    parser.add_argument('output_dir')
+    parser.add_argument('--webinar-id', default=DEFAULT_ZOOM_WEBINAR_ID)
+    addGeneratorArguments(parser)
+    args = parser.parse_args()
+
+    opts = makeGeneratorOptions(args)
+    opts.zoomWebinarId = args.webinar_id
+    paths = generateAttendeeReports(args.output_dir, opts)
+    print 'Wrote %s attendee reports to %s' % (len(paths), args.output_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import csv
+from datetime import datetime
+from time import time
+
+from utils.common import sanitizeEmail
+from utils.logger import getAgniLogger
+from zoom.common import sanitizeWebinarId
+
+_logger = getAgniLogger(__name__)
+
+SECTION_ATTENDEE_REPORT = 'Attendee Report'
+SECTION_TOPIC = 'Topic'
+SECTION_HOST_DETAILS = 'Host Details'
+SECTION_PANELIST_DETAILS = 'Panelist Details'
+SECTION_ATTENDEE_DETAILS = 'Attendee Details'
+SECTION_OTHER_ATTENDED = 'Other Attended'
+
+SECTION_NAMES = (
+    SECTION_ATTENDEE_REPORT,
+    SECTION_TOPIC,
+    SECTION_HOST_DETAILS,
+    SECTION_PANELIST_DETAILS,
+    SECTION_ATTENDEE_DETAILS,
+    SECTION_OTHER_ATTENDED,
+)
+ZOOM_WEBINAR_DATETIME_FORMAT = '%b %d, %Y %I:%M %p'
+ZOOM_REGISTRATION_DATETIME_FORMAT = '%b %d, %Y %H:%M:%S'
+INTERNAL_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# No section name is a prefix of another, so a cell belongs to at most one section.
+# Looking up its prefixes of these lengths gives the same answer as startswith() on every name.
+_SECTION_BY_NAME = dict((s, s) for s in SECTION_NAMES)
+_SECTION_NAME_LENGTHS = tuple(sorted(set(len(s) for s in SECTION_NAMES)))
+_SECTION_INITIALS = frozenset(s[0] for s in SECTION_NAMES)
+
+
+def findSection(cell):
+    if cell[:1] not in _SECTION_INITIALS:
+        return None
+    for n in _SECTION_NAME_LENGTHS:
+        section = _SECTION_BY_NAME.get(cell[:n])
+        if section is not None:
+            return section
+    return None
+
+
+class Record(object):
+    __slots__ = ('lineNumber',)
+
+    # __slots__ objects need these to be pickled to and from the import worker processes
+    def __getstate__(self):
+        return tuple(getattr(self, a) for a in self._allSlots())
+
+    def __setstate__(self, state):
+        for a, v in zip(self._allSlots(), state):
+            setattr(self, a, v)
+
+    @classmethod
+    def _allSlots(cls):
+        slots = []
+        for c in reversed(cls.__mro__):
+            slots.extend(c.__dict__.get('__slots__', ()))
+        return slots
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%s=%r' % (a, getattr(self, a)) for a in self._allSlots()))
+
+
+class TopicRecord(Record):
+    __slots__ = ('topic', 'zoomWebinarId')
+
+    def __init__(self, topic, zoomWebinarId, lineNumber):
+        self.topic = topic
+        self.zoomWebinarId = zoomWebinarId
+        self.lineNumber = lineNumber
+
+
+class ClassDateRecord(Record):
+    __slots__ = ('originalClassDateStr', 'internalClassDateStr')
+
+    def __init__(self, originalClassDateStr, internalClassDateStr, lineNumber):
+        self.originalClassDateStr = originalClassDateStr
+        self.internalClassDateStr = internalClassDateStr
+        self.lineNumber = lineNumber
+
+
+class AttendeeRecord(Record):
+    __slots__ = ('attended', 'email', 'internalRegistrationDateStr', 'originalRegistrationDateStr')
+
+    def __init__(self, attended, email, internalRegistrationDateStr, originalRegistrationDateStr, lineNumber):
+        self.attended = attended
+        self.email = email
+        self.internalRegistrationDateStr = internalRegistrationDateStr
+        self.originalRegistrationDateStr = originalRegistrationDateStr
+        self.lineNumber = lineNumber
+
+
+# Distinct registration times kept parsed at a time. The repeats of a time are the rows of one
+# registrant, which are close together, so a small cache keeps memory flat however long the report.
+REGISTRATION_DATETIME_CACHE_SIZE = 10000
+
+
+def iterAttendeeReportRecords(fd):
+    # Yields a TopicRecord and a ClassDateRecord for the topic row, then an AttendeeRecord per attendee row
+    rdr = csv.reader(fd, skipinitialspace=True)
+    curSection = None
+    emailColIndex = None
+    regDateColIndex = None
+    # Registration times repeat when somebody joins more than once; parse each distinct value once
+    internalRegDates = {}
+    line = None
+    try:
+        for line in rdr:
+            if not line:
+                continue
+            firstCell = line[0].strip()
+            section = findSection(firstCell)
+            if section is not None:
+                _logger.debug('At line %s: Got section %s', rdr.line_num, section)
+                curSection = section
+
+            if curSection is SECTION_ATTENDEE_DETAILS:
+                if firstCell.startswith('Attendee Details') or firstCell.startswith('Attended'):
+                    if firstCell.startswith('Attended'):
+                        # Configure columns
+                        header = [c.strip() for c in line]
+                        emailColIndex = header.index('Email')
+                        regDateColIndex = header.index('Registration Time')
+                    continue
+
+                if not firstCell:
+                    continue
+
+                email = sanitizeEmail(line[emailColIndex])
+
+                registeredDateStr = line[regDateColIndex].strip()
+                if registeredDateStr:
+                    internalRegisteredDateStr = internalRegDates.get(registeredDateStr)
+                    if internalRegisteredDateStr is None:
+                        registeredDate = datetime.strptime(registeredDateStr, ZOOM_REGISTRATION_DATETIME_FORMAT)
+                        internalRegisteredDateStr = registeredDate.strftime(INTERNAL_DATETIME_FORMAT)
+                        if len(internalRegDates) >= REGISTRATION_DATETIME_CACHE_SIZE:
+                            internalRegDates.clear()
+                        internalRegDates[registeredDateStr] = internalRegisteredDateStr
+                else:
+                    internalRegisteredDateStr = None
+
+                yield AttendeeRecord(firstCell, email, internalRegisteredDateStr, registeredDateStr, rdr.line_num)
+
+            elif curSection is SECTION_TOPIC:
+                if firstCell.startswith('Topic') or not firstCell:
+                    continue
+
+                zoomWebinarId = sanitizeWebinarId(line[1])
+                originalClassDateStr = line[2].strip()
+                classDate = datetime.strptime(originalClassDateStr, ZOOM_WEBINAR_DATETIME_FORMAT)
+
+                yield TopicRecord(firstCell, zoomWebinarId, rdr.line_num)
+                yield ClassDateRecord(originalClassDateStr, classDate.strftime(INTERNAL_DATETIME_FORMAT), rdr.line_num)
+    except Exception:
+        _logger.exception('**** Error in file %s at line %s: %s', getattr(fd, 'name', fd), rdr.line_num, line)
+        raise
+
+
+def main():
+    import sys
+    if len(sys.argv) < 2:
+        print 'Usage: python -m zoom.report_parser <attendee report csv>...'
+        return
+
+    totalRecords = 0
+    startTime = time()
+    for filename in sys.argv[1:]:
+        with open(filename, 'rt') as fd:
+            for _ in iterAttendeeReportRecords(fd):
+                totalRecords += 1
+    elapsed = time() - startTime
+    print '%s records from %s files in %.3f sec (%.1f records/sec)' % (
+        totalRecords, len(sys.argv) - 1, elapsed, totalRecords / elapsed if elapsed > 0 else 0.0)
+
+if __name__ == '__main__':
+    main()
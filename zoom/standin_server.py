@@ -0,0 +1,251 @@
+'''
+Local stand-in for the Zoom API endpoints used by ZoomApi: the webinar registrant list and the
+registrant status update. Point [zoom] api_base_url at it to exercise ZoomApi without Zoom.
+
+    python -m zoom.standin_server --port 8088 --registrants 5000 --latency 0.05 --rate-429 0.02
+
+and set api_base_url = http://127.0.0.1:8088/v2/ in agni-gcr.ini.
+'''
+import json
+import random
+import re
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Lock, Thread
+from time import sleep
+from urlparse import urlparse, parse_qs
+
+from zoom.api import MAX_REGISTRANTS_PER_CALL, ACTION_ALLOW, ACTION_CANCEL, ACTION_DENY
+
+MAX_PAGE_SIZE = 300
+
+STATUS_FOR_ACTION = {
+    ACTION_ALLOW: 'approved',
+    ACTION_CANCEL: 'cancelled',
+    ACTION_DENY: 'denied',
+}
+
+PATH_REGISTRANTS = re.compile(r'^(?:/v2)?/webinars/(\d+)/registrants/?$')
+PATH_REGISTRANTS_STATUS = re.compile(r'^(?:/v2)?/webinars/(\d+)/registrants/status/?$')
+
+
+class StandInStats(object):
+    def __init__(self):
+        self._lock = Lock()
+        self.requests = 0
+        self.injected429 = 0
+        self.injected5xx = 0
+        self.rejected = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, n in counts.iteritems():
+                setattr(self, name, getattr(self, name) + n)
+
+    def asDict(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'injected429': self.injected429,
+                'injected5xx': self.injected5xx,
+                'rejected': self.rejected,
+            }
+
+
+class StandInWebinars(object):
+    # Registrants of every webinar asked for, made up on first use: email -> registrant
+    def __init__(self, registrantsPerWebinar):
+        self._registrantsPerWebinar = registrantsPerWebinar
+        self._webinars = {}
+        self._lock = Lock()
+
+    def _getRegistrants(self, zoomWebinarId):
+        registrants = self._webinars.get(zoomWebinarId)
+        if registrants is None:
+            registrants = []
+            for i in xrange(self._registrantsPerWebinar):
+                registrants.append({
+                    'id': '%s-%06d' % (zoomWebinarId, i),
+                    'email': 'registrant%06d@example.com' % i,
+                    'first_name': 'Registrant',
+                    'last_name': '%06d' % i,
+                    'status': 'approved',
+                    'create_time': '2020-04-%02dT10:00:00Z' % (1 + i % 28),
+                })
+            self._webinars[zoomWebinarId] = registrants
+        return registrants
+
+    def listRegistrants(self, zoomWebinarId, status):
+        with self._lock:
+            return [r for r in self._getRegistrants(zoomWebinarId) if r['status'] == status]
+
+    def updateStatus(self, zoomWebinarId, action, emails):
+        newStatus = STATUS_FOR_ACTION[action]
+        emails = set(e.lower() for e in emails)
+        with self._lock:
+            for r in self._getRegistrants(zoomWebinarId):
+                if not emails or r['email'] in emails:
+                    r['status'] = newStatus
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sendJson(self, code, obj=None, headers=()):
+        body = json.dumps(obj) if obj is not None else ''
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        if obj is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _injectFault(self):
+        # True if a fault response was sent instead of the real one
+        server = self.server
+        server.stats.add(requests=1)
+        if server.latency:
+            sleep(server.latency)
+        r = server.random()
+        if r < server.rate429:
+            server.stats.add(injected429=1)
+            self._sendJson(429, {'code': 429, 'message': 'Too many requests'},
+                           headers=(('Retry-After', str(server.retryAfter)),))
+            return True
+        if r < server.rate429 + server.rate5xx:
+            server.stats.add(injected5xx=1)
+            self._sendJson(503, {'code': 503, 'message': 'Service unavailable'})
+            return True
+        return False
+
+    def _reject(self, code, message):
+        self.server.stats.add(rejected=1)
+        self._sendJson(code, {'code': code, 'message': message})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        m = PATH_REGISTRANTS.match(url.path)
+        if not m:
+            self._reject(404, 'Not found')
+            return
+        if self._injectFault():
+            return
+
+        query = parse_qs(url.query)
+        status = query.get('status', ['approved'])[0]
+        pageSize = min(int(query.get('page_size', [30])[0]), MAX_PAGE_SIZE)
+        # The token is just the offset of the next page
+        start = int(query.get('next_page_token', ['0'])[0] or 0)
+        registrants = self.server.webinars.listRegistrants(m.group(1), status)
+        total = len(registrants)
+        end = start + pageSize
+        self._sendJson(200, {
+            'page_count': (total + pageSize - 1) // pageSize,
+            'page_size': pageSize,
+            'total_records': total,
+            'next_page_token': str(end) if end < total else '',
+            'registrants': registrants[start:end],
+        })
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        m = PATH_REGISTRANTS_STATUS.match(url.path)
+        if not m:
+            self._reject(404, 'Not found')
+            return
+        if self._injectFault():
+            return
+
+        try:
+            request = json.loads(body or '{}')
+        except ValueError:
+            self._reject(400, 'Invalid request body')
+            return
+        action = request.get('action')
+        registrants = request.get('registrants') or []
+        if action not in STATUS_FOR_ACTION:
+            self._reject(400, 'Invalid action: %s' % action)
+            return
+        if len(registrants) > MAX_REGISTRANTS_PER_CALL:
+            self._reject(400, 'At most %s registrants per call' % MAX_REGISTRANTS_PER_CALL)
+            return
+        self.server.webinars.updateStatus(m.group(1), action, [r.get('email', '') for r in registrants])
+        self._sendJson(204)
+
+
+class ZoomStandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, registrantsPerWebinar=1000, latency=0.0, rate429=0.0, rate5xx=0.0, retryAfter=1,
+                 seed=None):
+        HTTPServer.__init__(self, ('127.0.0.1', port), StandInRequestHandler)
+        self.webinars = StandInWebinars(registrantsPerWebinar)
+        self.stats = StandInStats()
+        self.latency = latency
+        self.rate429 = rate429
+        self.rate5xx = rate5xx
+        self.retryAfter = retryAfter
+        self._random = random.Random(seed)
+        self._randomLock = Lock()
+        self._thread = None
+
+    def random(self):
+        with self._randomLock:
+            return self._random.random()
+
+    @property
+    def baseUrl(self):
+        return 'http://127.0.0.1:%s/v2/' % self.server_address[1]
+
+    def start(self):
+        # Serves from a background thread
+        self._thread = Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def addStandInArguments(parser):
+    parser.add_argument('--registrants', type=int, default=1000, help='registrants per webinar')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the fault injection')
+
+
+def makeStandInServer(args, port=0):
+    return ZoomStandInServer(port=port, registrantsPerWebinar=args.registrants, latency=args.latency,
+                             rate429=args.rate_429, rate5xx=args.rate_5xx, retryAfter=args.retry_after,
+                             seed=args.seed)
+
+
+def main():
+    parser = ArgumentParser(description='Local stand-in for the Zoom API')
+    parser.add_argument('--port', type=int, default=8088)
+    addStandInArguments(parser)
+    args = parser.parse_args()
+
+    server = makeStandInServer(args, port=args.port)
+    print 'Zoom API stand-in listening. Set api_base_url = %s' % server.baseUrl
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print 'Stats:', server.stats.asDict()
+
+if __name__ == '__main__':
+    main()